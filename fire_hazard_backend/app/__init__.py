@@ -16,12 +16,137 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL")
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Opt-in write-behind queue for single-reading sensor posts
+    app.config['SENSOR_WRITE_BEHIND'] = os.getenv("SENSOR_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+    app.config['SENSOR_WRITE_BEHIND_MAX_SIZE'] = int(os.getenv("SENSOR_WRITE_BEHIND_MAX_SIZE", 10000))
+    app.config['SENSOR_WRITE_BEHIND_FLUSH_ROWS'] = int(os.getenv("SENSOR_WRITE_BEHIND_FLUSH_ROWS", 200))
+    app.config['SENSOR_WRITE_BEHIND_FLUSH_INTERVAL'] = float(os.getenv("SENSOR_WRITE_BEHIND_FLUSH_INTERVAL", 0.25))
+
+    # Keep sensor_rollup up to date on ingest; turn off to maintain it with `flask rollups rebuild` instead
+    app.config['SENSOR_ROLLUPS'] = os.getenv("SENSOR_ROLLUPS", "true").lower() in ("1", "true", "yes")
+
+    # Readings older than ARCHIVE_AFTER_DAYS move to columnar files with `flask archive run`
+    app.config['ARCHIVE_ROOT'] = os.getenv("ARCHIVE_ROOT", "archive")
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+
+    # Hazard state (thresholds, device windows, camera registry): "memory" for a single
+    # process, "sqlite" to share it between worker processes on one host
+    app.config['HAZARD_STATE_BACKEND'] = os.getenv("HAZARD_STATE_BACKEND", "memory")
+    app.config['HAZARD_STATE_PATH'] = os.getenv("HAZARD_STATE_PATH", "hazard_state.db")
+    app.config['DEVICE_IDLE_TTL'] = float(os.getenv("DEVICE_IDLE_TTL", 3600))
+    # Comma separated hazard rules to evaluate, empty for all of them
+    app.config['HAZARD_RULES'] = [name.strip() for name in os.getenv("HAZARD_RULES", "").split(",") if name.strip()]
+
+    # Live feed on /api/stream. Run gunicorn with an async worker (-k gevent) to hold many open streams
+    app.config['STREAM_QUEUE_SIZE'] = int(os.getenv("STREAM_QUEUE_SIZE", 100))
+    app.config['STREAM_MAX_SUBSCRIBERS'] = int(os.getenv("STREAM_MAX_SUBSCRIBERS", 10000))
+    app.config['STREAM_POLL_INTERVAL'] = float(os.getenv("STREAM_POLL_INTERVAL", 0.5))
+    app.config['STREAM_KEEPALIVE'] = float(os.getenv("STREAM_KEEPALIVE", 15))
+
+    # Binary telemetry listener started with `flask telemetry serve`. Record device
+    # indexes map to device ids through TELEMETRY_DEVICE_ID_FORMAT
+    app.config['TELEMETRY_HOST'] = os.getenv("TELEMETRY_HOST", "0.0.0.0")
+    app.config['TELEMETRY_PORT'] = int(os.getenv("TELEMETRY_PORT", 5001))
+    app.config['TELEMETRY_DEVICE_ID_FORMAT'] = os.getenv("TELEMETRY_DEVICE_ID_FORMAT", "sensor_device_{}")
+    app.config['TELEMETRY_FLUSH_ROWS'] = int(os.getenv("TELEMETRY_FLUSH_ROWS", 5000))
+    app.config['TELEMETRY_FLUSH_INTERVAL'] = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", 0.5))
+
+    # Image blob storage
+    app.config['BLOB_STORE_BACKEND'] = os.getenv("BLOB_STORE_BACKEND", "local")
+    app.config['BLOB_STORE_ROOT'] = os.getenv("BLOB_STORE_ROOT", "static/blobs")
+    app.config['IMAGE_MAX_BYTES'] = int(os.getenv("IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+    app.config['IMAGE_BURST_MAX_FRAMES'] = int(os.getenv("IMAGE_BURST_MAX_FRAMES", 10))
+    app.config['IMAGE_CACHE_MAX_AGE'] = int(os.getenv("IMAGE_CACHE_MAX_AGE", 365 * 24 * 3600))
+    app.config['THUMBNAIL_CACHE_DIR'] = os.getenv("THUMBNAIL_CACHE_DIR", "static/thumbnails")
+    app.config['THUMBNAIL_CACHE_MAX_BYTES'] = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    app.config['THUMBNAIL_WIDTHS'] = [int(w) for w in os.getenv("THUMBNAIL_WIDTHS", "160,320,640").split(",")]
+    app.config['THUMBNAIL_WORKERS'] = int(os.getenv("THUMBNAIL_WORKERS", 2))
+    app.config['THUMBNAIL_TIMEOUT'] = float(os.getenv("THUMBNAIL_TIMEOUT", 5))
+    # Let a fronting nginx/Apache serve image files itself
+    app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE", "false").lower() in ("1", "true", "yes")
+
+    # Camera control client
+    app.config['CAMERA_CONNECT_TIMEOUT'] = float(os.getenv("CAMERA_CONNECT_TIMEOUT", 2.0))
+    app.config['CAMERA_READ_TIMEOUT'] = float(os.getenv("CAMERA_READ_TIMEOUT", 5.0))
+    app.config['CAMERA_POOL_SIZE'] = int(os.getenv("CAMERA_POOL_SIZE", 10))
+    app.config['CAMERA_BREAKER_FAILURES'] = int(os.getenv("CAMERA_BREAKER_FAILURES", 3))
+    app.config['CAMERA_BREAKER_RESET'] = float(os.getenv("CAMERA_BREAKER_RESET", 30))
+
+    # Background camera triggering for hazard events
+    app.config['DEFAULT_CAMERA_DEVICE_ID'] = os.getenv("DEFAULT_CAMERA_DEVICE_ID", "camera_device_1")
+    app.config['CAMERA_TRIGGER_WORKERS'] = int(os.getenv("CAMERA_TRIGGER_WORKERS", 4))
+    app.config['CAMERA_TRIGGER_ATTEMPTS'] = int(os.getenv("CAMERA_TRIGGER_ATTEMPTS", 3))
+    app.config['CAMERA_TRIGGER_BACKOFF'] = float(os.getenv("CAMERA_TRIGGER_BACKOFF", 0.5))
+    app.config['CAMERA_TRIGGER_DEDUPE_WINDOW'] = float(os.getenv("CAMERA_TRIGGER_DEDUPE_WINDOW", 30))
+
     db.init_app(app)
     migrate.init_app(app, db)
 
     from app.routes import sensor_routes
     from app.routes import cam_routes
+    from app.routes import stream_routes
     app.register_blueprint(sensor_routes.sensor_bp)
     app.register_blueprint(cam_routes.cam_bp)
+    app.register_blueprint(stream_routes.stream_bp)
+
+    from app.hazard_state import create_state_backend
+    app.extensions['hazard_state'] = create_state_backend(app)
+
+    from app.live_feed import LiveFeed
+    app.extensions['live_feed'] = LiveFeed(
+        app,
+        app.extensions['hazard_state'],
+        queue_size=app.config['STREAM_QUEUE_SIZE'],
+        max_subscribers=app.config['STREAM_MAX_SUBSCRIBERS'],
+        poll_interval=app.config['STREAM_POLL_INTERVAL']
+    )
+
+    from app.hazard_rules import HazardEngine
+    app.extensions['hazard_engine'] = HazardEngine(app.config['HAZARD_RULES'])
+
+    from app.archive import create_sensor_archive
+    app.extensions['sensor_archive'] = create_sensor_archive(app)
+
+    from app.blob_store import create_blob_store
+    app.extensions['blob_store'] = create_blob_store(app)
+
+    from app.thumbnails import ThumbnailCache
+    app.extensions['thumbnails'] = ThumbnailCache(
+        app,
+        app.config['THUMBNAIL_CACHE_DIR'],
+        max_bytes=app.config['THUMBNAIL_CACHE_MAX_BYTES'],
+        widths=app.config['THUMBNAIL_WIDTHS'],
+        workers=app.config['THUMBNAIL_WORKERS']
+    )
+
+    from app.commands import register_commands
+    register_commands(app)
+
+    from app.camera_client import CameraClient
+    app.extensions['camera_client'] = CameraClient(
+        connect_timeout=app.config['CAMERA_CONNECT_TIMEOUT'],
+        read_timeout=app.config['CAMERA_READ_TIMEOUT'],
+        pool_size=app.config['CAMERA_POOL_SIZE'],
+        failure_threshold=app.config['CAMERA_BREAKER_FAILURES'],
+        reset_timeout=app.config['CAMERA_BREAKER_RESET']
+    )
+
+    from app.camera_dispatcher import CameraDispatcher
+    app.extensions['camera_dispatcher'] = CameraDispatcher(
+        app,
+        max_workers=app.config['CAMERA_TRIGGER_WORKERS'],
+        max_attempts=app.config['CAMERA_TRIGGER_ATTEMPTS'],
+        backoff=app.config['CAMERA_TRIGGER_BACKOFF'],
+        dedupe_window=app.config['CAMERA_TRIGGER_DEDUPE_WINDOW']
+    )
+
+    if app.config['SENSOR_WRITE_BEHIND']:
+        from app.write_behind import WriteBehindBuffer
+        app.extensions['sensor_write_behind'] = WriteBehindBuffer(
+            app,
+            max_size=app.config['SENSOR_WRITE_BEHIND_MAX_SIZE'],
+            flush_rows=app.config['SENSOR_WRITE_BEHIND_FLUSH_ROWS'],
+            flush_interval=app.config['SENSOR_WRITE_BEHIND_FLUSH_INTERVAL']
+        )
 
     return app
\ No newline at end of file
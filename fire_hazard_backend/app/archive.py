@@ -0,0 +1,339 @@
+from app import db
+from app.models import SensorData, ImageData
+from collections import defaultdict, namedtuple
+from urllib.parse import quote, unquote
+import datetime
+import json
+import math
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# One .npy file per column. ts is microseconds since the epoch, naive UTC like date_created.
+ARCHIVE_COLUMNS = ("id", "ts", "temperature", "humidity", "pressure")
+
+COLUMN_DTYPES = {
+    "id": np.int64,
+    "ts": np.int64,
+    "temperature": np.float64,
+    "humidity": np.float64,
+    "pressure": np.float64
+}
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+ArchivedReading = namedtuple("ArchivedReading", "id device_id temperature humidity pressure date_created")
+
+
+def to_micros(date_created):
+    return (date_created - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_micros(ts):
+    """Datetimes for an array of archive timestamps."""
+    return np.asarray(ts).astype("datetime64[us]").tolist()
+
+
+class SensorArchive:
+    """Cold sensor readings stored as columnar NumPy files.
+
+    Layout is ``root/<device>/<YYYY-MM-DD>/run-<n>/<column>.npy``. Each archive run
+    writes new, never modified run directories and then lists itself in manifest.json.
+    Readers only look at runs listed there, so a run that dies part way leaves
+    nothing visible. The manifest also holds the archive boundary: every reading
+    older than ``before`` with an id up to ``max_id`` is served from here, whether or
+    not its sensor_data row has been deleted yet.
+
+    Files are uncompressed so they can be memory-mapped. A scan only touches the
+    pages of the columns and days it asks for.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def manifest(self):
+        try:
+            with open(os.path.join(self.root, self.MANIFEST)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {"before": None, "max_id": None, "runs": []}
+
+        manifest["before"] = datetime.datetime.fromisoformat(manifest["before"])
+        return manifest
+
+    def _write_manifest(self, before, max_id, runs):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump({"before": before.isoformat(), "max_id": max_id, "runs": runs}, tmp_file)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, os.path.join(self.root, self.MANIFEST))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def hot_condition(self, manifest=None):
+        """SQL condition for sensor_data rows that are not served from the archive, or None."""
+        manifest = manifest or self.manifest()
+        if manifest["before"] is None:
+            return None
+        return db.not_(db.and_(SensorData.date_created < manifest["before"], SensorData.id <= manifest["max_id"]))
+
+    # Layout
+
+    def _device_dir(self, device_id):
+        # Device ids are free-form; percent-encode them, dots included, so any id is one safe path component
+        return os.path.join(self.root, quote(device_id, safe="").replace(".", "%2E"))
+
+    def devices(self):
+        return sorted(
+            unquote(name) for name in os.listdir(self.root)
+            if not name.startswith(".") and os.path.isdir(os.path.join(self.root, name))
+        )
+
+    def days(self, device_id, start=None, end=None):
+        """Archived days for a device that overlap [start, end)."""
+        try:
+            names = os.listdir(self._device_dir(device_id))
+        except FileNotFoundError:
+            return []
+
+        days = sorted(datetime.date.fromisoformat(name) for name in names if not name.startswith("."))
+        if start is not None:
+            days = [day for day in days if day >= start.date()]
+        if end is not None:
+            days = [day for day in days if day <= (end - datetime.timedelta(microseconds=1)).date()]
+        return days
+
+    def _runs(self, device_id, day, runs):
+        day_dir = os.path.join(self._device_dir(device_id), day.isoformat())
+        return [
+            os.path.join(day_dir, name) for name in sorted(os.listdir(day_dir))
+            if name.startswith("run-") and int(name[4:]) in runs
+        ]
+
+    # Reading
+
+    def read(self, device_id, day, columns=ARCHIVE_COLUMNS, runs=None, start=None, end=None):
+        """Columns for one device and day sorted by (ts, id), as read-only arrays.
+
+        With a single run the arrays are memory maps of the files themselves.
+        """
+        runs = set(self.manifest()["runs"]) if runs is None else runs
+        wanted = list(dict.fromkeys(("ts", "id") + tuple(columns)))
+
+        parts = [
+            {column: np.load(os.path.join(run_dir, f"{column}.npy"), mmap_mode="r") for column in wanted}
+            for run_dir in self._runs(device_id, day, runs)
+        ]
+        if not parts:
+            arrays = {column: np.empty(0, dtype=COLUMN_DTYPES[column]) for column in wanted}
+        elif len(parts) == 1:
+            arrays = parts[0]
+        else:
+            # Late readings for an archived day land in a later run; merge them back into order
+            arrays = {column: np.concatenate([part[column] for part in parts]) for column in wanted}
+            order = np.lexsort((arrays["id"], arrays["ts"]))
+            arrays = {column: values[order] for column, values in arrays.items()}
+
+        low = 0 if start is None else np.searchsorted(arrays["ts"], to_micros(start), side="left")
+        high = len(arrays["ts"]) if end is None else np.searchsorted(arrays["ts"], to_micros(end), side="left")
+        return {column: arrays[column][low:high] for column in columns}
+
+    def iter_chunks(self, device_id=None, start=None, end=None, columns=ARCHIVE_COLUMNS, chunk_size=50000):
+        """Yield ``(device_ids, arrays)`` chunks oldest first across all matching devices.
+
+        Each day is cut into time slabs holding about ``chunk_size`` readings, and only
+        the matching slice of every device's files is read per slab, so memory stays
+        near one chunk however many devices or days are scanned.
+        """
+        manifest = self.manifest()
+        runs = set(manifest["runs"])
+        if not runs:
+            return
+
+        columns = tuple(columns)
+        wanted = tuple(dict.fromkeys(("ts", "id") + columns))
+        by_day = defaultdict(list)
+        for device in [device_id] if device_id else self.devices():
+            for day in self.days(device, start, end):
+                by_day[day].append(device)
+
+        for day in sorted(by_day):
+            parts = [(device, self.read(device, day, wanted, runs, start, end)) for device in by_day[day]]
+            parts = [(device, arrays) for device, arrays in parts if len(arrays["ts"])]
+            total = sum(len(arrays["ts"]) for _, arrays in parts)
+            if not total:
+                continue
+
+            day_start = to_micros(datetime.datetime.combine(day, datetime.time()))
+            slabs = math.ceil(total / chunk_size)
+            edges = [day_start + (86400 * 10 ** 6 * i) // slabs for i in range(slabs)] + [day_start + 86400 * 10 ** 6]
+
+            for low, high in zip(edges, edges[1:]):
+                pieces = []
+                for device, arrays in parts:
+                    a, b = np.searchsorted(arrays["ts"], [low, high], side="left")
+                    if b > a:
+                        pieces.append((device, {column: arrays[column][a:b] for column in wanted}))
+                if not pieces:
+                    continue
+
+                device_ids = np.concatenate([np.full(len(arrays["ts"]), device, dtype=object) for device, arrays in pieces])
+                merged = {column: np.concatenate([arrays[column] for _, arrays in pieces]) for column in wanted}
+                if len(pieces) > 1:
+                    order = np.lexsort((merged["id"], merged["ts"]))
+                    device_ids = device_ids[order]
+                    merged = {column: values[order] for column, values in merged.items()}
+
+                yield device_ids, {column: merged[column] for column in columns}
+
+    def iter_readings(self, device_id=None, start=None, end=None, chunk_size=50000):
+        """Yield lists of ArchivedReading rows oldest first, shaped like sensor_data rows."""
+        for device_ids, arrays in self.iter_chunks(device_id, start, end, chunk_size=chunk_size):
+            yield [
+                ArchivedReading(*values)
+                for values in zip(
+                    arrays["id"].tolist(), device_ids.tolist(), arrays["temperature"].tolist(),
+                    arrays["humidity"].tolist(), arrays["pressure"].tolist(), from_micros(arrays["ts"])
+                )
+            ]
+
+    def stats(self):
+        devices = self.devices()
+        days = rows = size = 0
+        runs = set(self.manifest()["runs"])
+        for device in devices:
+            for day in self.days(device):
+                days += 1
+                for run_dir in self._runs(device, day, runs):
+                    rows += len(np.load(os.path.join(run_dir, "ts.npy"), mmap_mode="r"))
+                    size += sum(entry.stat().st_size for entry in os.scandir(run_dir))
+        return {"devices": len(devices), "days": days, "readings": rows, "bytes": size}
+
+    # Writing
+
+    def write_run(self, device_id, day, run_id, columns):
+        """Write one device-day of readings for an archive run. Not visible until the run is committed."""
+        day_dir = os.path.join(self._device_dir(device_id), day.isoformat())
+        os.makedirs(day_dir, exist_ok=True)
+
+        tmp_dir = tempfile.mkdtemp(dir=day_dir, prefix=".tmp-")
+        try:
+            for column in ARCHIVE_COLUMNS:
+                with open(os.path.join(tmp_dir, f"{column}.npy"), 'wb') as f:
+                    np.save(f, np.asarray(columns[column], dtype=COLUMN_DTYPES[column]))
+                    f.flush()
+                    os.fsync(f.fileno())
+            # Fails if the run directory already exists, rather than replacing readings
+            os.rename(tmp_dir, os.path.join(day_dir, f"run-{run_id}"))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def remove_uncommitted(self):
+        """Delete run directories left behind by archive runs that never committed."""
+        runs = set(self.manifest()["runs"])
+        for device in self.devices():
+            for day in self.days(device):
+                day_dir = os.path.join(self._device_dir(device), day.isoformat())
+                for name in os.listdir(day_dir):
+                    if name.startswith(".tmp-") or (name.startswith("run-") and int(name[4:]) not in runs):
+                        shutil.rmtree(os.path.join(day_dir, name))
+
+    def archive(self, before, chunk_size=50000, log=print):
+        """Move sensor_data readings older than ``before`` into the archive and return how many moved.
+
+        The boundary only moves forward and is rounded down to midnight UTC. Readings
+        are written first, then the manifest commits the run, then the rows are deleted
+        in batches. Rows that image_data still points to stay in sensor_data, but are
+        hidden by hot_condition() like every other archived row.
+        """
+        manifest = self.manifest()
+        before = datetime.datetime.combine(before.date(), datetime.time())
+        if manifest["before"] is not None and before < manifest["before"]:
+            before = manifest["before"]
+
+        # Finish whatever an interrupted run left behind first
+        self.remove_uncommitted()
+        self._delete_archived(manifest, chunk_size, log)
+
+        max_id = db.session.query(db.func.max(SensorData.id)).scalar()
+        if max_id is None:
+            return 0
+
+        table = SensorData.__table__
+        condition = db.and_(table.c.date_created < before, table.c.id <= max_id)
+        previous = self.hot_condition(manifest)
+        if previous is not None:
+            condition = db.and_(condition, previous)
+
+        query = (
+            db.select(table.c.device_id, table.c.id, table.c.date_created, table.c.temperature, table.c.humidity, table.c.pressure)
+            .where(condition)
+            .order_by(table.c.device_id, table.c.date_created, table.c.id)
+        )
+        result = db.session.execute(query, execution_options={"stream_results": True, "yield_per": chunk_size})
+
+        # Runs are named after max_id; a re-run that moves the boundary with no new ids needs a fresh name
+        run_id = max([max_id] + [run + 1 for run in manifest["runs"]])
+
+        moved = 0
+        key, buffer = None, None
+        for row in result:
+            row_key = (row.device_id, row.date_created.date())
+            if row_key != key:
+                if buffer:
+                    self.write_run(key[0], key[1], run_id, buffer)
+                    moved += len(buffer["id"])
+                key, buffer = row_key, {column: [] for column in ARCHIVE_COLUMNS}
+            buffer["id"].append(row.id)
+            buffer["ts"].append(to_micros(row.date_created))
+            buffer["temperature"].append(row.temperature)
+            buffer["humidity"].append(row.humidity)
+            buffer["pressure"].append(row.pressure)
+        if buffer:
+            self.write_run(key[0], key[1], run_id, buffer)
+            moved += len(buffer["id"])
+        db.session.commit()
+
+        if not moved:
+            log(f"no new readings to archive before {before.isoformat()}")
+            return 0
+
+        manifest = {"before": before, "max_id": max_id, "runs": manifest["runs"] + [run_id]}
+        self._write_manifest(**manifest)
+        log(f"archived {moved} readings before {before.isoformat()} (run {run_id})")
+
+        self._delete_archived(manifest, chunk_size, log)
+        return moved
+
+    def _delete_archived(self, manifest, chunk_size, log):
+        if manifest["before"] is None:
+            return
+
+        table = SensorData.__table__
+        pinned = db.exists().where(ImageData.sensor_data_id == table.c.id)
+        batch = (
+            db.select(table.c.id)
+            .where(table.c.date_created < manifest["before"], table.c.id <= manifest["max_id"], ~pinned)
+            .limit(chunk_size)
+        )
+        deleted = 0
+        while True:
+            count = db.session.execute(db.delete(table).where(table.c.id.in_(batch))).rowcount
+            db.session.commit()
+            if not count:
+                break
+            deleted += count
+            log(f"deleted {deleted} archived rows from sensor_data")
+
+
+def create_sensor_archive(app):
+    return SensorArchive(app.config['ARCHIVE_ROOT'])
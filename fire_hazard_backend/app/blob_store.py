@@ -0,0 +1,124 @@
+import hashlib
+import os
+import tempfile
+
+
+class BlobTooLarge(ValueError):
+    pass
+
+
+class BlobStore:
+    """Content-addressed storage for image bytes. Blobs are keyed by their sha256 hex digest."""
+
+    def put(self, data):
+        """Store ``data`` and return ``(digest, size)``. Storing identical bytes twice is a no-op."""
+        raise NotImplementedError
+
+    def put_stream(self, stream, chunk_size=64 * 1024, max_size=None):
+        """Store everything read from a binary file object and return ``(digest, size)``.
+
+        Raises BlobTooLarge past ``max_size`` bytes and ValueError if the stream is empty.
+        """
+        raise NotImplementedError
+
+    def exists(self, digest):
+        raise NotImplementedError
+
+    def open(self, digest):
+        """Return a readable binary file object for the blob."""
+        raise NotImplementedError
+
+    def path(self, digest):
+        """Return a local filesystem path for the blob, or None if the backend has none."""
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs live under ``root/<aa>/<bb>/<digest>``. Writes go to a temp file in the
+    target directory and are renamed into place, so readers never see partial files."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def open(self, digest):
+        return open(self.path(digest), 'rb')
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.exists(digest):
+            self._write_atomic(digest, [data])
+        return digest, len(data)
+
+    def put_stream(self, stream, chunk_size=64 * 1024, max_size=None):
+        # The digest is only known at the end, so spool to a temp file and rename once hashed
+        incoming = os.path.join(self.root, ".incoming")
+        os.makedirs(incoming, exist_ok=True)
+
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=incoming, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise BlobTooLarge(f"Upload exceeds {max_size} bytes")
+                    hasher.update(chunk)
+                    tmp_file.write(chunk)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+
+            if size == 0:
+                raise ValueError("Empty upload")
+
+            digest = hasher.hexdigest()
+            if self.exists(digest):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(self.path(digest)), exist_ok=True)
+                os.replace(tmp_path, self.path(digest))
+            return digest, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _write_atomic(self, digest, chunks):
+        target = self.path(digest)
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in chunks:
+                    tmp_file.write(chunk)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+BLOB_STORE_BACKENDS = {
+    "local": LocalBlobStore
+}
+
+
+def create_blob_store(app):
+    backend = app.config['BLOB_STORE_BACKEND']
+    if backend not in BLOB_STORE_BACKENDS:
+        raise ValueError(f"Unknown blob store backend: {backend}")
+    return BLOB_STORE_BACKENDS[backend](app.config['BLOB_STORE_ROOT'])
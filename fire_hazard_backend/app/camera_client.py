@@ -0,0 +1,110 @@
+from requests.adapters import HTTPAdapter
+import threading
+import time
+import requests
+
+
+class CameraUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Per-camera breaker: opens after ``failure_threshold`` consecutive failures and
+    lets a single probe through once ``reset_timeout`` seconds have passed."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probe_in_flight = False
+
+    def allow(self, now):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probe_in_flight = False
+
+    def record_failure(self, error, now):
+        self.failures += 1
+        self.last_error = str(error)
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = now
+
+    def to_dict(self, now):
+        retry_in = None
+        if self.state == "open":
+            retry_in = max(0.0, self.reset_timeout - (now - self.opened_at))
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "retry_in": retry_in
+        }
+
+
+class CameraClient:
+    """Shared HTTP client for camera control: pooled keep-alive connections,
+    strict connect/read timeouts and a circuit breaker per camera."""
+
+    def __init__(self, connect_timeout=2.0, read_timeout=5.0, pool_size=10, failure_threshold=3, reset_timeout=30):
+        self.timeout = (connect_timeout, read_timeout)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def _breaker(self, camera_device_id):
+        breaker = self._breakers.get(camera_device_id)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self._breakers[camera_device_id] = breaker
+        return breaker
+
+    def request(self, camera_device_id, ip_address, path, method="GET"):
+        """Call the camera and return the response. Raises CameraUnavailable when the breaker is open."""
+        with self._lock:
+            breaker = self._breaker(camera_device_id)
+            if not breaker.allow(time.monotonic()):
+                raise CameraUnavailable(f"Circuit open for camera {camera_device_id}")
+
+        try:
+            response = self.session.request(method, f"http://{ip_address}{path}", timeout=self.timeout)
+        except requests.RequestException as e:
+            with self._lock:
+                breaker.record_failure(e, time.monotonic())
+            raise
+
+        with self._lock:
+            if response.status_code >= 500:
+                breaker.record_failure(f"HTTP {response.status_code}", time.monotonic())
+            else:
+                breaker.record_success()
+
+        return response
+
+    def breaker_states(self):
+        now = time.monotonic()
+        with self._lock:
+            return {camera_device_id: breaker.to_dict(now) for camera_device_id, breaker in self._breakers.items()}
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import time
+import uuid
+from app.camera_client import CameraUnavailable
+
+
+class CameraDispatcher:
+    """Runs camera triggers on a thread pool so hazard requests never wait on the camera.
+
+    Every trigger gets a ticket that can be polled. While a trigger for a camera is
+    queued or running, or finished within ``dedupe_window`` seconds, further hazards
+    for that camera are folded into the same ticket. Tickets live in the hazard state
+    backend, so any worker process can answer a poll and hazards reported to different
+    workers fold together. A ticket still queued or running after ``stale_after``
+    seconds, left by a worker that exited mid-trigger, no longer absorbs new hazards.
+    """
+
+    def __init__(self, app, max_workers=4, max_attempts=3, backoff=0.5, dedupe_window=30, max_tickets=1000, stale_after=300):
+        self.app = app
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.dedupe_window = dedupe_window
+        self.max_tickets = max_tickets
+        self.stale_after = stale_after
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="camera-dispatch")
+
+    def _state(self):
+        return self.app.extensions['hazard_state']
+
+    def dispatch(self, sensor_device_id, camera_device_id, reason="fire_hazard"):
+        ticket = {
+            "id": uuid.uuid4().hex,
+            "camera_device_id": camera_device_id,
+            "sensor_device_id": sensor_device_id,
+            "reason": reason,
+            "status": "queued",
+            "attempts": 0,
+            "deduplicated": 0,
+            "created_at": datetime.datetime.now().isoformat(),
+            "finished_at": None,
+            "camera_response": None,
+            "error": None
+        }
+        claimed = self._state().claim_camera_ticket(ticket, self._is_current, self.max_tickets)
+        if claimed["id"] == ticket["id"]:
+            self._executor.submit(self._run, ticket)
+        return claimed
+
+    def get_ticket(self, ticket_id):
+        return self._state().get_camera_ticket(ticket_id)
+
+    def _is_current(self, ticket):
+        # Wall-clock times, since the ticket may have been written by another worker process
+        now = datetime.datetime.now()
+        if ticket["status"] in ("queued", "running"):
+            age = now - datetime.datetime.fromisoformat(ticket["created_at"])
+            return age < datetime.timedelta(seconds=self.stale_after)
+        if ticket["status"] != "succeeded":
+            return False
+        return now - datetime.datetime.fromisoformat(ticket["finished_at"]) < datetime.timedelta(seconds=self.dedupe_window)
+
+    def _update(self, ticket, **fields):
+        ticket.update(fields)
+        self._state().update_camera_ticket(ticket["id"], fields)
+
+    def _run(self, ticket):
+        path = "/firehazard" if ticket["reason"] == "fire_hazard" else "/capture"
+        status = "failed"
+
+        for attempt in range(1, self.max_attempts + 1):
+            self._update(ticket, status="running", attempts=attempt)
+            try:
+                response_text = self._trigger(ticket["camera_device_id"], path)
+                self._update(ticket, camera_response=response_text, error=None)
+                status = "succeeded"
+                break
+            except CameraUnavailable as e:
+                # Breaker is open, retrying now would only fail fast again
+                self._update(ticket, error=str(e))
+                break
+            except Exception as e:
+                self._update(ticket, error=str(e))
+                self.app.logger.warning(
+                    f"Camera trigger {ticket['id']} attempt {attempt}/{self.max_attempts} failed: {e}"
+                )
+                if attempt < self.max_attempts:
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+
+        self._update(ticket, status=status, finished_at=datetime.datetime.now().isoformat())
+
+    def _trigger(self, camera_device_id, path):
+        # Look the camera up in-process rather than calling our own HTTP API
+        camera = self._state().get_camera(camera_device_id)
+        if not camera:
+            raise LookupError(f"Camera device {camera_device_id} is not registered")
+
+        response = self.app.extensions['camera_client'].request(camera_device_id, camera['ip_address'], path)
+        if response.status_code != 200:
+            raise RuntimeError(f"Camera returned status {response.status_code}")
+        return response.text
@@ -0,0 +1,367 @@
+from flask import current_app
+from flask.cli import AppGroup
+from app import db
+from concurrent.futures import ProcessPoolExecutor
+import click
+import datetime
+import json
+import os
+
+perf_cli = AppGroup('perf', help="Performance checks for the backend.")
+images_cli = AppGroup('images', help="Image storage maintenance.")
+hazard_cli = AppGroup('hazard', help="Hazard rule tools.")
+rollups_cli = AppGroup('rollups', help="Sensor rollup maintenance.")
+archive_cli = AppGroup('archive', help="Cold storage for old sensor readings.")
+telemetry_cli = AppGroup('telemetry', help="Binary sensor telemetry listener.")
+
+
+def _plan_seq_scans(plan, tables):
+    """Return the tables in ``tables`` that a JSON EXPLAIN plan reads with a sequential scan."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in tables:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(_plan_seq_scans(child, tables))
+    return found
+
+
+PLAN_TABLES = {"sensor_data", "image_data", "sensor_rollup"}
+
+
+def query_seq_scans(conn, query, tables=PLAN_TABLES):
+    """EXPLAIN ``query`` on a PostgreSQL connection and return the tables in ``tables`` it seq scans."""
+    sql = str(query.statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return _plan_seq_scans(plan[0]["Plan"], tables)
+
+
+def hot_queries():
+    """The query shapes behind the read endpoints, as (name, query) pairs."""
+    from app.routes.sensor_routes import sensor_list_query
+    from app.routes.cam_routes import image_list_query
+    from app.rollups import rollup_query
+    from app.models import SensorData, ImageData
+    from app.pagination import keyset_query
+
+    end = datetime.datetime.utcnow()
+    start = end - datetime.timedelta(days=30)
+
+    return [
+        ("get_sensor_data", sensor_list_query().limit(10)),
+        ("get_sensor_data device_id", sensor_list_query("sensor_device_1").limit(10)),
+        ("get_latest_sensor_data device_id", sensor_list_query("sensor_device_1").limit(1)),
+        ("get_images", image_list_query().limit(10)),
+        ("get_images device_id", image_list_query(device_id="camera_device_1").limit(10)),
+        ("get_images device_id is_fire_hazard", image_list_query(device_id="camera_device_1", is_fire_hazard=True).limit(10)),
+        ("get_images sensor_data_id", image_list_query(sensor_data_id=1).limit(10)),
+        ("get_sensor_data cursor", keyset_query(sensor_list_query(), SensorData.date_created, SensorData.id, (end, 1000)).limit(10)),
+        ("get_sensor_data device_id cursor", keyset_query(sensor_list_query("sensor_device_1"), SensorData.date_created, SensorData.id, (end, 1000)).limit(10)),
+        ("get_images device_id cursor", keyset_query(image_list_query(device_id="camera_device_1"), ImageData.timestamp, ImageData.id, (end, 1000)).limit(10)),
+        ("get_sensor_aggregate", rollup_query(3600, start, end)),
+        ("get_sensor_aggregate device_id", rollup_query(3600, start, end, "sensor_device_1")),
+    ]
+
+
+@perf_cli.command('check-plans')
+def check_plans():
+    """Fail if any hot read query can only be answered with a sequential scan.
+
+    Sequential scans are disabled for the check, so the planner picks one only
+    when no usable index exists. Small tables therefore do not cause false alarms.
+    """
+    if db.engine.dialect.name != "postgresql":
+        raise click.ClickException("Query plan checks need a PostgreSQL database")
+
+    failures = []
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        for name, query in hot_queries():
+            scans = query_seq_scans(conn, query)
+            if scans:
+                failures.append(name)
+                click.echo(f"FAIL {name}: seq scan on {', '.join(scans)}")
+            else:
+                click.echo(f"ok   {name}")
+
+    if failures:
+        raise SystemExit(1)
+
+
+@images_cli.command('migrate-blobs')
+@click.option('--chunk-size', default=100, show_default=True, help="Rows moved per transaction.")
+@click.option('--remove-files', is_flag=True, help="Delete the old static/uploads copy once a row is moved.")
+def migrate_blobs(chunk_size, remove_files):
+    """Move inline image_binary bytes into the blob store.
+
+    Each chunk is committed on its own and only rows without a content_hash are
+    picked up, so an interrupted run can simply be started again.
+    """
+    from app.models import ImageData
+
+    blob_store = current_app.extensions['blob_store']
+    remaining = ImageData.query.filter(ImageData.image_binary.isnot(None), ImageData.content_hash.is_(None)).count()
+    click.echo(f"{remaining} images to move")
+
+    moved = 0
+    last_id = 0
+    while True:
+        images = (
+            ImageData.query
+            .options(db.undefer(ImageData.image_binary))
+            .filter(ImageData.id > last_id, ImageData.image_binary.isnot(None), ImageData.content_hash.is_(None))
+            .order_by(ImageData.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not images:
+            break
+
+        old_files = []
+        for image in images:
+            content_hash, size = blob_store.put(image.image_binary)
+            if image.filepath and os.path.isfile(image.filepath):
+                old_files.append(image.filepath)
+            image.content_hash = content_hash
+            image.size = size
+            image.filepath = blob_store.path(content_hash) or content_hash
+            image.image_binary = None
+
+        last_id = images[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+
+        # Only remove the old copies after the rows pointing at the blobs are committed
+        if remove_files:
+            for path in old_files:
+                os.remove(path)
+
+        moved += len(images)
+        click.echo(f"moved {moved}/{remaining} (last id {last_id})")
+
+    click.echo("done")
+
+
+def _parse_threshold(ctx, param, values):
+    from app.hazard_rules import DEFAULT_THRESHOLDS
+
+    changes = {}
+    for value in values:
+        name, _, number = value.partition("=")
+        if name not in DEFAULT_THRESHOLDS:
+            raise click.BadParameter(f"unknown threshold {name!r}")
+        try:
+            changes[name] = float(number)
+        except ValueError:
+            raise click.BadParameter(f"{name} must be a number")
+    return changes
+
+
+@hazard_cli.command('replay')
+@click.option('--set', 'changes', multiple=True, callback=_parse_threshold, metavar="NAME=VALUE",
+              help="Threshold to try instead of the current one. Repeatable.")
+@click.option('--device-id', 'devices', multiple=True, help="Only replay these devices. Repeatable.")
+@click.option('--group', help="Apply --set to this threshold group instead of the defaults.")
+@click.option('--since', type=click.DateTime(), help="First reading time (UTC).")
+@click.option('--until', type=click.DateTime(), help="Stop before this reading time (UTC).")
+@click.option('--rules', help="Comma separated rules, defaults to HAZARD_RULES.")
+@click.option('--workers', default=os.cpu_count(), show_default=True, help="Worker processes.")
+@click.option('--chunk-size', default=5000, show_default=True, help="Rows fetched per round trip.")
+@click.option('--max-hits', default=20, show_default=True, help="Alerts listed per device.")
+@click.option('--output', type=click.Choice(["text", "json"]), default="text", show_default=True)
+def replay(changes, devices, group, since, until, rules, workers, chunk_size, max_hits, output):
+    """Replay stored sensor readings through the hazard rules.
+
+    Shows how many alerts the current thresholds, with any --set overrides,
+    would have raised. Each device streams its readings in time order from a
+    server-side cursor in its own worker process, so memory use does not grow
+    with the table.
+    """
+    from app.hazard_state import apply_threshold_changes
+    from app.replay import device_ids, replay_device
+
+    database_url = current_app.config['SQLALCHEMY_DATABASE_URI']
+    config = current_app.extensions['hazard_state'].get_thresholds()
+    config = apply_threshold_changes(config, changes, group=group)
+    rule_names = [name.strip() for name in rules.split(",")] if rules else current_app.config['HAZARD_RULES']
+
+    archive = current_app.extensions['sensor_archive']
+    if not devices:
+        devices = set(device_ids(database_url, since, until))
+        devices.update(device for device in archive.devices() if archive.days(device, since, until))
+    devices = sorted(devices)
+    click.echo(f"Replaying {len(devices)} devices", err=True)
+
+    args = (config, rule_names, since, until, chunk_size, max_hits, archive.root)
+    if workers > 1 and len(devices) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(replay_device, database_url, device_id, *args) for device_id in devices]
+            reports = [future.result() for future in futures]
+    else:
+        reports = [replay_device(database_url, device_id, *args) for device_id in devices]
+
+    latencies = [report["first_alert_latency"] for report in reports if report["first_alert_latency"] is not None]
+    by_rule = {}
+    for report in reports:
+        for rule, count in report["alerts_by_rule"].items():
+            by_rule[rule] = by_rule.get(rule, 0) + count
+
+    summary = {
+        "thresholds": {name: value for name, value in config.items() if name != "version"},
+        "devices": len(reports),
+        "readings": sum(report["readings"] for report in reports),
+        "alerts": sum(report["alerts"] for report in reports),
+        "alerts_by_rule": by_rule,
+        "devices_alerting": len(latencies),
+        "median_first_alert_latency": float(sorted(latencies)[len(latencies) // 2]) if latencies else None,
+        "per_device": reports
+    }
+
+    if output == "json":
+        click.echo(json.dumps(summary, indent=2))
+        return
+
+    click.echo(f"{summary['readings']} readings from {summary['devices']} devices, {summary['alerts']} alerts")
+    for rule, count in sorted(by_rule.items(), key=lambda item: -item[1]):
+        click.echo(f"  {rule}: {count}")
+    if latencies:
+        click.echo(f"{len(latencies)} devices alerted, median first alert after {summary['median_first_alert_latency']:.0f}s")
+
+    for report in reports:
+        if not report["alerts"]:
+            continue
+        click.echo(f"\n{report['device_id']}: {report['alerts']} alerts in {report['readings']} readings, "
+                   f"first after {report['first_alert_latency']:.0f}s")
+        for hit in report["hits"]:
+            click.echo(f"  {hit['timestamp']} {hit['risk']:<6} {hit['rule']}: {hit['message']}")
+        if report["alerts"] > len(report["hits"]):
+            click.echo(f"  ... {report['alerts'] - len(report['hits'])} more")
+
+
+@rollups_cli.command('rebuild')
+@click.option('--since', type=click.DateTime(), help="Rebuild from this time (UTC), rounded down to the hour.")
+@click.option('--until', type=click.DateTime(), help="Rebuild up to this time (UTC), rounded up to the hour.")
+@click.option('--device-id', help="Only rebuild this device.")
+@click.option('--chunk-size', default=10000, show_default=True, help="Readings aggregated per round trip.")
+def rebuild_rollups(since, until, device_id, chunk_size):
+    """Recompute sensor_rollup from the archive and sensor_data.
+
+    Fills rollups for readings stored before the table existed, repairs drift, and
+    with SENSOR_ROLLUPS off can run on a schedule as the only way rollups are kept
+    up to date. The range is widened to whole hours so every bucket it touches is
+    recomputed in full. Everything runs in one transaction: readings ingested while
+    it runs land after the rebuilt buckets and are added on top of them.
+    """
+    from app.models import SensorData, SensorRollup
+    from app.rollups import BUCKETS, FIELDS, aggregate_arrays, bucket_start, upsert_rollups, write_rollups
+
+    largest = max(BUCKETS.values())
+    if since:
+        since = bucket_start(since, largest)
+    if until and until != bucket_start(until, largest):
+        until = bucket_start(until, largest) + datetime.timedelta(seconds=largest)
+
+    rollups = db.session.query(SensorRollup)
+    readings = db.select(SensorData.device_id, SensorData.date_created, SensorData.temperature, SensorData.humidity, SensorData.pressure)
+    if since:
+        rollups = rollups.filter(SensorRollup.bucket_start >= since)
+        readings = readings.where(SensorData.date_created >= since)
+    if until:
+        rollups = rollups.filter(SensorRollup.bucket_start < until)
+        readings = readings.where(SensorData.date_created < until)
+    if device_id:
+        rollups = rollups.filter(SensorRollup.device_id == device_id)
+        readings = readings.where(SensorData.device_id == device_id)
+
+    try:
+        removed = rollups.delete(synchronize_session=False)
+        click.echo(f"removed {removed} rollup rows")
+
+        total = 0
+        archive = current_app.extensions['sensor_archive']
+        manifest = archive.manifest()
+        if manifest["before"] is not None and (since is None or since < manifest["before"]):
+            cold_until = manifest["before"] if until is None else min(until, manifest["before"])
+            for device_ids, arrays in archive.iter_chunks(device_id, since, cold_until, ("ts",) + FIELDS, chunk_size):
+                write_rollups(aggregate_arrays(device_ids, arrays["ts"], arrays))
+                total += len(device_ids)
+                click.echo(f"rolled up {total} readings")
+
+        hot = archive.hot_condition(manifest)
+        if hot is not None:
+            readings = readings.where(hot)
+
+        result = db.session.execute(readings, execution_options={"stream_results": True, "yield_per": chunk_size})
+        for chunk in result.partitions():
+            upsert_rollups([row._mapping for row in chunk])
+            total += len(chunk)
+            click.echo(f"rolled up {total} readings")
+
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+
+    click.echo("done")
+
+
+@archive_cli.command('run')
+@click.option('--older-than-days', type=int, help="Archive readings older than this. Defaults to ARCHIVE_AFTER_DAYS.")
+@click.option('--chunk-size', default=50000, show_default=True, help="Rows fetched or deleted per round trip.")
+def run_archive(older_than_days, chunk_size):
+    """Move old sensor_data readings into the columnar archive.
+
+    Safe to run on a schedule and to re-run after a failure: an interrupted run
+    leaves nothing visible and is cleaned up by the next one.
+    """
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if older_than_days is None else older_than_days
+    before = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    current_app.extensions['sensor_archive'].archive(before, chunk_size=chunk_size, log=click.echo)
+    click.echo("done")
+
+
+@archive_cli.command('stats')
+def archive_stats():
+    """Show what the archive holds."""
+    archive = current_app.extensions['sensor_archive']
+    manifest = archive.manifest()
+    stats = archive.stats()
+    click.echo(f"root: {archive.root}")
+    click.echo(f"before: {manifest['before'].isoformat() if manifest['before'] else '-'} (max id {manifest['max_id']}, {len(manifest['runs'])} runs)")
+    click.echo(f"{stats['readings']} readings, {stats['devices']} devices, {stats['days']} device-days, {stats['bytes'] / 1e6:.1f} MB")
+
+
+@telemetry_cli.command('serve')
+@click.option('--host', help="Address to listen on. Defaults to TELEMETRY_HOST.")
+@click.option('--port', type=int, help="TCP and UDP port. Defaults to TELEMETRY_PORT.")
+@click.option('--tcp/--no-tcp', default=True, show_default=True, help="Accept TCP connections.")
+@click.option('--udp/--no-udp', default=True, show_default=True, help="Accept UDP datagrams.")
+def serve_telemetry(host, port, tcp, udp):
+    """Receive packed <HIfff readings and store them like /api/sensor/batch."""
+    from app.telemetry import TelemetryListener
+
+    config = current_app.config
+    listener = TelemetryListener(
+        current_app._get_current_object(),
+        host=host or config['TELEMETRY_HOST'],
+        port=port or config['TELEMETRY_PORT'],
+        tcp=tcp,
+        udp=udp,
+        flush_rows=config['TELEMETRY_FLUSH_ROWS'],
+        flush_interval=config['TELEMETRY_FLUSH_INTERVAL']
+    )
+    try:
+        listener.serve()
+    except KeyboardInterrupt:
+        pass
+    click.echo(json.dumps(listener.snapshot()))
+
+
+def register_commands(app):
+    app.cli.add_command(perf_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(hazard_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(telemetry_cli)
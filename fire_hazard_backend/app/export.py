@@ -0,0 +1,95 @@
+from flask import current_app
+from app import db
+from app.models import SensorData
+from itertools import chain, islice
+import csv
+import heapq
+import io
+import json
+import zlib
+
+EXPORT_COLUMNS = ("id", "device_id", "temperature", "humidity", "pressure", "date_created")
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+
+def stream_readings(device_id=None, start=None, end=None, chunk_size=5000):
+    """Yield lists of reading rows oldest first, merged from the archive and sensor_data.
+
+    sensor_data rows come from a server-side cursor ``chunk_size`` at a time, and
+    rows the archive already serves are skipped.
+    """
+    archive = current_app.extensions['sensor_archive']
+    manifest = archive.manifest()
+    cold = iter(())
+    if manifest["before"] is not None and (start is None or start < manifest["before"]):
+        cold_end = manifest["before"] if end is None else min(end, manifest["before"])
+        cold = archive.iter_readings(device_id, start, cold_end, chunk_size=chunk_size)
+
+    table = SensorData.__table__
+    query = db.select(*(table.c[column] for column in EXPORT_COLUMNS)).order_by(table.c.date_created, table.c.id)
+    if device_id:
+        query = query.where(table.c.device_id == device_id)
+    if start is not None:
+        query = query.where(table.c.date_created >= start)
+    if end is not None:
+        query = query.where(table.c.date_created < end)
+    hot = archive.hot_condition(manifest)
+    if hot is not None:
+        query = query.where(hot)
+
+    result = db.session.execute(query, execution_options={"stream_results": True, "yield_per": chunk_size})
+    try:
+        # Hot rows can predate the archive cutoff (late uploads, ids past max_id), so the
+        # two sorted streams are interleaved rather than concatenated
+        rows = heapq.merge(
+            chain.from_iterable(cold), chain.from_iterable(result.partitions()),
+            key=lambda row: (row.date_created, row.id)
+        )
+        while chunk := list(islice(rows, chunk_size)):
+            yield chunk
+    finally:
+        result.close()
+
+
+def ndjson_chunks(chunks):
+    for chunk in chunks:
+        yield "".join(
+            json.dumps({
+                "id": row.id,
+                "device_id": row.device_id,
+                "temperature": row.temperature,
+                "humidity": row.humidity,
+                "pressure": row.pressure,
+                "date_created": row.date_created.isoformat()
+            }) + "\n"
+            for row in chunk
+        )
+
+
+def csv_chunks(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in chunks:
+        for row in chunk:
+            writer.writerow((row.id, row.device_id, row.temperature, row.humidity, row.pressure, row.date_created.isoformat()))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of text chunks into one gzip stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
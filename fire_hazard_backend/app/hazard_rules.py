@@ -0,0 +1,205 @@
+from collections import namedtuple
+import numpy as np
+
+DEFAULT_THRESHOLDS = {
+    "temp_threshold": 35.0,  # C, absolute temperature
+    "temp_rise_threshold": 5.0,  # C above the window minimum
+    "temp_window": 60.0,  # seconds
+    "rise_rate_threshold": 2.0,  # C per minute, regression slope over the window
+    "humidity_drop_threshold": 15.0,  # percentage points below the window mean
+    "pressure_z_threshold": 4.0,  # standard deviations from the window mean
+    "pressure_min_std": 0.5  # hPa, floor for the pressure deviation
+}
+
+RISK_LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+Alert = namedtuple("Alert", "rule risk message")
+
+# A rule fires when check(v, th) is true. v maps reading and window values to numbers
+# and th maps threshold names to numbers; both may hold NumPy arrays instead, in which
+# case check() returns one boolean per row.
+Rule = namedtuple("Rule", "name risk check message")
+
+RULES = (
+    Rule(
+        "temperature_rise", "HIGH",
+        lambda v, th: (v["count"] >= 2) & (v["temperature"] - v["temp_min"] >= th["temp_rise_threshold"]),
+        lambda v, th: f"Rapid temperature rise: {v['temp_min']}C -> {v['temperature']}C in {th['temp_window']} seconds"
+    ),
+    Rule(
+        "absolute_temperature", "HIGH",
+        lambda v, th: v["temperature"] >= th["temp_threshold"],
+        lambda v, th: f"Temperature above threshold: {v['temperature']}C >= {th['temp_threshold']}C"
+    ),
+    Rule(
+        "rate_of_rise", "MEDIUM",
+        lambda v, th: (v["count"] >= 3) & (v["temp_slope"] * 60 >= th["rise_rate_threshold"]),
+        lambda v, th: f"Temperature rising at {v['temp_slope'] * 60:.2f}C/min >= {th['rise_rate_threshold']}C/min"
+    ),
+    Rule(
+        "humidity_drop", "MEDIUM",
+        lambda v, th: (v["prev_count"] >= 1) & (v["humidity_mean"] - v["humidity"] >= th["humidity_drop_threshold"]),
+        lambda v, th: f"Humidity dropped to {v['humidity']}% from a {v['humidity_mean']:.1f}% average"
+    ),
+    Rule(
+        "pressure_anomaly", "MEDIUM",
+        lambda v, th: (v["prev_count"] >= 3) & (
+            np.abs(v["pressure"] - v["pressure_mean"]) / np.maximum(v["pressure_std"], th["pressure_min_std"])
+            >= th["pressure_z_threshold"]
+        ),
+        lambda v, th: f"Pressure {v['pressure']}hPa deviates from the {v['pressure_mean']:.1f}hPa average"
+    ),
+)
+
+RULES_BY_NAME = {rule.name: rule for rule in RULES}
+
+
+def resolve_thresholds(config, device_id):
+    """Thresholds for one device: defaults, then its group's overrides, then its own."""
+    thresholds = {name: config[name] for name in DEFAULT_THRESHOLDS}
+    group = config.get("device_groups", {}).get(device_id)
+    if group:
+        thresholds.update(config.get("groups", {}).get(group, {}))
+    thresholds.update(config.get("devices", {}).get(device_id, {}))
+    return thresholds
+
+
+def window_stats_batch(group, ts, temperature, humidity, pressure, window):
+    """Vectorized WindowStats for rows sorted by (group, ts).
+
+    Each row's window holds the earlier rows of the same group that fall within
+    ``window[i]`` seconds of it. The loop runs once per lag, not once per row: pass k
+    folds row i-k into row i wherever it is still inside the window, so the number
+    of passes equals the longest window in rows. Times are taken relative to each
+    row, which keeps the regression sums well conditioned.
+    """
+    n = len(ts)
+    count = np.ones(n)
+    temp_min = temperature.copy()
+    temp_max = temperature.copy()
+    sum_t = np.zeros(n)
+    sum_tt = np.zeros(n)
+    sum_ty = np.zeros(n)
+    sum_y = temperature.copy()
+    sum_h = np.zeros(n)
+    sum_p = np.zeros(n)
+    sum_pp = np.zeros(n)
+
+    for k in range(1, n):
+        valid = (group[:-k] == group[k:]) & (ts[:-k] >= ts[k:] - window[k:])
+        if not valid.any():
+            break
+
+        dt = np.where(valid, ts[:-k] - ts[k:], 0.0)
+        y = temperature[:-k]
+        count[k:] += valid
+        sum_t[k:] += dt
+        sum_tt[k:] += dt * dt
+        sum_ty[k:] += dt * np.where(valid, y, 0.0)
+        sum_y[k:] += np.where(valid, y, 0.0)
+        temp_min[k:] = np.where(valid, np.minimum(temp_min[k:], y), temp_min[k:])
+        temp_max[k:] = np.where(valid, np.maximum(temp_max[k:], y), temp_max[k:])
+        sum_h[k:] += np.where(valid, humidity[:-k], 0.0)
+        sum_p[k:] += np.where(valid, pressure[:-k], 0.0)
+        sum_pp[k:] += np.where(valid, pressure[:-k] * pressure[:-k], 0.0)
+
+    sxx = sum_tt - sum_t * sum_t / count
+    sxy = sum_ty - sum_t * sum_y / count
+    temp_slope = np.where(sxx > 1e-9, sxy / np.where(sxx > 1e-9, sxx, 1.0), 0.0)
+
+    prev_count = count - 1
+    safe_prev = np.maximum(prev_count, 1)
+    humidity_mean = np.where(prev_count > 0, sum_h / safe_prev, 0.0)
+    pressure_mean = np.where(prev_count > 0, sum_p / safe_prev, 0.0)
+    pressure_var = np.where(prev_count > 0, sum_pp / safe_prev - pressure_mean * pressure_mean, 0.0)
+
+    return {
+        "count": count,
+        "temp_min": temp_min,
+        "temp_max": temp_max,
+        "temp_slope": temp_slope,
+        "prev_count": prev_count,
+        "humidity_mean": humidity_mean,
+        "pressure_mean": pressure_mean,
+        "pressure_std": np.sqrt(np.maximum(pressure_var, 0.0))
+    }
+
+
+class HazardEngine:
+    """Evaluates the configured rules and reports the highest-risk rule that fired."""
+
+    def __init__(self, rule_names=None):
+        names = rule_names or [rule.name for rule in RULES]
+        unknown = [name for name in names if name not in RULES_BY_NAME]
+        if unknown:
+            raise ValueError(f"Unknown hazard rules: {', '.join(unknown)}")
+        # Highest risk first, then declaration order
+        self.rules = sorted(
+            (RULES_BY_NAME[name] for name in names),
+            key=lambda rule: (-RISK_LEVELS.index(rule.risk), RULES.index(rule))
+        )
+
+    def evaluate(self, stats, temperature, humidity, pressure, thresholds):
+        """Return the Alert for one reading given its WindowStats, or None."""
+        values = dict(stats._asdict(), temperature=temperature, humidity=humidity, pressure=pressure)
+        for rule in self.rules:
+            if rule.check(values, thresholds):
+                return Alert(rule.name, rule.risk, rule.message(values, thresholds))
+        return None
+
+    def evaluate_batch(self, device_ids, ts, temperature, humidity, pressure, thresholds_for, history=None):
+        """Evaluate many readings at once and return one Alert or None per input row.
+
+        Rows are ordered by (device, time) internally, so each device's window follows
+        its own sample times whatever order the rows arrive in. ``thresholds_for`` maps
+        a device id to its thresholds. ``history`` optionally maps device ids to earlier
+        (timestamp, temperature, humidity, pressure) readings that seed the windows;
+        they are not evaluated themselves.
+        """
+        n = len(device_ids)
+        if n == 0:
+            return []
+
+        history = history or {}
+        seed = [(device_id, reading) for device_id, readings in history.items() for reading in readings]
+        all_ids = [device_id for device_id, _ in seed] + list(device_ids)
+
+        codes = {}
+        group = np.fromiter((codes.setdefault(device_id, len(codes)) for device_id in all_ids), dtype=np.int64, count=len(all_ids))
+
+        def column(values, position):
+            seeded = np.fromiter((reading[position] for _, reading in seed), dtype=np.float64, count=len(seed))
+            return np.concatenate([seeded, np.asarray(values, dtype=np.float64)])
+
+        ts_all = column(ts, 0)
+        temp_all = column(temperature, 1)
+        hum_all = column(humidity, 2)
+        pres_all = column(pressure, 3)
+        is_input = np.concatenate([np.zeros(len(seed), dtype=bool), np.ones(n, dtype=bool)])
+        input_index = np.concatenate([np.full(len(seed), -1), np.arange(n)])
+
+        # Seed rows sort ahead of input rows with the same timestamp
+        order = np.lexsort((is_input, ts_all, group))
+        group, ts_all, is_input, input_index = group[order], ts_all[order], is_input[order], input_index[order]
+        temp_all, hum_all, pres_all = temp_all[order], hum_all[order], pres_all[order]
+
+        device_thresholds = [thresholds_for(device_id) for device_id in codes]
+        th = {
+            name: np.array([values[name] for values in device_thresholds], dtype=np.float64)[group]
+            for name in DEFAULT_THRESHOLDS
+        }
+
+        values = window_stats_batch(group, ts_all, temp_all, hum_all, pres_all, th["temp_window"])
+        values.update(temperature=temp_all, humidity=hum_all, pressure=pres_all)
+
+        alerts = [None] * n
+        undecided = is_input.copy()
+        for rule in self.rules:
+            fired = undecided & rule.check(values, th)
+            for row in np.flatnonzero(fired):
+                row_values = {key: array[row].item() for key, array in values.items()}
+                row_thresholds = {key: array[row].item() for key, array in th.items()}
+                alerts[input_index[row]] = Alert(rule.name, rule.risk, rule.message(row_values, row_thresholds))
+            undecided &= ~fired
+
+        return alerts
@@ -0,0 +1,556 @@
+from app.hazard_window import WindowRegistry, WindowStats
+from app.hazard_rules import DEFAULT_THRESHOLDS
+import collections
+import copy
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+
+def default_threshold_config():
+    return {**DEFAULT_THRESHOLDS, "groups": {}, "devices": {}, "device_groups": {}}
+
+
+def apply_threshold_changes(config, changes, device_id=None, group=None, devices=None):
+    """Return a copy of ``config`` with ``changes`` applied to the defaults, a group or a device."""
+    config = copy.deepcopy(config)
+    if device_id:
+        config["devices"].setdefault(device_id, {}).update(changes)
+    elif group:
+        config["groups"].setdefault(group, {}).update(changes)
+        for member in devices or []:
+            config["device_groups"][member] = group
+    else:
+        config.update(changes)
+    return config
+
+
+def newest_per_device(readings):
+    """The newest reading of each device in ``readings``, by (timestamp, id)."""
+    newest = {}
+    for reading in readings:
+        current = newest.get(reading["device_id"])
+        if current is None or (reading["timestamp"], reading["id"]) > (current["timestamp"], current["id"]):
+            newest[reading["device_id"]] = reading
+    return newest
+
+
+class StateBackend:
+    """Hazard state shared by every request: device windows, thresholds, the camera registry
+    and trigger tickets, the latest reading of every device and the recent live feed events."""
+
+    EVENT_RETENTION = 10000  # events kept for subscribers resuming with Last-Event-ID
+
+    def get_thresholds(self):
+        """Return the threshold config (defaults, groups, devices) plus its ``version``."""
+        raise NotImplementedError
+
+    def update_thresholds(self, changes, device_id=None, group=None, devices=None):
+        """Apply ``changes`` (see apply_threshold_changes), bump the version and return the new config."""
+        raise NotImplementedError
+
+    def push_reading(self, device_id, timestamp, temperature, window, humidity=0.0, pressure=0.0):
+        """Add a reading to the device's window and return its WindowStats atomically.
+
+        A reading more than ``window`` seconds older than the device's newest one is
+        ignored and None returned.
+        """
+        raise NotImplementedError
+
+    def window_snapshot(self, device_id):
+        """Return the readings currently in the device's window."""
+        raise NotImplementedError
+
+    def update_latest(self, readings):
+        """Keep each reading that is newer, by (timestamp, id), than the one cached for its device."""
+        raise NotImplementedError
+
+    def fill_latest(self, readings):
+        """update_latest with every device's latest reading from the database, marking the cache complete."""
+        raise NotImplementedError
+
+    def get_latest(self, device_ids=None):
+        """Return ``{device_id: reading}`` for the cached devices among ``device_ids``.
+
+        With no ``device_ids`` every device is returned, or None until fill_latest has run.
+        """
+        raise NotImplementedError
+
+    def publish_events(self, events):
+        """Append live feed events, each ``{"type", "device_id", "data"}``."""
+        raise NotImplementedError
+
+    def last_event_id(self):
+        raise NotImplementedError
+
+    def touch_subscribers(self, worker_id):
+        """Record that the worker process ``worker_id`` has live feed subscribers right now."""
+        raise NotImplementedError
+
+    def has_subscribers(self, within):
+        """True if any worker has had live feed subscribers in the last ``within`` seconds."""
+        raise NotImplementedError
+
+    def events_after(self, event_id, timeout=0.0):
+        """Return ``(id, event)`` pairs newer than ``event_id`` oldest first, waiting up to ``timeout`` seconds for one."""
+        raise NotImplementedError
+
+    def register_camera(self, device_id, ip_address, last_seen):
+        raise NotImplementedError
+
+    def get_camera(self, device_id):
+        """Return ``{"ip_address", "last_seen"}`` for the camera, or None."""
+        raise NotImplementedError
+
+    def cameras(self):
+        raise NotImplementedError
+
+    def claim_camera_ticket(self, ticket, is_current, keep):
+        """Make ``ticket`` its camera's latest trigger ticket and return it, unless the camera's
+        latest ticket passes ``is_current``; that ticket's ``deduplicated`` count is then bumped
+        and it is returned instead. Atomic across workers. Only the newest ``keep`` tickets are kept."""
+        raise NotImplementedError
+
+    def update_camera_ticket(self, ticket_id, fields):
+        """Apply ``fields`` to a ticket. Does nothing if it has been dropped."""
+        raise NotImplementedError
+
+    def get_camera_ticket(self, ticket_id):
+        """Return the ticket, or None."""
+        raise NotImplementedError
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local state. Only correct with a single worker process."""
+
+    def __init__(self, ttl=3600):
+        self._lock = threading.Lock()
+        self._thresholds = dict(default_threshold_config(), version=1)
+        self._windows = WindowRegistry(ttl=ttl)
+        self._cameras = {}
+        self._latest = {}
+        self._latest_complete = False
+        self._events = collections.deque(maxlen=self.EVENT_RETENTION)
+        self._event_id = 0
+        self._events_published = threading.Condition()
+        self._subscribers_seen = {}
+        self._tickets = collections.OrderedDict()  # ticket id -> ticket, oldest first
+        self._latest_tickets = {}  # camera_device_id -> ticket id
+
+    def get_thresholds(self):
+        with self._lock:
+            return copy.deepcopy(self._thresholds)
+
+    def update_thresholds(self, changes, device_id=None, group=None, devices=None):
+        with self._lock:
+            version = self._thresholds["version"]
+            self._thresholds = apply_threshold_changes(self._thresholds, changes, device_id, group, devices)
+            self._thresholds["version"] = version + 1
+            return copy.deepcopy(self._thresholds)
+
+    def push_reading(self, device_id, timestamp, temperature, window, humidity=0.0, pressure=0.0):
+        return self._windows.push(device_id, timestamp, temperature, window, humidity, pressure)
+
+    def window_snapshot(self, device_id):
+        return self._windows.snapshot(device_id)
+
+    def update_latest(self, readings):
+        newest = newest_per_device(readings)
+        with self._lock:
+            for device_id, reading in newest.items():
+                current = self._latest.get(device_id)
+                if current is None or (reading["timestamp"], reading["id"]) > (current["timestamp"], current["id"]):
+                    self._latest[device_id] = dict(reading)
+
+    def fill_latest(self, readings):
+        self.update_latest(readings)
+        with self._lock:
+            self._latest_complete = True
+
+    def get_latest(self, device_ids=None):
+        with self._lock:
+            if device_ids is None:
+                if not self._latest_complete:
+                    return None
+                device_ids = self._latest
+            return {device_id: dict(self._latest[device_id]) for device_id in device_ids if device_id in self._latest}
+
+    def publish_events(self, events):
+        with self._events_published:
+            for event in events:
+                self._event_id += 1
+                self._events.append((self._event_id, event))
+            self._events_published.notify_all()
+
+    def last_event_id(self):
+        with self._events_published:
+            return self._event_id
+
+    def touch_subscribers(self, worker_id):
+        with self._lock:
+            self._subscribers_seen[worker_id] = time.time()
+
+    def has_subscribers(self, within):
+        cutoff = time.time() - within
+        with self._lock:
+            return any(seen >= cutoff for seen in self._subscribers_seen.values())
+
+    def events_after(self, event_id, timeout=0.0):
+        with self._events_published:
+            if self._event_id <= event_id and timeout:
+                self._events_published.wait(timeout)
+            # Ids are consecutive, so the newer events are the deque's tail
+            newer = self._event_id - event_id
+            if newer <= 0:
+                return []
+            return [self._events[index] for index in range(-min(newer, len(self._events)), 0)]
+
+    def register_camera(self, device_id, ip_address, last_seen):
+        with self._lock:
+            self._cameras[device_id] = {"ip_address": ip_address, "last_seen": last_seen}
+
+    def get_camera(self, device_id):
+        with self._lock:
+            camera = self._cameras.get(device_id)
+            return dict(camera) if camera else None
+
+    def cameras(self):
+        with self._lock:
+            return {device_id: dict(camera) for device_id, camera in self._cameras.items()}
+
+    def claim_camera_ticket(self, ticket, is_current, keep):
+        with self._lock:
+            latest = self._tickets.get(self._latest_tickets.get(ticket["camera_device_id"]))
+            if latest and is_current(latest):
+                latest["deduplicated"] += 1
+                return dict(latest)
+
+            self._tickets[ticket["id"]] = dict(ticket)
+            self._latest_tickets[ticket["camera_device_id"]] = ticket["id"]
+            while len(self._tickets) > keep:
+                self._tickets.popitem(last=False)
+            return dict(ticket)
+
+    def update_camera_ticket(self, ticket_id, fields):
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            if ticket:
+                ticket.update(fields)
+
+    def get_camera_ticket(self, ticket_id):
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            return dict(ticket) if ticket else None
+
+
+class SQLiteStateBackend(StateBackend):
+    """State in a local SQLite file in WAL mode, shared by every worker process on the host.
+
+    Window updates run in a single ``BEGIN IMMEDIATE`` transaction, so concurrent
+    workers never interleave within one device's window. The threshold config carries
+    a version number; workers keep a cached copy and re-read it only when the version moves.
+    Latest readings are upserted only when newer, so workers writing in any order agree.
+    Live feed events go to an append-only table that every worker's feed polls, and
+    each worker with subscribers keeps a heartbeat row so publishers can skip the
+    write when nobody is listening.
+    """
+
+    PURGE_EVERY = 1000  # pushes between idle-device sweeps
+
+    def __init__(self, path, ttl=3600):
+        self.path = os.path.abspath(path)
+        self.ttl = ttl
+        self._local = threading.local()
+        self._cache_lock = threading.Lock()
+        self._cached_thresholds = None
+        self._pushes = 0
+
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS threshold_config (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, document TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS readings (
+                device_id TEXT NOT NULL, ts REAL NOT NULL, temperature REAL NOT NULL,
+                humidity REAL NOT NULL DEFAULT 0, pressure REAL NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS ix_readings_device_ts ON readings (device_id, ts);
+            CREATE TABLE IF NOT EXISTS devices (device_id TEXT PRIMARY KEY, last_seen REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS cameras (device_id TEXT PRIMARY KEY, ip_address TEXT NOT NULL, last_seen TEXT);
+            CREATE TABLE IF NOT EXISTS latest_readings (
+                device_id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, id INTEGER NOT NULL, reading TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS latest_complete (id INTEGER PRIMARY KEY CHECK (id = 1));
+            CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS feed_workers (worker_id TEXT PRIMARY KEY, subscribers_seen REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS camera_tickets (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE,
+                camera_device_id TEXT NOT NULL, ticket TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_camera_tickets_camera_seq ON camera_tickets (camera_device_id, seq);
+        """)
+        conn.execute(
+            "INSERT OR IGNORE INTO threshold_config (id, version, document) VALUES (1, 1, ?)",
+            (json.dumps(default_threshold_config()),)
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_thresholds(self):
+        conn = self._conn()
+        version = conn.execute("SELECT version FROM threshold_config WHERE id = 1").fetchone()[0]
+
+        with self._cache_lock:
+            cached = self._cached_thresholds
+            if cached is not None and cached["version"] == version:
+                return copy.deepcopy(cached)
+
+        version, document = conn.execute("SELECT version, document FROM threshold_config WHERE id = 1").fetchone()
+        thresholds = dict(default_threshold_config(), **json.loads(document), version=version)
+
+        with self._cache_lock:
+            self._cached_thresholds = thresholds
+        return copy.deepcopy(thresholds)
+
+    def update_thresholds(self, changes, device_id=None, group=None, devices=None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            document = json.loads(conn.execute("SELECT document FROM threshold_config WHERE id = 1").fetchone()[0])
+            document = apply_threshold_changes(dict(default_threshold_config(), **document), changes, device_id, group, devices)
+            conn.execute(
+                "UPDATE threshold_config SET version = version + 1, document = ? WHERE id = 1",
+                (json.dumps(document),)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get_thresholds()
+
+    def push_reading(self, device_id, timestamp, temperature, window, humidity=0.0, pressure=0.0):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            newest = conn.execute("SELECT MAX(ts) FROM readings WHERE device_id = ?", (device_id,)).fetchone()[0]
+            if newest is not None and timestamp < newest - window:
+                conn.execute("COMMIT")
+                return None
+            newest = timestamp if newest is None else max(newest, timestamp)
+            conn.execute("DELETE FROM readings WHERE device_id = ? AND ts < ?", (device_id, newest - window))
+            prev_count, sum_h, sum_p, sum_pp = conn.execute(
+                "SELECT COUNT(*), TOTAL(humidity), TOTAL(pressure), TOTAL(pressure * pressure) FROM readings WHERE device_id = ?",
+                (device_id,)
+            ).fetchone()
+            conn.execute(
+                "INSERT INTO readings (device_id, ts, temperature, humidity, pressure) VALUES (?, ?, ?, ?, ?)",
+                (device_id, timestamp, temperature, humidity, pressure)
+            )
+            # Times relative to the new reading keep the regression sums small
+            count, temp_min, temp_max, sum_t, sum_tt, sum_y, sum_ty = conn.execute(
+                "SELECT COUNT(*), MIN(temperature), MAX(temperature), TOTAL(ts - :t), TOTAL((ts - :t) * (ts - :t)), "
+                "TOTAL(temperature), TOTAL((ts - :t) * temperature) FROM readings WHERE device_id = :d",
+                {"t": timestamp, "d": device_id}
+            ).fetchone()
+            conn.execute(
+                "INSERT INTO devices (device_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(device_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (device_id, now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._pushes += 1
+        if self._pushes % self.PURGE_EVERY == 0:
+            self._purge_idle(now)
+
+        temp_slope = 0.0
+        sxx = sum_tt - sum_t * sum_t / count
+        if count >= 2 and sxx > 1e-9:
+            temp_slope = (sum_ty - sum_t * sum_y / count) / sxx
+
+        humidity_mean = pressure_mean = pressure_std = 0.0
+        if prev_count:
+            humidity_mean = sum_h / prev_count
+            pressure_mean = sum_p / prev_count
+            pressure_std = math.sqrt(max(sum_pp / prev_count - pressure_mean * pressure_mean, 0.0))
+
+        return WindowStats(count, temp_min, temp_max, temp_slope, prev_count, humidity_mean, pressure_mean, pressure_std)
+
+    def window_snapshot(self, device_id):
+        rows = self._conn().execute(
+            "SELECT ts, temperature, humidity, pressure FROM readings WHERE device_id = ? ORDER BY ts",
+            (device_id,)
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def _purge_idle(self, now):
+        conn = self._conn()
+        cutoff = now - self.ttl
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM readings WHERE device_id IN (SELECT device_id FROM devices WHERE last_seen < ?)", (cutoff,))
+            conn.execute("DELETE FROM devices WHERE last_seen < ?", (cutoff,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update_latest(self, readings):
+        # ISO timestamps of naive UTC datetimes sort as text in time order
+        newest = newest_per_device(readings)
+        if not newest:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO latest_readings (device_id, timestamp, id, reading) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(device_id) DO UPDATE SET timestamp = excluded.timestamp, id = excluded.id, reading = excluded.reading "
+                "WHERE (excluded.timestamp, excluded.id) > (latest_readings.timestamp, latest_readings.id)",
+                [(reading["device_id"], reading["timestamp"], reading["id"], json.dumps(reading)) for reading in newest.values()]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def fill_latest(self, readings):
+        self.update_latest(readings)
+        self._conn().execute("INSERT OR IGNORE INTO latest_complete (id) VALUES (1)")
+
+    def get_latest(self, device_ids=None):
+        conn = self._conn()
+        if device_ids is None:
+            if not conn.execute("SELECT 1 FROM latest_complete").fetchone():
+                return None
+            rows = conn.execute("SELECT device_id, reading FROM latest_readings").fetchall()
+        else:
+            device_ids = list(device_ids)
+            rows = conn.execute(
+                f"SELECT device_id, reading FROM latest_readings WHERE device_id IN ({', '.join('?' * len(device_ids))})",
+                device_ids
+            ).fetchall() if device_ids else []
+        return {device_id: json.loads(reading) for device_id, reading in rows}
+
+    def publish_events(self, events):
+        if not events:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO events (event) VALUES (?)", [(json.dumps(event),) for event in events])
+            conn.execute(
+                "DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?",
+                (self.EVENT_RETENTION,)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def last_event_id(self):
+        return self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def touch_subscribers(self, worker_id):
+        self._conn().execute(
+            "INSERT INTO feed_workers (worker_id, subscribers_seen) VALUES (?, ?) "
+            "ON CONFLICT(worker_id) DO UPDATE SET subscribers_seen = excluded.subscribers_seen",
+            (worker_id, time.time())
+        )
+
+    def has_subscribers(self, within):
+        row = self._conn().execute(
+            "SELECT 1 FROM feed_workers WHERE subscribers_seen >= ? LIMIT 1", (time.time() - within,)
+        ).fetchone()
+        return row is not None
+
+    def events_after(self, event_id, timeout=0.0):
+        query = "SELECT id, event FROM events WHERE id > ? ORDER BY id"
+        rows = self._conn().execute(query, (event_id,)).fetchall()
+        if not rows and timeout:
+            # Other workers' events only show up by polling
+            time.sleep(timeout)
+            rows = self._conn().execute(query, (event_id,)).fetchall()
+        return [(row_id, json.loads(event)) for row_id, event in rows]
+
+    def register_camera(self, device_id, ip_address, last_seen):
+        self._conn().execute(
+            "INSERT INTO cameras (device_id, ip_address, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(device_id) DO UPDATE SET ip_address = excluded.ip_address, last_seen = excluded.last_seen",
+            (device_id, ip_address, last_seen)
+        )
+
+    def get_camera(self, device_id):
+        row = self._conn().execute("SELECT ip_address, last_seen FROM cameras WHERE device_id = ?", (device_id,)).fetchone()
+        if not row:
+            return None
+        return {"ip_address": row[0], "last_seen": row[1]}
+
+    def cameras(self):
+        rows = self._conn().execute("SELECT device_id, ip_address, last_seen FROM cameras").fetchall()
+        return {device_id: {"ip_address": ip_address, "last_seen": last_seen} for device_id, ip_address, last_seen in rows}
+
+    def claim_camera_ticket(self, ticket, is_current, keep):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT ticket FROM camera_tickets WHERE camera_device_id = ? ORDER BY seq DESC LIMIT 1",
+                (ticket["camera_device_id"],)
+            ).fetchone()
+            latest = json.loads(row[0]) if row else None
+            if latest and is_current(latest):
+                latest["deduplicated"] += 1
+                conn.execute("UPDATE camera_tickets SET ticket = ? WHERE id = ?", (json.dumps(latest), latest["id"]))
+                conn.execute("COMMIT")
+                return latest
+
+            conn.execute(
+                "INSERT INTO camera_tickets (id, camera_device_id, ticket) VALUES (?, ?, ?)",
+                (ticket["id"], ticket["camera_device_id"], json.dumps(ticket))
+            )
+            conn.execute("DELETE FROM camera_tickets WHERE seq <= (SELECT MAX(seq) FROM camera_tickets) - ?", (keep,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return dict(ticket)
+
+    def update_camera_ticket(self, ticket_id, fields):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT ticket FROM camera_tickets WHERE id = ?", (ticket_id,)).fetchone()
+            if row:
+                ticket = json.loads(row[0])
+                ticket.update(fields)
+                conn.execute("UPDATE camera_tickets SET ticket = ? WHERE id = ?", (json.dumps(ticket), ticket_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_camera_ticket(self, ticket_id):
+        row = self._conn().execute("SELECT ticket FROM camera_tickets WHERE id = ?", (ticket_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def create_state_backend(app):
+    backend = app.config['HAZARD_STATE_BACKEND']
+    if backend == "memory":
+        return MemoryStateBackend(ttl=app.config['DEVICE_IDLE_TTL'])
+    if backend == "sqlite":
+        return SQLiteStateBackend(app.config['HAZARD_STATE_PATH'], ttl=app.config['DEVICE_IDLE_TTL'])
+    raise ValueError(f"Unknown hazard state backend: {backend}")
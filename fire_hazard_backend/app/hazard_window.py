@@ -0,0 +1,185 @@
+from collections import deque, namedtuple, OrderedDict
+import math
+import threading
+import time
+
+# Statistics for one device window once a reading has been added.
+# count/temp_* cover the window including the new reading. prev_count, humidity_mean,
+# pressure_mean and pressure_std describe the readings before it, which serve as the
+# baseline for the new humidity and pressure values.
+WindowStats = namedtuple(
+    "WindowStats",
+    "count temp_min temp_max temp_slope prev_count humidity_mean pressure_mean pressure_std"
+)
+
+REBASE_WINDOWS = 4  # rebase time sums once readings drift this many windows from the origin
+
+
+class RollingWindow:
+    """Readings for one device over the last ``window`` seconds.
+
+    Eviction pops from the left, so each reading is appended and removed once
+    (amortized O(1)). Two monotonic deques keep the window minimum and maximum at
+    their heads, so neither needs a scan. Running sums give the temperature
+    regression slope and the humidity/pressure baselines in O(1). Times in the sums
+    are offsets from ``_origin``, which is rebased from time to time to keep them
+    small and precise.
+
+    Readings may arrive late. One more than ``window`` seconds older than the newest
+    reading is ignored. A later one is kept as if it arrived with the newest reading,
+    so readings still leave the window in arrival order.
+    """
+
+    __slots__ = (
+        "readings", "_min", "_max", "newest", "last_seen",
+        "_origin", "_st", "_stt", "_sy", "_sty", "_sh", "_sp", "_spp"
+    )
+
+    def __init__(self):
+        self.readings = deque()  # (timestamp, temperature, humidity, pressure) in arrival order
+        self._min = deque()  # increasing temperatures
+        self._max = deque()  # decreasing temperatures
+        self.newest = None  # newest timestamp in the window
+        self.last_seen = 0.0
+        self._origin = None
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self._st = self._stt = self._sy = self._sty = 0.0
+        self._sh = self._sp = self._spp = 0.0
+
+    def _add_sums(self, reading, sign):
+        t = reading[0] - self._origin
+        temperature, humidity, pressure = reading[1], reading[2], reading[3]
+        self._st += sign * t
+        self._stt += sign * t * t
+        self._sy += sign * temperature
+        self._sty += sign * t * temperature
+        self._sh += sign * humidity
+        self._sp += sign * pressure
+        self._spp += sign * pressure * pressure
+
+    def _rebase(self, origin):
+        self._origin = origin
+        self._reset_sums()
+        for reading in self.readings:
+            self._add_sums(reading, 1)
+
+    def push(self, timestamp, temperature, window, humidity=0.0, pressure=0.0):
+        """Add a reading, drop readings older than ``window`` seconds and return WindowStats.
+
+        Returns None, without adding it, for a reading already outside the window.
+        """
+        if self.readings and timestamp < self.newest - window:
+            return None
+        newest = timestamp if not self.readings else max(self.newest, timestamp)
+        self.evict(newest - window)
+
+        prev_count = len(self.readings)
+        humidity_mean = pressure_mean = pressure_std = 0.0
+        if prev_count:
+            humidity_mean = self._sh / prev_count
+            pressure_mean = self._sp / prev_count
+            pressure_std = math.sqrt(max(self._spp / prev_count - pressure_mean * pressure_mean, 0.0))
+
+        if self._origin is None or not self.readings or timestamp - self._origin > REBASE_WINDOWS * max(window, 1):
+            self._rebase(self.readings[0][0] if self.readings else timestamp)
+
+        reading = (timestamp, temperature, humidity, pressure)
+        self.readings.append(reading)
+        self._add_sums(reading, 1)
+        self.newest = newest
+
+        # The monotonic deques are keyed by arrival time, so they evict in the same order as readings
+        entry = (newest, temperature)
+        while self._min and self._min[-1][1] >= temperature:
+            self._min.pop()
+        self._min.append(entry)
+
+        while self._max and self._max[-1][1] <= temperature:
+            self._max.pop()
+        self._max.append(entry)
+
+        return WindowStats(
+            len(self.readings), self.min, self.max, self.slope(),
+            prev_count, humidity_mean, pressure_mean, pressure_std
+        )
+
+    def evict(self, cutoff):
+        """Drop readings that arrived before ``cutoff``."""
+        readings, lows, highs = self.readings, self._min, self._max
+        while readings and readings[0][0] < cutoff:
+            self._add_sums(readings.popleft(), -1)
+        while lows and lows[0][0] < cutoff:
+            lows.popleft()
+        while highs and highs[0][0] < cutoff:
+            highs.popleft()
+
+    def slope(self):
+        """Least-squares temperature slope in degrees per second, 0 with fewer than two readings."""
+        n = len(self.readings)
+        if n < 2:
+            return 0.0
+        sxx = self._stt - self._st * self._st / n
+        if sxx <= 1e-9:
+            return 0.0
+        return (self._sty - self._st * self._sy / n) / sxx
+
+    def __len__(self):
+        return len(self.readings)
+
+    @property
+    def oldest(self):
+        return self.readings[0][1]
+
+    @property
+    def min(self):
+        return self._min[0][1]
+
+    @property
+    def max(self):
+        return self._max[0][1]
+
+
+class WindowRegistry:
+    """Per-device rolling windows. Devices that have not reported for ``ttl`` seconds are dropped."""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._windows = OrderedDict()  # device_id -> RollingWindow, least recently seen first
+        self._lock = threading.Lock()
+
+    def push(self, device_id, timestamp, temperature, window, humidity=0.0, pressure=0.0):
+        """Add a reading and return the WindowStats for the device's window, or None if it was too late."""
+        now = time.monotonic()
+        with self._lock:
+            rolling = self._windows.pop(device_id, None)
+            if rolling is None:
+                rolling = RollingWindow()
+            self._windows[device_id] = rolling
+            rolling.last_seen = now
+
+            stats = rolling.push(timestamp, temperature, window, humidity, pressure)
+            self._expire(now)
+            return stats
+
+    def snapshot(self, device_id):
+        """Return the device's current readings as a list of (timestamp, temperature, humidity, pressure)."""
+        with self._lock:
+            rolling = self._windows.get(device_id)
+            return list(rolling.readings) if rolling else []
+
+    def _expire(self, now):
+        # Least recently seen devices sit at the front, so this stops at the first live one
+        cutoff = now - self.ttl
+        while self._windows:
+            device_id, rolling = next(iter(self._windows.items()))
+            if rolling.last_seen >= cutoff:
+                break
+            del self._windows[device_id]
+
+    def __len__(self):
+        return len(self._windows)
+
+    def __contains__(self, device_id):
+        return device_id in self._windows
@@ -0,0 +1,119 @@
+from flask import current_app
+from app import db
+from app.models import SensorData
+from app.rollups import record_readings
+import datetime
+
+MAX_BATCH_SIZE = 1000
+
+REQUIRED_FIELDS = ("temperature", "humidity", "pressure")
+
+MAX_DEVICE_ID_LENGTH = 50  # sensor_data.device_id is String(50)
+
+
+def parse_timestamp(value):
+    """Turn a device sample timestamp (epoch seconds or ISO-8601) into a naive UTC datetime.
+
+    Raises ValueError on bad or out of range input, so callers can answer 400.
+    """
+    if value is None:
+        return datetime.datetime.utcnow()
+
+    if isinstance(value, bool):
+        raise ValueError("Invalid timestamp")
+
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc).replace(tzinfo=None)
+        except (OverflowError, OSError) as e:
+            raise ValueError("Timestamp out of range") from e
+
+    if isinstance(value, str):
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return parsed
+
+    raise ValueError("Invalid timestamp")
+
+
+def to_epoch(date_created):
+    # date_created is stored as naive UTC
+    return date_created.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def parse_device_id(value):
+    """Check a device id fits sensor_data.device_id. Raises ValueError otherwise."""
+    if not isinstance(value, str) or not value:
+        raise ValueError("device_id must be a non-empty string")
+    if len(value) > MAX_DEVICE_ID_LENGTH:
+        raise ValueError(f"device_id longer than {MAX_DEVICE_ID_LENGTH} characters")
+    return value
+
+
+def parse_reading(item, default_device_id="unknown_device"):
+    """Validate one reading and return the row to insert. Raises ValueError on bad input."""
+    if not isinstance(item, dict):
+        raise ValueError("Reading must be an object")
+
+    missing = [field for field in REQUIRED_FIELDS if field not in item]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+
+    # One bad device_id would fail the whole multi-row INSERT, so it is rejected per reading
+    device_id = item.get("device_id")
+    row = {
+        "device_id": default_device_id if device_id is None else parse_device_id(device_id),
+        "date_created": parse_timestamp(item.get("timestamp")),
+    }
+    for field in REQUIRED_FIELDS:
+        value = item[field]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Invalid {field}")
+        row[field] = float(value)
+
+    return row
+
+
+def format_reading(row_id, row):
+    """The JSON shape of a stored reading, as served by /api/sensor/latest."""
+    return {
+        "id": row_id,
+        "device_id": row["device_id"],
+        "temperature": row["temperature"],
+        "humidity": row["humidity"],
+        "pressure": row["pressure"],
+        "timestamp": row["date_created"].isoformat()
+    }
+
+
+def publish_readings(ids, rows):
+    """Write committed readings through to the latest-reading cache and the live feed.
+
+    Failures are logged rather than raised: the readings are already stored, and an
+    error here would make the caller report a failed write.
+    """
+    try:
+        readings = [format_reading(row_id, row) for row_id, row in zip(ids, rows)]
+        current_app.extensions['hazard_state'].update_latest(readings)
+        current_app.extensions['live_feed'].publish([
+            {"type": "reading", "device_id": reading["device_id"], "data": reading} for reading in readings
+        ])
+    except Exception as e:
+        current_app.logger.error(f"Publishing {len(rows)} stored readings failed: {e}")
+
+
+def insert_readings(rows):
+    """Write readings with a single multi-row INSERT and return their ids in input order."""
+    if not rows:
+        return []
+
+    # A Core insert on the table skips the ORM's per-row bookkeeping
+    table = SensorData.__table__
+    stmt = db.insert(table).returning(table.c.id, sort_by_parameter_order=True)
+    ids = list(db.session.execute(stmt, rows).scalars())
+    # Rollups are updated in the same transaction so they never disagree with sensor_data
+    record_readings(rows)
+    db.session.commit()
+    publish_readings(ids, rows)
+    return ids
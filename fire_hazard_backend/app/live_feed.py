@@ -0,0 +1,248 @@
+import collections
+import json
+import os
+import threading
+import time
+
+EVENT_TYPES = ("reading", "hazard", "image")
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscriber:
+    """One /api/stream client: its filters, a bounded queue and the events to replay first."""
+
+    def __init__(self, device_ids=None, types=None, queue_size=100):
+        self.device_ids = frozenset(device_ids) if device_ids else None
+        self.types = frozenset(types) if types else None
+        self.queue_size = queue_size
+        self.backlog = []
+        self.position = 0
+        self.dropped = False
+        self._pending = collections.deque()
+        self._ready = threading.Condition(threading.Lock())
+
+    def wants(self, event):
+        if self.types is not None and event["type"] not in self.types:
+            return False
+        return self.device_ids is None or event["device_id"] in self.device_ids
+
+    def offer(self, events):
+        """Queue ``(id, event)`` pairs the subscriber has not seen, oldest first.
+
+        Returns False, queuing nothing, when they do not fit and the subscriber should be dropped.
+        """
+        if events and events[0][0] <= self.position:
+            events = [item for item in events if item[0] > self.position]
+        if not events:
+            return True
+
+        with self._ready:
+            if len(self._pending) + len(events) > self.queue_size:
+                return False
+            self._pending.extend(events)
+            self.position = events[-1][0]
+            self._ready.notify()
+        return True
+
+    def drop(self):
+        with self._ready:
+            self.dropped = True
+            self._ready.notify()
+
+    def take(self, timeout):
+        """Wait up to ``timeout`` seconds and return every queued event, possibly none."""
+        with self._ready:
+            if not self._pending and not self.dropped:
+                self._ready.wait(timeout)
+            events = list(self._pending)
+            self._pending.clear()
+            return events
+
+
+class LiveFeed:
+    """Fans out new readings, hazard events and image ids to /api/stream subscribers.
+
+    Events are published through the hazard state backend, so with the sqlite backend
+    every worker sees every other worker's events. Each worker runs one thread that
+    tails the backend and copies events into the subscribers' bounded queues; a
+    subscriber whose queue fills up is dropped and can resume with Last-Event-ID.
+    Idle subscribers only wait on their queue, so under gevent they cost a greenlet each.
+
+    Publishing is skipped while no worker has had a subscriber for SUBSCRIBER_GRACE
+    seconds, so ingest pays for the event write only when someone is listening. The
+    grace period keeps events flowing for clients that reconnect with Last-Event-ID.
+    """
+
+    HEARTBEAT_INTERVAL = 5.0  # seconds between a worker's "has subscribers" heartbeats
+    SUBSCRIBER_GRACE = 30.0  # seconds events keep being published after the last subscriber
+
+    def __init__(self, app, state, queue_size=100, max_subscribers=10000, poll_interval=0.5):
+        self.app = app
+        self.state = state
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        # Subscribers following every device, and the rest indexed by the devices they follow
+        self._all_devices = set()
+        self._by_device = {}
+        self._count = 0
+        self._position = None
+        self._thread = None
+        self._heartbeat = 0.0
+        self._stats = {"published": 0, "skipped": 0, "dropped_subscribers": 0}
+
+    def publish(self, events):
+        """Publish ``{"type", "device_id", "data"}`` events to every worker's subscribers."""
+        if not events:
+            return
+        listening = self.state.has_subscribers(self.SUBSCRIBER_GRACE)
+        if listening:
+            self.state.publish_events(events)
+        with self._lock:
+            self._stats["published" if listening else "skipped"] += len(events)
+
+    def subscribe(self, device_ids=None, types=None, last_event_id=None):
+        subscriber = Subscriber(device_ids, types, self.queue_size)
+        # Before the position is read, so no publisher skips an event this subscriber should see
+        self._touch()
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers("Too many live feed subscribers")
+            # Started on first use, so forked workers each get their own tail thread
+            if self._thread is None:
+                self._position = self.state.last_event_id()
+                self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+                self._thread.start()
+
+            # Replay and the tail thread both hold the lock, so nothing is sent twice or skipped
+            subscriber.position = self._position
+            if last_event_id is not None and last_event_id < self._position:
+                subscriber.backlog = [
+                    (event_id, event) for event_id, event in self.state.events_after(last_event_id)
+                    if event_id <= self._position and subscriber.wants(event)
+                ]
+
+            if subscriber.device_ids is None:
+                self._all_devices.add(subscriber)
+            else:
+                for device_id in subscriber.device_ids:
+                    self._by_device.setdefault(device_id, set()).add(subscriber)
+            self._count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._remove(subscriber)
+
+    def _remove(self, subscriber):
+        if subscriber.device_ids is None:
+            if subscriber not in self._all_devices:
+                return
+            self._all_devices.discard(subscriber)
+        else:
+            removed = False
+            for device_id in subscriber.device_ids:
+                followers = self._by_device.get(device_id)
+                if followers and subscriber in followers:
+                    removed = True
+                    followers.discard(subscriber)
+                    if not followers:
+                        del self._by_device[device_id]
+            if not removed:
+                return
+        self._count -= 1
+
+    def _touch(self):
+        self.state.touch_subscribers(str(os.getpid()))
+        self._heartbeat = time.monotonic()
+
+    def _run(self):
+        while True:
+            if self._count and time.monotonic() - self._heartbeat >= self.HEARTBEAT_INTERVAL:
+                try:
+                    self._touch()
+                except Exception as e:
+                    self.app.logger.error(f"Live feed heartbeat failed: {e}")
+
+            try:
+                events = self.state.events_after(self._position, timeout=self.poll_interval)
+            except Exception as e:
+                self.app.logger.error(f"Live feed poll failed: {e}")
+                events = []
+                time.sleep(self.poll_interval)
+
+            if events:
+                with self._lock:
+                    self._deliver(events)
+                    self._position = events[-1][0]
+
+    def _deliver(self, events):
+        """Hand each subscriber its share of ``events`` in one offer.
+
+        Subscribers with the same filters get the same list, so the work per poll grows
+        with the number of subscribers rather than subscribers times events.
+        """
+        by_device = {}
+        for item in events:
+            by_device.setdefault(item[1]["device_id"], []).append(item)
+
+        shares = {}
+        for subscriber in self._all_devices:
+            shares[subscriber] = events
+        for device_id, device_events in by_device.items():
+            for subscriber in self._by_device.get(device_id, ()):
+                if subscriber in shares:
+                    # Following several devices that all had events: merge back into id order
+                    shares[subscriber] = sorted(shares[subscriber] + device_events, key=lambda item: item[0])
+                else:
+                    shares[subscriber] = device_events
+
+        filtered = {}
+        dropped = []
+        for subscriber, share in shares.items():
+            if subscriber.types is not None:
+                key = (id(share), subscriber.types)
+                if key not in filtered:
+                    filtered[key] = [item for item in share if item[1]["type"] in subscriber.types]
+                share = filtered[key]
+            if not subscriber.offer(share):
+                dropped.append(subscriber)
+
+        for subscriber in dropped:
+            subscriber.drop()
+            self._remove(subscriber)
+        self._stats["dropped_subscribers"] += len(dropped)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._stats, subscribers=self._count, queue_size=self.queue_size)
+
+
+def format_event(event_id, event):
+    return f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def event_stream(feed, subscriber, keepalive=15.0):
+    """SSE body for one subscriber: its backlog, then live events, with comment keepalives."""
+    try:
+        yield "retry: 2000\n\n"
+        if subscriber.backlog:
+            yield "".join(format_event(event_id, event) for event_id, event in subscriber.backlog)
+        subscriber.backlog = []
+
+        while not subscriber.dropped:
+            events = subscriber.take(keepalive)
+            if events:
+                yield "".join(format_event(event_id, event) for event_id, event in events)
+            elif not subscriber.dropped:
+                yield ": keepalive\n\n"
+
+        # The client reconnects with Last-Event-ID and replays what it missed
+        yield "event: dropped\ndata: {}\n\n"
+    finally:
+        feed.unsubscribe(subscriber)
@@ -8,22 +8,64 @@ class SensorData(db.Model):
     temperature = db.Column(db.Float, nullable=False)
     humidity = db.Column(db.Float, nullable=False)
     pressure = db.Column(db.Float, nullable=False)
-    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        # Serves the device filter + newest-first ordering of the sensor list and latest endpoints
+        db.Index('ix_sensor_data_device_id_date_created', 'device_id', db.text('date_created DESC')),
+    )
 
     def __repr__(self):
         return f"SensorData(Device: '{self.device_id}', '{self.temperature}C', '{self.humidity}%', '{self.pressure}hPa', '{self.date_created}')"
 
 
+class SensorRollup(db.Model):
+    """Per-device min/max/sum/count of the sensor readings in one time bucket."""
+    __tablename__ = 'sensor_rollup'
+    bucket_seconds = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(50), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    temperature_min = db.Column(db.Float, nullable=False)
+    temperature_max = db.Column(db.Float, nullable=False)
+    temperature_sum = db.Column(db.Float, nullable=False)
+    humidity_min = db.Column(db.Float, nullable=False)
+    humidity_max = db.Column(db.Float, nullable=False)
+    humidity_sum = db.Column(db.Float, nullable=False)
+    pressure_min = db.Column(db.Float, nullable=False)
+    pressure_max = db.Column(db.Float, nullable=False)
+    pressure_sum = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        # Aggregates across all devices; the primary key serves the per-device case
+        db.Index('ix_sensor_rollup_bucket_seconds_bucket_start', 'bucket_seconds', 'bucket_start'),
+    )
+
+    def __repr__(self):
+        return f"SensorRollup(Device: '{self.device_id}', '{self.bucket_seconds}s', '{self.bucket_start}', '{self.count}')"
+
+
 class ImageData(db.Model):
     __tablename__ = 'image_data'
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.String(50), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     filepath = db.Column(db.String(255), nullable=False)
-    image_binary = db.Column(db.LargeBinary, nullable=False)
-    sensor_data_id = db.Column(db.Integer, db.ForeignKey('sensor_data.id'), nullable=True)
+    # Legacy inline storage. New images live in the blob store and only keep content_hash/size here.
+    # Deferred so metadata queries never pull the JPEG bytes; undefer explicitly when serving the image
+    image_binary = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
+    size = db.Column(db.Integer, nullable=True)
+    sensor_data_id = db.Column(db.Integer, db.ForeignKey('sensor_data.id'), nullable=True, index=True)
     is_fire_hazard = db.Column(db.Boolean, default=False)
+    # Frames uploaded together by a burst capture share a burst_id and are ordered by burst_index
+    burst_id = db.Column(db.String(32), nullable=True, index=True)
+    burst_index = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_image_data_device_id_is_fire_hazard_timestamp', 'device_id', 'is_fire_hazard', db.text('timestamp DESC')),
+    )
     # Define relationship with SensorData
     sensor_data = db.relationship('SensorData', backref=db.backref('images', lazy=True))
 
@@ -0,0 +1,94 @@
+from flask import request, jsonify, url_for
+from app import db
+from app.ingest import parse_timestamp
+import base64
+import json
+
+MAX_PAGE_SIZE = 500
+
+
+def parse_time_arg(value):
+    """Query string time as epoch seconds or ISO-8601, naive UTC. Missing means now.
+
+    Raises ValueError on malformed or out of range times.
+    """
+    if not value:
+        return parse_timestamp(None)
+    try:
+        seconds = float(value)
+    except ValueError:
+        return parse_timestamp(value)
+    return parse_timestamp(seconds)
+
+
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the (timestamp, id) a cursor points after. Raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return parse_timestamp(timestamp), int(row_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def page_args():
+    """Read ``limit``, ``cursor``, ``from`` and ``to`` from the query string. Raises ValueError on bad input."""
+    limit = request.args.get('limit', default=10, type=int)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    cursor = request.args.get('cursor')
+    return {
+        "limit": min(limit, MAX_PAGE_SIZE),
+        "after": decode_cursor(cursor) if cursor else None,
+        "start": parse_time_arg(request.args['from']) if request.args.get('from') else None,
+        "end": parse_time_arg(request.args['to']) if request.args.get('to') else None
+    }
+
+
+def keyset_query(query, time_column, id_column, after=None, start=None, end=None):
+    """Restrict a query ordered by (time, id) descending to rows past ``after`` and inside [start, end).
+
+    Rows are selected by seeking past the previous page's last (time, id) instead of
+    using an offset, so every page costs the same as the first. The condition is
+    written as ``time <= t AND (time < t OR id < i)`` so the time indexes stay usable.
+    """
+    if start is not None:
+        query = query.filter(time_column >= start)
+    if end is not None:
+        query = query.filter(time_column < end)
+    if after is not None:
+        timestamp, row_id = after
+        query = query.filter(time_column <= timestamp, db.or_(time_column < timestamp, id_column < row_id))
+    return query
+
+
+def keyset_page(query, time_column, id_column, limit, after=None, start=None, end=None):
+    """One newest-first page of ``query``. Returns ``(rows, next_cursor)``; next_cursor is None on the last page."""
+    query = keyset_query(query, time_column, id_column, after, start, end)
+
+    # One extra row tells whether another page exists
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
+
+
+def paginated_response(items, next_cursor):
+    """JSON array response with the next page in ``X-Next-Cursor`` and a ``Link: rel="next"`` header."""
+    response = jsonify(items)
+    if next_cursor:
+        args = request.args.to_dict()
+        args["cursor"] = next_cursor
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{url_for(request.endpoint, _external=True, **args)}>; rel="next"'
+    return response
+
@@ -0,0 +1,129 @@
+from app.hazard_rules import HazardEngine, resolve_thresholds
+from app.models import SensorData
+from app.archive import SensorArchive, from_micros
+from collections import Counter
+import numpy as np
+import sqlalchemy as sa
+
+_engines = {}  # database url -> Engine, one per worker process
+
+
+def _engine(database_url):
+    # Engines are never shared across a fork; each worker process opens its own
+    engine = _engines.get(database_url)
+    if engine is None:
+        engine = sa.create_engine(database_url, poolclass=sa.pool.NullPool)
+        _engines[database_url] = engine
+    return engine
+
+
+def device_ids(database_url, start=None, end=None):
+    """Distinct device ids with readings in the range."""
+    table = SensorData.__table__
+    query = sa.select(table.c.device_id).distinct().order_by(table.c.device_id)
+    query = _time_filter(query, start, end)
+    with _engine(database_url).connect() as conn:
+        return conn.execute(query).scalars().all()
+
+
+def _time_filter(query, start, end):
+    table = SensorData.__table__
+    if start is not None:
+        query = query.where(table.c.date_created >= start)
+    if end is not None:
+        query = query.where(table.c.date_created < end)
+    return query
+
+
+def _device_chunks(database_url, device_id, start, end, chunk_size, archive_root=None):
+    """Yield (ts, temperature, humidity, pressure) arrays for one device oldest first, archive then sensor_data."""
+    table = SensorData.__table__
+    query = (
+        sa.select(table.c.date_created, table.c.temperature, table.c.humidity, table.c.pressure)
+        .where(table.c.device_id == device_id)
+        .order_by(table.c.date_created)
+    )
+    query = _time_filter(query, start, end)
+
+    if archive_root:
+        archive = SensorArchive(archive_root)
+        manifest = archive.manifest()
+        if manifest["before"] is not None and (start is None or start < manifest["before"]):
+            cold_end = manifest["before"] if end is None else min(end, manifest["before"])
+            columns = ("ts", "temperature", "humidity", "pressure")
+            for _, arrays in archive.iter_chunks(device_id, start, cold_end, columns, chunk_size):
+                yield arrays["ts"] / 1e6, arrays["temperature"], arrays["humidity"], arrays["pressure"]
+
+        hot = archive.hot_condition(manifest)
+        if hot is not None:
+            query = query.where(hot)
+
+    with _engine(database_url).connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for chunk in result.partitions():
+            dates, temperature, humidity, pressure = zip(*chunk)
+            # date_created is naive UTC
+            ts = np.array(dates, dtype="datetime64[us]").astype(np.int64) / 1e6
+            yield ts, np.array(temperature), np.array(humidity), np.array(pressure)
+
+
+def replay_device(database_url, device_id, config, rule_names=None, start=None, end=None, chunk_size=5000, max_hits=20,
+                  archive_root=None):
+    """Run one device's stored readings through the hazard engine in time order.
+
+    Readings are streamed from the archive and a server-side cursor and evaluated one
+    chunk at a time. The tail of each chunk that is still inside the window seeds the
+    next one, so the result matches evaluating every reading in sequence while memory
+    stays bounded by the chunk size.
+    """
+    engine_rules = HazardEngine(rule_names)
+    thresholds = resolve_thresholds(config, device_id)
+    window = thresholds["temp_window"]
+
+    readings = 0
+    first_ts = first_alert_ts = None
+    by_rule = Counter()
+    hits = []
+    history = []
+
+    for ts, temperature, humidity, pressure in _device_chunks(database_url, device_id, start, end, chunk_size, archive_root):
+        if first_ts is None:
+            first_ts = ts[0]
+
+        alerts = engine_rules.evaluate_batch(
+            [device_id] * len(ts), ts, temperature, humidity, pressure,
+            lambda _: thresholds, history={device_id: history}
+        )
+
+        for index, alert in enumerate(alerts):
+            if alert is None:
+                continue
+            by_rule[alert.rule] += 1
+            if first_alert_ts is None:
+                first_alert_ts = ts[index]
+            if len(hits) < max_hits:
+                hits.append({
+                    "timestamp": from_micros(round(ts[index] * 1e6)).isoformat(),
+                    "rule": alert.rule,
+                    "risk": alert.risk,
+                    "message": alert.message
+                })
+
+        readings += len(ts)
+        # Earlier history can still be inside the window when a chunk spans less than one window
+        cutoff = ts[-1] - window
+        history = [reading for reading in history if reading[0] >= cutoff]
+        history.extend(
+            (ts[i].item(), temperature[i].item(), humidity[i].item(), pressure[i].item())
+            for i in np.flatnonzero(ts >= cutoff)
+        )
+
+    return {
+        "device_id": device_id,
+        "readings": readings,
+        "alerts": sum(by_rule.values()),
+        "alerts_by_rule": dict(by_rule),
+        # Seconds from the device's first replayed reading to its first alert
+        "first_alert_latency": None if first_alert_ts is None else round(float(first_alert_ts - first_ts), 3),
+        "hits": hits
+    }
@@ -0,0 +1,167 @@
+from flask import current_app
+from app import db
+from app.models import SensorRollup
+import datetime
+import numpy as np
+
+BUCKETS = {"1m": 60, "5m": 300, "1h": 3600}
+
+FIELDS = ("temperature", "humidity", "pressure")
+
+MAX_AGGREGATE_BUCKETS = 5000  # per /api/sensor/aggregate response
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def bucket_start(date_created, bucket_seconds):
+    """Start of the bucket holding ``date_created``, as naive UTC like the stored readings."""
+    seconds = int((date_created - EPOCH).total_seconds())
+    return EPOCH + datetime.timedelta(seconds=seconds - seconds % bucket_seconds)
+
+
+def aggregate_rows(rows):
+    """Fold reading rows into rollup values keyed by (bucket_seconds, device_id, bucket_start)."""
+    rollups = {}
+    for row in rows:
+        for bucket_seconds in BUCKETS.values():
+            key = (bucket_seconds, row["device_id"], bucket_start(row["date_created"], bucket_seconds))
+            values = rollups.get(key)
+            if values is None:
+                values = rollups[key] = {
+                    "bucket_seconds": key[0], "device_id": key[1], "bucket_start": key[2], "count": 0
+                }
+                for field in FIELDS:
+                    values[f"{field}_min"] = values[f"{field}_max"] = row[field]
+                    values[f"{field}_sum"] = 0.0
+
+            values["count"] += 1
+            for field in FIELDS:
+                value = row[field]
+                values[f"{field}_sum"] += value
+                if value < values[f"{field}_min"]:
+                    values[f"{field}_min"] = value
+                if value > values[f"{field}_max"]:
+                    values[f"{field}_max"] = value
+    return rollups
+
+
+def aggregate_arrays(device_ids, ts, columns):
+    """Like aggregate_rows for column arrays. ``ts`` is microseconds since the epoch and
+    ``columns`` maps each of FIELDS to an array of values."""
+    rollups = {}
+    if not len(ts):
+        return rollups
+
+    devices, device_codes = np.unique(np.asarray(device_ids, dtype=object).astype(str), return_inverse=True)
+    for bucket_seconds in BUCKETS.values():
+        starts = ts // 1_000_000 // bucket_seconds * bucket_seconds
+        order = np.lexsort((starts, device_codes))
+        codes, starts = device_codes[order], starts[order]
+        # First row of every (device, bucket) group
+        firsts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (starts[1:] != starts[:-1])])
+        counts = np.diff(np.r_[firsts, len(order)])
+
+        reduced = {}
+        for field in FIELDS:
+            values = np.asarray(columns[field])[order]
+            reduced[f"{field}_min"] = np.minimum.reduceat(values, firsts).tolist()
+            reduced[f"{field}_max"] = np.maximum.reduceat(values, firsts).tolist()
+            reduced[f"{field}_sum"] = np.add.reduceat(values, firsts).tolist()
+
+        for group, first in enumerate(firsts.tolist()):
+            values = {
+                "bucket_seconds": bucket_seconds,
+                "device_id": str(devices[codes[first]]),
+                "bucket_start": EPOCH + datetime.timedelta(seconds=int(starts[first])),
+                "count": int(counts[group])
+            }
+            values.update((name, column[group]) for name, column in reduced.items())
+            rollups[(bucket_seconds, values["device_id"], values["bucket_start"])] = values
+    return rollups
+
+
+ARRAY_AGGREGATE_ROWS = 256  # batches at least this large are aggregated with numpy
+
+
+def upsert_rollups(rows):
+    """Add reading rows to their rollup buckets in the current transaction."""
+    if len(rows) < ARRAY_AGGREGATE_ROWS:
+        write_rollups(aggregate_rows(rows))
+        return
+
+    microsecond = datetime.timedelta(microseconds=1)
+    ts = np.fromiter(((row["date_created"] - EPOCH) // microsecond for row in rows), dtype=np.int64, count=len(rows))
+    columns = {field: np.fromiter((row[field] for row in rows), dtype=np.float64, count=len(rows)) for field in FIELDS}
+    write_rollups(aggregate_arrays([row["device_id"] for row in rows], ts, columns))
+
+
+def write_rollups(rollups):
+    """Upsert pre-aggregated rollup values, adding to any existing buckets.
+
+    Each bucket is written once per call, and in key order so concurrent ingests lock
+    buckets in the same order.
+    """
+    if not rollups:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        least, greatest = db.func.least, db.func.greatest
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        least, greatest = db.func.min, db.func.max
+    else:
+        raise RuntimeError(f"Sensor rollups are not supported on {dialect}")
+
+    # One statement executed with many parameter sets compiles once and is cached.
+    # With ON CONFLICT, SQLAlchemy only sends the sets as multi-row VALUES pages when
+    # the statement has RETURNING, otherwise psycopg2 makes one round trip per row.
+    table = SensorRollup.__table__
+    stmt = insert(table)
+    excluded = stmt.excluded
+    changes = {"count": table.c.count + excluded.count}
+    for field in FIELDS:
+        changes[f"{field}_min"] = least(table.c[f"{field}_min"], excluded[f"{field}_min"])
+        changes[f"{field}_max"] = greatest(table.c[f"{field}_max"], excluded[f"{field}_max"])
+        changes[f"{field}_sum"] = table.c[f"{field}_sum"] + excluded[f"{field}_sum"]
+    stmt = stmt.on_conflict_do_update(index_elements=list(table.primary_key.columns), set_=changes)
+    stmt = stmt.returning(table.c.bucket_seconds)
+
+    db.session.execute(stmt, [rollups[key] for key in sorted(rollups)])
+
+
+def record_readings(rows):
+    """Ingest hook. Skipped when SENSOR_ROLLUPS is off and `flask rollups rebuild` runs on a schedule instead."""
+    if current_app.config['SENSOR_ROLLUPS']:
+        upsert_rollups(rows)
+
+
+def rollup_query(bucket_seconds, start, end, device_id=None):
+    """Buckets in [start, end) oldest first, merged across devices unless ``device_id`` is given."""
+    columns = [SensorRollup.bucket_start, db.func.sum(SensorRollup.count).label("count")]
+    for field in FIELDS:
+        columns.append(db.func.min(getattr(SensorRollup, f"{field}_min")).label(f"{field}_min"))
+        columns.append(db.func.max(getattr(SensorRollup, f"{field}_max")).label(f"{field}_max"))
+        columns.append(db.func.sum(getattr(SensorRollup, f"{field}_sum")).label(f"{field}_sum"))
+
+    query = db.session.query(*columns).filter(
+        SensorRollup.bucket_seconds == bucket_seconds,
+        SensorRollup.bucket_start >= start,
+        SensorRollup.bucket_start < end
+    )
+    if device_id:
+        query = query.filter(SensorRollup.device_id == device_id)
+
+    return query.group_by(SensorRollup.bucket_start).order_by(SensorRollup.bucket_start)
+
+
+def format_bucket(row):
+    bucket = {"start": row.bucket_start.isoformat(), "count": row.count}
+    for field in FIELDS:
+        bucket[field] = {
+            "min": getattr(row, f"{field}_min"),
+            "max": getattr(row, f"{field}_max"),
+            "avg": getattr(row, f"{field}_sum") / row.count
+        }
+    return bucket
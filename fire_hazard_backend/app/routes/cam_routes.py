@@ -4,66 +4,133 @@ from flask_cors import CORS
 import os
 import datetime
 import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from app import db
 from app.models import ImageData, SensorData
+from app.camera_client import CameraUnavailable
+from app.blob_store import BlobTooLarge
+from app.pagination import keyset_page, page_args, paginated_response
 import base64
+import hashlib
 import io
 
 
 cam_bp = Blueprint('cam_bp', __name__)
 
-UPLOAD_FOLDER = 'static/uploads'
 
-camera_registery = {}
+def camera_registery():
+    # Shared with the other worker processes through the hazard state backend
+    return current_app.extensions['hazard_state']
 
-def ensure_upload_folder_exists():
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
+
+RAW_IMAGE_MIMETYPES = ('application/octet-stream', 'image/jpeg')
+
+
+def _parse_flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def _raw_upload_metadata():
+    """Metadata for raw uploads comes from X- headers, falling back to query params."""
+    return {
+        'device_id': request.headers.get('X-Device-Id') or request.args.get('device_id'),
+        'sensor_data_id': request.headers.get('X-Sensor-Data-Id') or request.args.get('sensor_data_id'),
+        'is_fire_hazard': request.headers.get('X-Fire-Hazard') or request.args.get('is_fire_hazard')
+    }
+
+
+def _parse_sensor_data_id(value):
+    """Validate an optional sensor_data_id. Raises ValueError if malformed, LookupError if unknown."""
+    if not value:
+        return None
+    sensor_data_id = int(value)
+    if not db.session.get(SensorData, sensor_data_id):
+        raise LookupError("Sensor data not found")
+    return sensor_data_id
+
+
+def _image_filename(device_id, is_fire_hazard, suffix):
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    prefix = "fire_hazard_" if is_fire_hazard else "normal_"
+    return f"{prefix}{device_id}_{timestamp}_{suffix}.jpg"
+
+
+def image_event(image):
+    """Live feed event for a stored image."""
+    data = {
+        "id": image.id,
+        "device_id": image.device_id,
+        "sensor_data_id": image.sensor_data_id,
+        "is_fire_hazard": image.is_fire_hazard,
+        "timestamp": image.timestamp.isoformat()
+    }
+    if image.burst_id:
+        data["burst_id"] = image.burst_id
+        data["burst_index"] = image.burst_index
+    return {"type": "image", "device_id": image.device_id, "data": data}
 
 
 @cam_bp.route('/api/cam', methods=['POST'])
 def receive_cam_data():
-    if not request.is_json:
+    # Accepted bodies: JSON with a base64 image, a raw JPEG body with metadata in
+    # headers/query params, or multipart/form-data with an "image" file part.
+    blob_store = current_app.extensions['blob_store']
+    max_size = current_app.config['IMAGE_MAX_BYTES']
+
+    if request.is_json:
+        data = request.get_json()
+        image_data = data.get('image')  # Base64 encoded image
+        if not image_data:
+            return jsonify({"error": "No image data provided"}), 400
+        try:
+            image_stream = io.BytesIO(base64.b64decode(image_data, validate=True))
+        except ValueError:
+            return jsonify({"error": "Invalid base64 image data"}), 400
+    elif request.mimetype in RAW_IMAGE_MIMETYPES:
+        data = _raw_upload_metadata()
+        if request.content_length == 0:
+            return jsonify({"error": "No image data provided"}), 400
+        # Streamed straight from the socket into the blob store, never held whole in memory
+        image_stream = request.stream
+    elif request.mimetype == 'multipart/form-data':
+        data = request.form
+        upload = request.files.get('image')
+        if not upload:
+            return jsonify({"error": "No image data provided"}), 400
+        image_stream = upload.stream
+    else:
         return jsonify({"error": "Invalid data format"}), 400
-    
-    data = request.get_json()
 
     sensor_data_id = data.get('sensor_data_id')
-    device_id = data.get('device_id', 'unknown_device')  # Get device ID or use default
-    image_data = data.get('image')  # Base64 encoded image
-    is_fire_hazard = data.get('is_fire_hazard', False)  # Optional field
+    device_id = data.get('device_id') or 'unknown_device'  # Get device ID or use default
+    is_fire_hazard = _parse_flag(data.get('is_fire_hazard', False))  # Optional field
 
-    if not image_data:
-        return jsonify({"error": "No image data provided"}), 400
-    
     try:
-        if sensor_data_id:
-            sensor_data = SensorData.query.get(sensor_data_id)
-            if not sensor_data:
-                return jsonify({"error": "Sensor data not found"}), 404
-            
-
-        ensure_upload_folder_exists()
-
-        device_dir = os.path.join(UPLOAD_FOLDER, device_id)
-        if not os.path.exists(device_dir):
-            os.makedirs(device_dir)
+        sensor_data_id = _parse_sensor_data_id(sensor_data_id)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError:
+        return jsonify({"error": "Invalid sensor_data_id"}), 400
 
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        prefix = "fire_hazard_" if is_fire_hazard else "normal_"
-        filename = f"{prefix}{device_id}_{timestamp}_{uuid.uuid4().hex[:8]}.jpg"
-        filepath = os.path.join(device_dir, filename)
+    try:
+        filename = _image_filename(device_id, is_fire_hazard, uuid.uuid4().hex[:8])
 
-        image_bytes = base64.b64decode(image_data)
-        with open(filepath, 'wb') as image_file:
-            image_file.write(image_bytes)
+        # Bytes go to the content-addressed blob store only; the row keeps hash, size and path
+        try:
+            content_hash, size = blob_store.put_stream(image_stream, max_size=max_size)
+        except BlobTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        
         new_image = ImageData(
             device_id=device_id,
             filename=filename,
-            filepath=filepath,
-            image_binary=image_bytes,
+            filepath=blob_store.path(content_hash) or content_hash,
+            content_hash=content_hash,
+            size=size,
             sensor_data_id=sensor_data_id,
             is_fire_hazard=is_fire_hazard
         )
@@ -71,13 +138,143 @@ def receive_cam_data():
         db.session.add(new_image)
         db.session.commit()
 
+        current_app.extensions['live_feed'].publish([image_event(new_image)])
+
+        # Hazard frames are what the dashboard grid shows first, so render their variants up front
+        thumbnails = current_app.extensions['thumbnails']
+        if is_fire_hazard and thumbnails.available and blob_store.path(content_hash):
+            thumbnails.pregenerate(content_hash, blob_store.path(content_hash))
+
         return jsonify({"message": "Image stored successfully!", "image_id": new_image.id}), 201
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error storing image: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@cam_bp.route('/api/cam/burst', methods=['POST'])
+def receive_cam_burst():
+    # multipart/form-data with device_id, is_fire_hazard and sensor_data_id fields and one
+    # "image" file part per frame, in capture order. All frames are stored or none are.
+    if request.mimetype != 'multipart/form-data':
+        return jsonify({"error": "Invalid data format"}), 400
+
+    blob_store = current_app.extensions['blob_store']
+    max_size = current_app.config['IMAGE_MAX_BYTES']
+    max_frames = current_app.config['IMAGE_BURST_MAX_FRAMES']
+
+    frames = request.files.getlist('image')
+    if not frames:
+        return jsonify({"error": "No image data provided"}), 400
+    if len(frames) > max_frames:
+        return jsonify({"error": f"A burst holds at most {max_frames} frames"}), 400
+
+    device_id = request.form.get('device_id') or 'unknown_device'
+    is_fire_hazard = _parse_flag(request.form.get('is_fire_hazard', False))
+
+    try:
+        sensor_data_id = _parse_sensor_data_id(request.form.get('sensor_data_id'))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError:
+        return jsonify({"error": "Invalid sensor_data_id"}), 400
+
+    try:
+        burst_id = uuid.uuid4().hex
+        images = []
+        for burst_index, frame in enumerate(frames):
+            # Blobs are content-addressed, so frames left behind by a failed burst are harmless
+            try:
+                content_hash, size = blob_store.put_stream(frame.stream, max_size=max_size)
+            except BlobTooLarge as e:
+                return jsonify({"error": str(e)}), 413
+            except ValueError as e:
+                return jsonify({"error": f"Frame {burst_index}: {e}"}), 400
+
+            images.append(ImageData(
+                device_id=device_id,
+                filename=_image_filename(device_id, is_fire_hazard, f"{burst_id[:8]}_{burst_index}"),
+                filepath=blob_store.path(content_hash) or content_hash,
+                content_hash=content_hash,
+                size=size,
+                sensor_data_id=sensor_data_id,
+                is_fire_hazard=is_fire_hazard,
+                burst_id=burst_id,
+                burst_index=burst_index
+            ))
+
+        db.session.add_all(images)
+        db.session.commit()
+
+        current_app.extensions['live_feed'].publish([image_event(image) for image in images])
+
+        thumbnails = current_app.extensions['thumbnails']
+        if is_fire_hazard and thumbnails.available:
+            for image in images:
+                if blob_store.path(image.content_hash):
+                    thumbnails.pregenerate(image.content_hash, blob_store.path(image.content_hash))
+
+        return jsonify({
+            "message": "Burst stored successfully!",
+            "burst_id": burst_id,
+            "image_ids": [image.id for image in images]
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error storing burst: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@cam_bp.route('/api/cam/burst/<burst_id>', methods=['GET'])
+def get_burst(burst_id):
+    images = ImageData.query.options(db.load_only(*IMAGE_METADATA_COLUMNS, ImageData.size)).filter_by(burst_id=burst_id) \
+        .order_by(ImageData.burst_index).all()
+    if not images:
+        return jsonify({"error": "Burst not found"}), 404
+
+    return jsonify({
+        "burst_id": burst_id,
+        "device_id": images[0].device_id,
+        "is_fire_hazard": images[0].is_fire_hazard,
+        "frames": [{
+            "id": image.id,
+            "burst_index": image.burst_index,
+            "timestamp": image.timestamp.isoformat(),
+            "filename": image.filename,
+            "size": image.size
+        } for image in images]
+    }), 200
     
 
+def image_list_query(device_id=None, sensor_data_id=None, is_fire_hazard=None):
+    """Newest-first images with the optional list filters applied."""
+    query = ImageData.query
+
+    if device_id:
+        query = query.filter_by(device_id=device_id)
+
+    if sensor_data_id:
+        query = query.filter_by(sensor_data_id=sensor_data_id)
+
+    if is_fire_hazard is not None:
+        query = query.filter_by(is_fire_hazard=is_fire_hazard)
+
+    return query.order_by(ImageData.timestamp.desc(), ImageData.id.desc())
+
+
+IMAGE_METADATA_COLUMNS = (
+    ImageData.id,
+    ImageData.device_id,
+    ImageData.sensor_data_id,
+    ImageData.timestamp,
+    ImageData.filename,
+    ImageData.filepath,
+    ImageData.is_fire_hazard,
+    ImageData.burst_id,
+    ImageData.burst_index
+)
+
+
 @cam_bp.route('/api/cam', methods=['GET'])
 def get_images():
     try:
@@ -85,23 +282,16 @@ def get_images():
         device_id = request.args.get('device_id')
         sensor_data_id = request.args.get('sensor_data_id')
         is_fire_hazard = request.args.get('is_fire_hazard', type=bool)
-        limit = request.args.get('limit', default=10, type=int)
-        
-        # Build query
-        query = ImageData.query
-        
-        # Apply filters
-        if device_id:
-            query = query.filter_by(device_id=device_id)
-        
-        if sensor_data_id:
-            query = query.filter_by(sensor_data_id=sensor_data_id)
-
-        if is_fire_hazard is not None:
-            query = query.filter_by(is_fire_hazard=is_fire_hazard)
+        try:
+            args = page_args()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Execute query
-        images = query.order_by(ImageData.timestamp.desc()).limit(limit).all()
+        images, next_cursor = keyset_page(
+            image_list_query(device_id, sensor_data_id, is_fire_hazard).options(db.load_only(*IMAGE_METADATA_COLUMNS)),
+            ImageData.timestamp, ImageData.id, **args
+        )
         
         # Format response
         result = []
@@ -113,10 +303,12 @@ def get_images():
                 "timestamp": image.timestamp.isoformat(),
                 "filename": image.filename,
                 "filepath": image.filepath,
-                "is_fire_hazard": getattr(image, 'is_fire_hazard', False)
+                "is_fire_hazard": getattr(image, 'is_fire_hazard', False),
+                "burst_id": image.burst_id,
+                "burst_index": image.burst_index
             })
         
-        return jsonify(result)
+        return paginated_response(result, next_cursor)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -133,10 +325,7 @@ def register_camera():
     if not device_id or not ip_address:
         return jsonify({"error": "Device ID and IP address are required"}), 400
     
-    camera_registery[device_id] = {
-        "ip_address": ip_address,
-        "last_seen": datetime.datetime.now().isoformat()
-    }
+    camera_registery().register_camera(device_id, ip_address, datetime.datetime.now().isoformat())
 
     return jsonify({"message": "Camera registered successfully!", "device_id": device_id, "ip_address": ip_address}), 201
 
@@ -145,8 +334,9 @@ def register_camera():
 def get_camera_info():
     device_id = request.args.get('device_id', 'camera_device_1')
     
-    if device_id in camera_registery:
-        return jsonify(camera_registery[device_id]), 200
+    camera = camera_registery().get_camera(device_id)
+    if camera:
+        return jsonify(camera), 200
     else:
         return jsonify({"error": "Device not found"}), 404
     
@@ -161,18 +351,17 @@ def trigger_camera():
     reason = data.get('reason')
     cam_device_id = data.get('camera_device_id', 'camera_device_1')
     
-    if cam_device_id not in camera_registery:
+    camera = camera_registery().get_camera(cam_device_id)
+    if not camera:
         return jsonify({"error": "Camera device not found"}), 404
     
-    camera_ip = camera_registery[cam_device_id]['ip_address']
+    camera_ip = camera['ip_address']
 
-    try:
-        import requests
+    camera_client = current_app.extensions['camera_client']
+    path = '/firehazard' if reason == 'fire_hazard' else '/capture'
 
-        if reason == 'fire_hazard':
-            response = requests.post(f'http://{camera_ip}/firehazard')
-        else:
-            response = requests.post(f'http://{camera_ip}/capture')
+    try:
+        response = camera_client.request(cam_device_id, camera_ip, path)
         
         if response.status_code == 200:
             return jsonify({"message": "Camera triggered successfully!", "camera_response": response.text}), 200
@@ -182,31 +371,108 @@ def trigger_camera():
                 "status_code": response.status_code,
                 "response": response.text
             }), 500
+    except CameraUnavailable as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Failed to trigger camera: {str(e)}"}), 500
-    
+
+
+@cam_bp.route('/api/cameras/breakers', methods=['GET'])
+def get_camera_breakers():
+    return jsonify(current_app.extensions['camera_client'].breaker_states()), 200
+
+
+@cam_bp.route('/api/trigger_camera/<ticket_id>', methods=['GET'])
+def get_trigger_ticket(ticket_id):
+    ticket = current_app.extensions['camera_dispatcher'].get_ticket(ticket_id)
+    if not ticket:
+        return jsonify({"error": "Trigger ticket not found"}), 404
+
+    return jsonify(ticket), 200
+
 @cam_bp.route('/api/test_registry', methods=['GET'])
 def test_registry():
-    print("Camera Registry:", camera_registery)
-    return jsonify(camera_registery), 200
+    cameras = camera_registery().cameras()
+    print("Camera Registry:", cameras)
+    return jsonify(cameras), 200
+
+def send_image_file(path_or_file, download_name, etag=True):
+    """Send a stored image with Range support, If-None-Match handling and long-lived caching.
+
+    Stored images never change once written, so they are marked immutable. Files on
+    disk go through the WSGI file wrapper (sendfile) or X-Sendfile when enabled.
+    """
+    response = send_file(
+        path_or_file,
+        mimetype='image/jpeg',
+        as_attachment=False,
+        download_name=download_name,
+        conditional=True,
+        etag=etag,
+        max_age=current_app.config['IMAGE_CACHE_MAX_AGE']
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def send_thumbnail(digest, source, width, download_name):
+    """Send the ``width`` variant of an image, rendering it from ``source`` (see ThumbnailCache.get) if needed."""
+    thumbnails = current_app.extensions['thumbnails']
+    if not thumbnails.available:
+        return jsonify({"error": "Thumbnails are not available on this server"}), 501
+    try:
+        variant_path = thumbnails.get(digest, source, width, timeout=current_app.config['THUMBNAIL_TIMEOUT'])
+    except FutureTimeoutError:
+        return jsonify({"error": "Thumbnail is still being generated"}), 503, {"Retry-After": "1"}
+    return send_image_file(variant_path, download_name, etag=f"{digest}-w{width}")
+
+
+def read_blob(blob_store, digest):
+    with blob_store.open(digest) as f:
+        return f.read()
+
 
 @cam_bp.route('/api/cam/<int:image_id>', methods=['GET'])
 def get_image(image_id):
     try:
-        image = ImageData.query.get(image_id)
+        image = db.session.get(ImageData, image_id)
         if not image:
             return jsonify({"error": "Image not found"}), 404
         
-        if image.image_binary:
-            return send_file(
-                io.BytesIO(image.image_binary),
-                mimetype='image/jpeg',
-                as_attachment=False,
-                download_name=image.filename
+        width = request.args.get('w', type=int)
+        thumbnails = current_app.extensions['thumbnails']
+        if width is not None and width not in thumbnails.widths:
+            return jsonify({"error": f"Unsupported width, use one of {list(thumbnails.widths)}"}), 400
+
+        # A requested width is never answered with the full-size image
+        blob_store = current_app.extensions['blob_store']
+        if image.content_hash and blob_store.exists(image.content_hash):
+            # The content hash is a natural strong ETag
+            blob_path = blob_store.path(image.content_hash)
+
+            if width is not None:
+                digest = image.content_hash
+                return send_thumbnail(digest, blob_path or (lambda: read_blob(blob_store, digest)), width, image.filename)
+
+            return send_image_file(
+                blob_path if blob_path else blob_store.open(image.content_hash),
+                image.filename,
+                etag=image.content_hash
             )
+        elif image.image_binary:
+            # Legacy inline bytes, loaded only on this path
+            image_binary = image.image_binary
+            digest = hashlib.sha256(image_binary).hexdigest()
+            if width is not None:
+                return send_thumbnail(digest, lambda: image_binary, width, image.filename)
+
+            return send_image_file(io.BytesIO(image_binary), image.filename, etag=digest)
         elif image.filepath and os.path.exists(image.filepath):
-            return send_file(image.filepath, mimetype='image/jpeg', as_attachment=False, download_name=image.filename)
+            if width is not None:
+                return jsonify({"error": "No thumbnail for this image"}), 404
+            return send_image_file(os.path.abspath(image.filepath), image.filename)
         else:
             return jsonify({"error": "Image file not found"}), 404
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
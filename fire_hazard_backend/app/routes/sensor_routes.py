@@ -1,16 +1,130 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from app import db
 from app.models import SensorData
+from app.ingest import MAX_BATCH_SIZE, parse_device_id, parse_reading, insert_readings, publish_readings, format_reading, to_epoch
+from app.export import EXPORT_FORMATS, stream_readings, ndjson_chunks, csv_chunks, gzip_chunks
+from app.pagination import keyset_page, page_args, paginated_response, parse_time_arg
+from app.rollups import BUCKETS, MAX_AGGREGATE_BUCKETS, bucket_start, record_readings, rollup_query, format_bucket
+from app.write_behind import BufferClosed, BufferFull
+from app.hazard_rules import DEFAULT_THRESHOLDS, resolve_thresholds
 import datetime
-import requests
 
 sensor_bp = Blueprint('sensor_bp', __name__)
 
-TEMP_THRESHOLD = 35.0
-TEMP_RISE_THRESHOLD = 5.0
-TEMP_WINDOW = 60  # seconds
 
-temp_history = {}
+def hazard_state():
+    # Thresholds and device windows live in a state backend so every worker process sees the same values
+    return current_app.extensions['hazard_state']
+
+def evaluate_fire_hazard(device_id, temperature, current_time, thresholds=None, humidity=0.0, pressure=0.0):
+    """Record a reading in the device's window and return the hazard Alert, or None."""
+    state = hazard_state()
+    if thresholds is None:
+        thresholds = state.get_thresholds()
+    device_thresholds = resolve_thresholds(thresholds, device_id)
+
+    stats = state.push_reading(device_id, current_time, temperature, device_thresholds["temp_window"], humidity, pressure)
+    if stats is None:
+        # Too late to count towards the window
+        return None
+    return current_app.extensions['hazard_engine'].evaluate(stats, temperature, humidity, pressure, device_thresholds)
+
+
+def alert_fields(alert):
+    return {
+        "fire_hazard": True,
+        "fire_hazard_reason": alert.message,
+        "fire_hazard_rule": alert.rule,
+        "fire_hazard_risk": alert.risk
+    }
+
+
+def hazard_event(device_id, alert, date_created, sensor_data_id=None):
+    """Live feed event for a hazard alert."""
+    return {
+        "type": "hazard",
+        "device_id": device_id,
+        "data": {
+            "device_id": device_id,
+            "sensor_data_id": sensor_data_id,
+            "rule": alert.rule,
+            "risk": alert.risk,
+            "message": alert.message,
+            "timestamp": date_created.isoformat()
+        }
+    }
+
+
+def trigger_camera_for_hazard(device_id):
+    """Queue a fire hazard capture and return the response fields describing the trigger ticket."""
+    dispatcher = current_app.extensions['camera_dispatcher']
+    ticket = dispatcher.dispatch(device_id, current_app.config['DEFAULT_CAMERA_DEVICE_ID'])
+    return {
+        "camera_trigger_ticket": ticket["id"],
+        "camera_trigger_status": ticket["status"]
+    }
+
+
+def evaluate_batch_hazards(rows):
+    """Return the hazard Alert, or None, for each of a batch of stored rows.
+
+    Hazard evaluation runs over the rows in one vectorized pass, using each device's
+    own sample times for its window. Each device's current window seeds the pass,
+    then the new readings are pushed so later requests see them. Only readings that
+    stay inside the window after the device's newest one, in the batch or already in
+    its window, are pushed; the rest are too late to count.
+    """
+    state = hazard_state()
+    thresholds = state.get_thresholds()
+    device_thresholds = {}
+    for row in rows:
+        if row["device_id"] not in device_thresholds:
+            device_thresholds[row["device_id"]] = resolve_thresholds(thresholds, row["device_id"])
+
+    history = {device_id: state.window_snapshot(device_id) for device_id in device_thresholds}
+    timestamps = [to_epoch(row["date_created"]) for row in rows]
+    alerts = current_app.extensions['hazard_engine'].evaluate_batch(
+        [row["device_id"] for row in rows],
+        timestamps,
+        [row["temperature"] for row in rows],
+        [row["humidity"] for row in rows],
+        [row["pressure"] for row in rows],
+        device_thresholds.__getitem__,
+        history=history
+    )
+
+    # A late or resent batch can be older than what the device's window already holds
+    newest = {device_id: max(reading[0] for reading in readings) for device_id, readings in history.items() if readings}
+    for row, timestamp in zip(rows, timestamps):
+        if timestamp > newest.get(row["device_id"], float("-inf")):
+            newest[row["device_id"]] = timestamp
+
+    for row, timestamp in sorted(zip(rows, timestamps), key=lambda item: item[1]):
+        if timestamp < newest[row["device_id"]] - device_thresholds[row["device_id"]]["temp_window"]:
+            continue
+        state.push_reading(
+            row["device_id"], timestamp, row["temperature"],
+            device_thresholds[row["device_id"]]["temp_window"], row["humidity"], row["pressure"]
+        )
+    return alerts
+
+
+def report_batch_hazards(rows, ids, alerts):
+    """Publish the batch's hazard events and trigger one camera per device that raised one.
+
+    Returns the trigger fields keyed by device id.
+    """
+    hazard_devices = []
+    hazard_events = []
+    for row, sensor_data_id, alert in zip(rows, ids, alerts):
+        if alert:
+            hazard_events.append(hazard_event(row["device_id"], alert, row["date_created"], sensor_data_id))
+            if row["device_id"] not in hazard_devices:
+                hazard_devices.append(row["device_id"])
+    current_app.extensions['live_feed'].publish(hazard_events)
+
+    return {device_id: trigger_camera_for_hazard(device_id) for device_id in hazard_devices}
+
 
 @sensor_bp.route('/api/sensor', methods=['POST'])
 def recieve_sensor_data():
@@ -20,124 +134,162 @@ def recieve_sensor_data():
         if not data or "temperature" not in data or "humidity" not in data or "pressure" not in data:
             return jsonify({"error": "Invalid data"}), 400
         
-        device_id = data.get("device_id", "unknown_device")
-        temperature = data["temperature"]
-
-        # Store Data in Neon SQL
-        sensor_entry = SensorData(
-            device_id = device_id,
-            temperature=data["temperature"],
-            humidity=data["humidity"],
-            pressure=data["pressure"]
+        try:
+            row = parse_reading(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        device_id = row["device_id"]
+
+        write_behind = current_app.extensions.get('sensor_write_behind')
+        if write_behind:
+            # Queued rows are committed in groups by the write-behind thread
+            try:
+                write_behind.submit(row)
+            except (BufferFull, BufferClosed) as e:
+                return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
+            response_data = {"message": "Data queued for storage", "queued": True}
+            status_code = 202
+        else:
+            # Store Data in Neon SQL
+            sensor_entry = SensorData(**row)
+            db.session.add(sensor_entry)
+            record_readings([row])
+            db.session.commit()
+            publish_readings([sensor_entry.id], [row])
+
+            response_data = {
+                "message": "Data stored successfully!",
+                "sensor_data_id": sensor_entry.id
+            }
+            status_code = 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    # The reading is stored or queued, so a hazard failure must not answer 5xx and get it resent
+    try:
+        # Sample time, as on the batch path, so a device's window follows one clock
+        alert = evaluate_fire_hazard(
+            device_id, row["temperature"], to_epoch(row["date_created"]),
+            humidity=row["humidity"], pressure=row["pressure"]
         )
-        db.session.add(sensor_entry)
-        db.session.commit()
 
-        current_time = datetime.datetime.now().timestamp()
-        if device_id not in temp_history:
-            temp_history[device_id] = []
+        if alert:
+            response_data.update(alert_fields(alert))
+            response_data.update(trigger_camera_for_hazard(device_id))
+            current_app.extensions['live_feed'].publish([
+                hazard_event(device_id, alert, row["date_created"], response_data.get("sensor_data_id"))
+            ])
+    except Exception as e:
+        current_app.logger.error(f"Hazard evaluation of a stored reading from {device_id} failed: {e}")
+        response_data["hazard_error"] = str(e)
+
+    return jsonify(response_data), status_code
 
-        temp_history[device_id].append((current_time, temperature))
 
-        temp_history[device_id] = [
-            reading for reading in temp_history[device_id]
-            if current_time - reading[0] <= TEMP_WINDOW
-        ]
+@sensor_bp.route('/api/sensor/batch', methods=['POST'])
+def recieve_sensor_batch():
+    data = request.get_json(silent=True)
+    readings = data.get("readings") if isinstance(data, dict) else data
 
-        fire_hazard = False
-        fire_hazard_reason = None
+    if not isinstance(readings, list) or not readings:
+        return jsonify({"error": "Expected a non-empty array of readings"}), 400
 
-        if temperature >= TEMP_THRESHOLD:
-            fire_hazard = True
-            fire_hazard_reason = f"Temperature above threshold: {temperature}C >= {TEMP_THRESHOLD}C"
-            
+    if len(readings) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large, max {MAX_BATCH_SIZE} readings"}), 413
 
-        if len(temp_history[device_id]) >= 2:
-            oldest_temp = temp_history[device_id][0][1]
-            if temperature - oldest_temp >= TEMP_RISE_THRESHOLD:
-                fire_hazard = True
-                fire_hazard_reason = f"Rapid temperature rise: {oldest_temp}C -> {temperature}C in {TEMP_WINDOW} seconds"
+    # Readings without their own device_id belong to the batch's device_id
+    default_device_id = data.get("device_id") if isinstance(data, dict) else None
+    try:
+        default_device_id = "unknown_device" if default_device_id is None else parse_device_id(default_device_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        response_data = {
-            "message": "Data stored successfully!",
-            "sensor_data_id": sensor_entry.id
-        }
+    results = []
+    rows = []
+    for index, item in enumerate(readings):
+        try:
+            rows.append(parse_reading(item, default_device_id))
+            results.append({"index": index})
+        except ValueError as e:
+            results.append({"index": index, "error": str(e)})
 
-        if fire_hazard:
-            response_data["fire_hazard"] = True
-            response_data["fire_hazard_reason"] = fire_hazard_reason
+    if not rows:
+        return jsonify({"error": "No valid readings", "results": results}), 400
 
-            try:
-                camera_response = requests.get("http://192.168.26.112:5000/api/devices/camera")
-                if camera_response.status_code == 200:
-                    camera_info = camera_response.json()
-                    camera_ip = camera_info.get("ip_address")
-
-                    if camera_ip:
-                        try:
-                            fire_response = requests.get(f"http://{camera_ip}/firehazard", timeout=5)
-                            if fire_response.status_code == 200:
-                                response_data["camera_response"] = fire_response.text
-                                response_data["camera_triggered"] = "direct"
-                            else:
-                                trigger_response = requests.post(
-                                    "http://192.168.26.112:5000/api/trigger_camera",
-                                    json={
-                                        "device_id": device_id,
-                                        "reason": "fire_hazard",
-                                        "camera_device_id": camera_info.get("device_id")
-                                    },
-                                    headers={"Content-Type": "application/json"},
-                                    timeout=5
-                                )
-                                response_data["camera_triggered"] = "server"
-                                response_data["camera_response"] = trigger_response.text
-                        except:
-                            trigger_response = requests.post(
-                                    "http://192.168.26.112:5000/api/trigger_camera",
-                                    json={
-                                        "device_id": device_id,
-                                        "reason": "fire_hazard",
-                                        "camera_device_id": camera_info.get("device_id")
-                                    },
-                                    headers={"Content-Type": "application/json"},
-                                    timeout=5
-                                )
-                            response_data["camera_triggered"] = "server_fallback"
-                            response_data["camera_response"] = trigger_response.text
-                    else:
-                        trigger_response = requests.post(
-                                    "http://192.168.26.112:5000/api/trigger_camera",
-                                    json={
-                                        "device_id": device_id,
-                                        "reason": "fire_hazard",
-                                        "camera_device_id": camera_info.get("device_id")
-                                    },
-                                    headers={"Content-Type": "application/json"},
-                                    timeout=5
-                                )
-                        response_data["camera_triggered"] = "server_only"
-                        response_data["camera_response"] = trigger_response.text
-            except Exception as e:
-                response_data["camera_triggered_error"] = str(e)
-
-        return jsonify(response_data), 201
+    try:
+        ids = insert_readings(rows)
     except Exception as e:
+        db.session.rollback()
         return jsonify({"error": str(e)}), 500
+
+    # The rows are committed from here on. Answering 5xx would make devices resend the
+    # batch and store it twice, so a hazard failure is reported alongside the stored ids
+    alerts = [None] * len(rows)
+    camera = {}
+    hazard_error = None
+    try:
+        alerts = evaluate_batch_hazards(rows)
+        camera = report_batch_hazards(rows, ids, alerts)
+    except Exception as e:
+        current_app.logger.error(f"Hazard evaluation of {len(rows)} stored readings failed: {e}")
+        hazard_error = str(e)
+
+    stored = iter(zip(ids, alerts))
+    for result in results:
+        if "error" in result:
+            continue
+        sensor_data_id, alert = next(stored)
+        result["sensor_data_id"] = sensor_data_id
+        if alert:
+            result.update(alert_fields(alert))
+
+    response_data = {
+        "message": "Batch processed",
+        "stored": len(ids),
+        "failed": len(results) - len(ids),
+        "results": results
+    }
+
+    if camera:
+        response_data["camera"] = camera
+    if hazard_error:
+        response_data["hazard_error"] = hazard_error
+
+    return jsonify(response_data), 201 if len(ids) == len(results) else 207
     
 
+@sensor_bp.route('/api/sensor/ingest_stats', methods=['GET'])
+def get_ingest_stats():
+    write_behind = current_app.extensions.get('sensor_write_behind')
+    if not write_behind:
+        return jsonify({"write_behind": False})
+
+    return jsonify({"write_behind": True, **write_behind.snapshot()})
+
+
+def sensor_list_query(device_id=None):
+    """Newest-first sensor readings, optionally for one device."""
+    query = SensorData.query
+
+    if device_id:
+        query = query.filter(SensorData.device_id == device_id)
+
+    return query.order_by(SensorData.date_created.desc(), SensorData.id.desc())
+
+
 @sensor_bp.route('/api/sensor', methods=['GET'])
 def get_sensor_data():
     try:
-        device_id = request.args.get('device_id')
-        limit = request.args.get('limit', default=10, type=int)
+        args = page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        query = SensorData.query
+    try:
+        device_id = request.args.get('device_id')
 
-        if device_id:
-            query = query.filter(SensorData.device_id == device_id)
-        
-        sensors = query.order_by(SensorData.date_created.desc()).limit(limit).all()
+        sensors, next_cursor = keyset_page(sensor_list_query(device_id), SensorData.date_created, SensorData.id, **args)
 
         result = []
         for sensor in sensors:
@@ -150,75 +302,169 @@ def get_sensor_data():
                 "date_created": sensor.date_created.isoformat()
             })
 
-        return jsonify(result), 200
+        return paginated_response(result, next_cursor), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
 
+@sensor_bp.route('/api/sensor/aggregate', methods=['GET'])
+def get_sensor_aggregate():
+    bucket = request.args.get('bucket', '5m')
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+    bucket_seconds = BUCKETS[bucket]
+
+    try:
+        end = parse_time_arg(request.args.get('to'))
+        start = parse_time_arg(request.args.get('from')) if request.args.get('from') else end - datetime.timedelta(days=1)
+    except (ValueError, OverflowError):
+        return jsonify({"error": "from and to must be epoch seconds or ISO-8601"}), 400
+
+    if start >= end:
+        return jsonify({"error": "from must be before to"}), 400
+    if (end - start).total_seconds() / bucket_seconds > MAX_AGGREGATE_BUCKETS:
+        return jsonify({"error": f"Range spans more than {MAX_AGGREGATE_BUCKETS} buckets, use a larger bucket"}), 400
+
+    try:
+        device_id = request.args.get('device_id')
+        rows = rollup_query(bucket_seconds, bucket_start(start, bucket_seconds), end, device_id).all()
+
+        return jsonify({
+            "device_id": device_id,
+            "bucket": bucket,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "buckets": [format_bucket(row) for row in rows]
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@sensor_bp.route('/api/sensor/export', methods=['GET'])
+def export_sensor_data():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+
+    try:
+        start = parse_time_arg(request.args['from']) if request.args.get('from') else None
+        end = parse_time_arg(request.args['to']) if request.args.get('to') else None
+    except (ValueError, OverflowError):
+        return jsonify({"error": "from and to must be epoch seconds or ISO-8601"}), 400
+
+    # Rows are read from a server-side cursor and written out chunk by chunk, so memory
+    # use does not depend on how many rows the export covers
+    chunks = stream_readings(request.args.get('device_id'), start, end)
+    body = ndjson_chunks(chunks) if export_format == "ndjson" else csv_chunks(chunks)
+
+    filename = f"sensor_data.{export_format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if request.args.get('gzip', '').lower() in ("1", "true", "yes"):
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format], headers=headers)
+
+
 @sensor_bp.route('/api/sensor/latest', methods=['GET'])
 def get_latest_sensor_data():
+    # ?device_id=a,b,c or ?all=1 answer with {device_id: reading}; one device_id, or none
+    # for the newest reading of any device, answer with the reading itself
     try:
-        # Get device ID from query parameters
         device_id = request.args.get('device_id')
-        
-        # Build query
-        query = SensorData.query
-        
-        # Filter by device if provided
-        if device_id:
-            query = query.filter_by(device_id=device_id)
-        
-        # Get latest reading
-        latest = query.order_by(SensorData.date_created.desc()).first()
-        
-        if not latest:
+        bulk = request.args.get('all') in ('1', 'true') or (device_id and ',' in device_id)
+        device_ids = [part.strip() for part in device_id.split(',') if part.strip()] if device_id else None
+
+        readings = latest_readings(device_ids)
+        if bulk:
+            return jsonify(readings)
+
+        if not readings:
             return jsonify({"error": "No sensor data found"}), 404
-        
-        # Format response
-        result = {
-            "id": latest.id,
-            "device_id": latest.device_id,
-            "temperature": latest.temperature,
-            "humidity": latest.humidity,
-            "pressure": latest.pressure,
-            "timestamp": latest.date_created.isoformat()
-        }
-        
-        return jsonify(result)
+
+        return jsonify(max(readings.values(), key=lambda reading: (reading["timestamp"], reading["id"])))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+def latest_readings(device_ids=None):
+    """Latest reading of each of ``device_ids``, or of every device, served from the state backend cache.
+
+    Devices missing from the cache are read from sensor_data once and written back, so
+    the database is only queried after a restart or for devices that never reported.
+    """
+    state = hazard_state()
+    cached = state.get_latest(device_ids)
+    if device_ids is None:
+        if cached is not None:
+            return cached
+        readings = query_latest_readings()
+        state.fill_latest(readings.values())
+        return readings
+
+    missing = [device_id for device_id in device_ids if device_id not in cached]
+    if missing:
+        readings = query_latest_readings(missing)
+        state.update_latest(readings.values())
+        cached.update(readings)
+    return cached
+
+
+def query_latest_readings(device_ids=None):
+    """Greatest-per-device reading from sensor_data, using the (device_id, date_created) index."""
+    newest = db.select(SensorData.device_id, db.func.max(SensorData.date_created).label("date_created")).group_by(SensorData.device_id)
+    if device_ids is not None:
+        newest = newest.where(SensorData.device_id.in_(device_ids))
+    newest = newest.subquery()
+
+    table = SensorData.__table__
+    rows = db.session.execute(
+        db.select(table.c.id, table.c.device_id, table.c.temperature, table.c.humidity, table.c.pressure, table.c.date_created)
+        .join(newest, db.and_(table.c.device_id == newest.c.device_id, table.c.date_created == newest.c.date_created))
+    ).mappings()
+
+    readings = {}
+    for row in rows:
+        # Readings sharing the newest timestamp are told apart by id, like the list ordering
+        if row["device_id"] not in readings or row["id"] > readings[row["device_id"]]["id"]:
+            readings[row["device_id"]] = format_reading(row["id"], row)
+    return readings
     
 
 @sensor_bp.route('/api/thresholds', methods=['GET'])
 def get_thresholds():
-    return jsonify({
-        "temp_threshold": TEMP_THRESHOLD,
-        "temp_rise_threshold": TEMP_RISE_THRESHOLD,
-        "temp_window": TEMP_WINDOW
-    })
+    thresholds = hazard_state().get_thresholds()
+
+    # With a device id, return the values that actually apply to it
+    device_id = request.args.get('device_id')
+    if device_id:
+        return jsonify({"device_id": device_id, **resolve_thresholds(thresholds, device_id), "version": thresholds["version"]})
+
+    return jsonify(thresholds)
 
 
 @sensor_bp.route('/api/thresholds', methods=['POST'])
 def update_thresholds():
-    global TEMP_THRESHOLD, TEMP_RISE_THRESHOLD, TEMP_WINDOW
-
     if not request.is_json:
         return jsonify({"error": "Invalid data format"}), 400
     
     data = request.get_json()
 
-    if 'temp_threshold' in data:
-        TEMP_THRESHOLD = float(data['temp_threshold'])
+    try:
+        changes = {field: float(data[field]) for field in DEFAULT_THRESHOLDS if field in data}
+    except (TypeError, ValueError):
+        return jsonify({"error": "Thresholds must be numbers"}), 400
 
-    if 'temp_rise_threshold' in data:
-        TEMP_RISE_THRESHOLD = float(data['temp_rise_threshold'])
+    # Changes apply to one device, to a group (optionally assigning devices to it) or to the defaults
+    devices = data.get("devices")
+    if devices is not None and (not data.get("group") or not isinstance(devices, list)):
+        return jsonify({"error": "devices must be a list and requires a group"}), 400
 
-    if 'temp_window' in data:
-        TEMP_WINDOW = float(data['temp_window'])
+    thresholds = hazard_state().update_thresholds(
+        changes, device_id=data.get("device_id"), group=data.get("group"), devices=devices
+    )
 
     return jsonify({
         "message": "Thresholds updated successfully",
-        "temp_threshold": TEMP_THRESHOLD,
-        "temp_rise_threshold": TEMP_RISE_THRESHOLD,
-        "temp_window": TEMP_WINDOW
-    })
\ No newline at end of file
+        **thresholds
+    })
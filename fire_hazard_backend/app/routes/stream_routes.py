@@ -0,0 +1,47 @@
+from flask import Blueprint, Response, request, jsonify, current_app
+from app.live_feed import EVENT_TYPES, TooManySubscribers, event_stream
+
+stream_bp = Blueprint('stream_bp', __name__)
+
+
+def _split_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+@stream_bp.route('/api/stream', methods=['GET'])
+def stream_events():
+    # Server-Sent Events: "reading", "hazard" and "image" events, optionally filtered
+    # with ?device_id=a,b and ?types=reading,hazard
+    device_ids = _split_arg('device_id')
+    types = _split_arg('types')
+    if types and any(event_type not in EVENT_TYPES for event_type in types):
+        return jsonify({"error": f"Unknown event type, use any of {list(EVENT_TYPES)}"}), 400
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Invalid Last-Event-ID"}), 400
+
+    feed = current_app.extensions['live_feed']
+    try:
+        subscriber = feed.subscribe(device_ids, types, last_event_id)
+    except TooManySubscribers as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+    response = Response(
+        event_stream(feed, subscriber, keepalive=current_app.config['STREAM_KEEPALIVE']),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@stream_bp.route('/api/stream/stats', methods=['GET'])
+def get_stream_stats():
+    return jsonify(current_app.extensions['live_feed'].snapshot()), 200
@@ -0,0 +1,216 @@
+from app import db
+from app.ingest import insert_readings
+import asyncio
+import datetime
+import numpy as np
+import signal
+import time
+
+# One reading: device index, Unix time (0 when the device has no clock), temperature,
+# humidity, pressure. Little-endian, no padding, 18 bytes.
+RECORD_FORMAT = "<HIfff"
+RECORD_DTYPE = np.dtype([
+    ("device", "<u2"), ("ts", "<u4"), ("temperature", "<f4"), ("humidity", "<f4"), ("pressure", "<f4")
+])
+RECORD_SIZE = RECORD_DTYPE.itemsize
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def decode_records(data, device_id_format="sensor_device_{}", received_at=None):
+    """Turn packed records into reading rows for insert_readings, skipping non-finite values.
+
+    float32 values are rounded to 3 decimals so 21.3 is stored as 21.3 rather than 21.299999.
+    """
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, count=len(data) // RECORD_SIZE)
+    values = {field: np.round(records[field].astype(np.float64), 3) for field in ("temperature", "humidity", "pressure")}
+    valid = np.isfinite(values["temperature"]) & np.isfinite(values["humidity"]) & np.isfinite(values["pressure"])
+
+    received_at = received_at or datetime.datetime.utcnow()
+    # Records in a flush share few devices and seconds, so their ids and datetimes are built once
+    device_ids = {}
+    times = {0: received_at}
+    rows = []
+    for device, ts, temperature, humidity, pressure in zip(
+        records["device"][valid].tolist(), records["ts"][valid].tolist(),
+        values["temperature"][valid].tolist(), values["humidity"][valid].tolist(), values["pressure"][valid].tolist()
+    ):
+        device_id = device_ids.get(device)
+        if device_id is None:
+            device_id = device_ids[device] = device_id_format.format(device)
+        date_created = times.get(ts)
+        if date_created is None:
+            date_created = times[ts] = EPOCH + datetime.timedelta(seconds=ts)
+        rows.append({
+            "device_id": device_id,
+            "date_created": date_created,
+            "temperature": temperature,
+            "humidity": humidity,
+            "pressure": pressure
+        })
+    return rows, len(records) - len(rows)
+
+
+class TelemetryListener:
+    """Receives binary readings over long-lived TCP connections and UDP datagrams.
+
+    A TCP connection is a plain stream of records; a datagram holds whole records.
+    Received records are stored in groups of up to ``flush_rows`` through the same
+    insert, rollup, latest-reading, live feed and hazard path as /api/sensor/batch.
+    While a group is being stored, TCP connections stop being read once
+    ``max_pending`` records are waiting and datagrams beyond it are dropped.
+    """
+
+    def __init__(self, app, host="0.0.0.0", port=5001, tcp=True, udp=True,
+                 flush_rows=5000, flush_interval=0.5, max_pending=200000):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.tcp = tcp
+        self.udp = udp
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.device_id_format = app.config['TELEMETRY_DEVICE_ID_FORMAT']
+
+        self._pending = bytearray()
+        self._stats = {
+            "connections": 0,
+            "received": 0,
+            "stored": 0,
+            "failed": 0,
+            "invalid": 0,
+            "dropped": 0,
+            "flushes": 0
+        }
+
+    def serve(self):
+        """Run until interrupted or terminated, storing whatever is still pending on the way out."""
+        try:
+            asyncio.run(self._serve())
+        except asyncio.CancelledError:
+            pass
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        self._flush_due = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (ValueError, RuntimeError, NotImplementedError):
+            pass  # Not the main thread, or no signal support
+
+        servers = []
+        if self.tcp:
+            servers.append(await asyncio.start_server(self._handle_connection, self.host, self.port))
+            self.app.logger.info(f"Telemetry listening on tcp {self.host}:{self.port}")
+        if self.udp:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), local_addr=(self.host, self.port)
+            )
+            servers.append(transport)
+            self.app.logger.info(f"Telemetry listening on udp {self.host}:{self.port}")
+
+        try:
+            await self._flush_loop()
+        finally:
+            for server in servers:
+                server.close()
+            if self._pending:
+                await loop.run_in_executor(None, self._store, bytes(self._pending))
+            self.app.logger.info(f"Telemetry stopped: {self.snapshot()}")
+
+    def _add(self, data):
+        self._pending += data
+        self._stats["received"] += len(data) // RECORD_SIZE
+        if len(self._pending) >= self.flush_rows * RECORD_SIZE:
+            self._flush_due.set()
+        if len(self._pending) >= self.max_pending * RECORD_SIZE:
+            self._drained.clear()
+
+    async def _handle_connection(self, reader, writer):
+        self._stats["connections"] += 1
+        leftover = b""
+        try:
+            while True:
+                await self._drained.wait()
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                data = leftover + chunk if leftover else chunk
+                whole = len(data) - len(data) % RECORD_SIZE
+                leftover = data[whole:]
+                if whole:
+                    self._add(data[:whole])
+        except ConnectionError:
+            pass
+        finally:
+            if leftover:
+                self._stats["invalid"] += 1
+            writer.close()
+
+    def _datagram_received(self, data):
+        whole = len(data) - len(data) % RECORD_SIZE
+        if whole != len(data):
+            self._stats["invalid"] += 1
+        if not self._drained.is_set():
+            self._stats["dropped"] += whole // RECORD_SIZE
+        elif whole:
+            self._add(data[:whole])
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_due.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_due.clear()
+            if not self._pending:
+                continue
+
+            size = min(len(self._pending), self.flush_rows * RECORD_SIZE)
+            data = bytes(self._pending[:size])
+            del self._pending[:size]
+            if len(self._pending) >= self.flush_rows * RECORD_SIZE:
+                self._flush_due.set()
+
+            # Storage blocks on the database, so it runs off the event loop
+            await loop.run_in_executor(None, self._store, data)
+            if len(self._pending) < self.max_pending * RECORD_SIZE:
+                self._drained.set()
+
+    def _store(self, data):
+        from app.routes.sensor_routes import evaluate_batch_hazards, report_batch_hazards
+
+        started = time.perf_counter()
+        with self.app.app_context():
+            rows, invalid = decode_records(data, self.device_id_format)
+            self._stats["invalid"] += invalid
+            if not rows:
+                return
+            try:
+                ids = insert_readings(rows)
+                report_batch_hazards(rows, ids, evaluate_batch_hazards(rows))
+                self._stats["stored"] += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                self._stats["failed"] += len(rows)
+                self.app.logger.error(f"Telemetry flush of {len(rows)} readings failed: {e}")
+            finally:
+                db.session.remove()
+        self._stats["flushes"] += 1
+        self.app.logger.debug(f"Stored {len(rows)} telemetry readings in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def snapshot(self):
+        return dict(self._stats, pending=len(self._pending) // RECORD_SIZE)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, listener):
+        self.listener = listener
+
+    def datagram_received(self, data, addr):
+        self.listener._datagram_received(data)
@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import io
+import os
+import tempfile
+import threading
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it only full-size images are served
+    Image = None
+
+
+class ThumbnailCache:
+    """Downscaled JPEG variants keyed by (content hash, width), cached on disk.
+
+    Variants are rendered on a small worker pool so request threads only wait on the
+    result. The cache directory is kept under ``max_bytes`` by evicting the least
+    recently used variants.
+    """
+
+    def __init__(self, app, root, max_bytes, widths=(160, 320, 640), workers=2, quality=80):
+        self.app = app
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.widths = tuple(widths)
+        self.quality = quality
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._total_bytes = 0
+        self._pending = {}  # path -> Future
+
+        os.makedirs(self.root, exist_ok=True)
+        self._load_existing()
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def path(self, digest, width):
+        return os.path.join(self.root, str(width), digest[:2], f"{digest}.jpg")
+
+    def _load_existing(self):
+        found = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".jpg"):
+                    stat = os.stat(os.path.join(directory, filename))
+                    found.append((stat.st_mtime, os.path.join(directory, filename), stat.st_size))
+
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._total_bytes += size
+        self._evict()
+
+    def get(self, digest, source, width, timeout=None):
+        """Return the path of the variant, rendering it first if needed.
+
+        ``source`` is the original's path, or a callable returning its bytes for images
+        with no local file; it is only used on a cache miss. Raises
+        concurrent.futures.TimeoutError if rendering takes longer than ``timeout``.
+        """
+        path = self.path(digest, width)
+        with self._lock:
+            try:
+                self._touch(path)
+                return path
+            except FileNotFoundError:
+                pass
+        return self.submit(digest, source, width).result(timeout)
+
+    def submit(self, digest, source, width):
+        path = self.path(digest, width)
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                future = self._executor.submit(self._render, source, path, width)
+                self._pending[path] = future
+            return future
+
+    def pregenerate(self, digest, source):
+        """Queue every configured width without waiting for the results."""
+        for width in self.widths:
+            if not os.path.exists(self.path(digest, width)):
+                self.submit(digest, source, width)
+
+    def _render(self, source, path, width):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with Image.open(io.BytesIO(source()) if callable(source) else source) as image:
+                # draft() lets the JPEG decoder downscale while decoding
+                image.draft("RGB", (width, width))
+                image = image.convert("RGB")
+                image.thumbnail((width, image.height))
+
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+                try:
+                    with os.fdopen(fd, 'wb') as tmp_file:
+                        image.save(tmp_file, "JPEG", quality=self.quality, optimize=True)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+
+            with self._lock:
+                self._add(path, os.path.getsize(path))
+                self._evict()
+            return path
+        except Exception as e:
+            self.app.logger.error(f"Thumbnail generation for {path} failed: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def _touch(self, path):
+        if path in self._entries and os.path.exists(path):
+            self._entries.move_to_end(path)
+        else:
+            # Rendered by another worker process, or raises if it is not on disk
+            self._add(path, os.path.getsize(path))
+
+    def _add(self, path, size):
+        self._total_bytes += size - self._entries.pop(path, 0)
+        self._entries[path] = size
+
+    def _evict(self):
+        # The most recently used variant always stays, it may be about to be served
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,124 @@
+from app import db
+from app.ingest import insert_readings
+import atexit
+import queue
+import threading
+import time
+
+
+class BufferFull(Exception):
+    pass
+
+
+class BufferClosed(Exception):
+    pass
+
+
+class WriteBehindBuffer:
+    """Collects sensor rows from concurrent requests and writes them in groups from a background thread.
+
+    A group is flushed when it reaches ``flush_rows`` rows or when its oldest row is
+    ``flush_interval`` seconds old, whichever comes first.
+    """
+
+    def __init__(self, app, max_size=10000, flush_rows=200, flush_interval=0.25):
+        self.app = app
+        self.max_size = max_size
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "accepted_rows": 0,
+            "rejected_rows": 0,
+            "flushed_rows": 0,
+            "failed_rows": 0,
+            "flushes": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0
+        }
+
+        self._thread = threading.Thread(target=self._run, name="sensor-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, row):
+        """Queue a row. Raises BufferFull when the queue is full and BufferClosed once close() has run."""
+        # Checked under the lock close() takes, so nothing is queued after the flush thread's last pass
+        with self._lock:
+            if self._stopped.is_set():
+                self._stats["rejected_rows"] += 1
+                raise BufferClosed("Sensor ingest is shutting down")
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self._stats["rejected_rows"] += 1
+                raise BufferFull("Sensor ingest queue is full")
+            self._stats["accepted_rows"] += 1
+
+    def _run(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        failed = False
+
+        with self.app.app_context():
+            try:
+                insert_readings(batch)
+            except Exception as e:
+                db.session.rollback()
+                failed = True
+                self.app.logger.error(f"Write-behind flush of {len(batch)} sensor rows failed: {e}")
+            finally:
+                db.session.remove()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["failed_rows" if failed else "flushed_rows"] += len(batch)
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+            self._stats["total_flush_ms"] += elapsed_ms
+
+    def close(self, timeout=10):
+        """Stop accepting work and flush whatever is still queued."""
+        with self._lock:
+            self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+
+        flushes = stats.pop("flushes")
+        total_flush_ms = stats.pop("total_flush_ms")
+        stats.update({
+            "queue_depth": self._queue.qsize(),
+            "max_size": self.max_size,
+            "flush_rows": self.flush_rows,
+            "flush_interval": self.flush_interval,
+            "flushes": flushes,
+            "avg_flush_ms": total_flush_ms / flushes if flushes else 0.0
+        })
+        return stats
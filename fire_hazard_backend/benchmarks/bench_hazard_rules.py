@@ -0,0 +1,77 @@
+"""Throughput of HazardEngine.evaluate_batch, the batch ingest hazard path.
+
+    python benchmarks/bench_hazard_rules.py [--devices 10000] [--seconds 60] [--batch 24000]
+
+Every device reports once a second for ``--seconds`` seconds with the default
+60 s window. Readings are evaluated in shuffled batches of ``--batch`` rows, and
+the scalar path is checked against the batch result on the first batch.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.hazard_rules import DEFAULT_THRESHOLDS, HazardEngine  # noqa: E402
+from app.hazard_window import WindowRegistry  # noqa: E402
+
+
+def readings(devices, seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    n = devices * seconds
+    device_ids = [f"sensor_device_{i % devices}" for i in range(n)]
+    ts = np.repeat(np.arange(seconds, dtype=np.float64), devices) + 1_700_000_000
+    temperature = 22 + rng.normal(0, 0.5, n) + np.where(rng.random(n) < 0.001, 20, 0)
+    humidity = 45 + rng.normal(0, 2, n)
+    pressure = 1013 + rng.normal(0, 0.3, n)
+    order = rng.permutation(n)
+    return [device_ids[i] for i in order], ts[order], temperature[order], humidity[order], pressure[order]
+
+
+def check_scalar(engine, batch, alerts):
+    """The scalar path, fed in (device, time) order, must agree with evaluate_batch."""
+    device_ids, ts, temperature, humidity, pressure = batch
+    registry = WindowRegistry()
+    window = DEFAULT_THRESHOLDS["temp_window"]
+    for i in sorted(range(len(device_ids)), key=lambda i: (device_ids[i], ts[i])):
+        stats = registry.push(device_ids[i], ts[i], temperature[i], window, humidity[i], pressure[i])
+        expected = engine.evaluate(stats, temperature[i], humidity[i], pressure[i], DEFAULT_THRESHOLDS)
+        got = alerts[i]
+        if (expected and expected.rule) != (got and got.rule):
+            raise SystemExit(f"Mismatch on row {i}: scalar {expected}, batch {got}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--batch", type=int, default=24000)
+    args = parser.parse_args()
+
+    engine = HazardEngine()
+    device_ids, ts, temperature, humidity, pressure = readings(args.devices, args.seconds)
+    n = len(device_ids)
+
+    fired = 0
+    started = time.perf_counter()
+    for offset in range(0, n, args.batch):
+        part = slice(offset, offset + args.batch)
+        alerts = engine.evaluate_batch(
+            device_ids[part], ts[part], temperature[part], humidity[part], pressure[part],
+            lambda device_id: DEFAULT_THRESHOLDS
+        )
+        fired += sum(alert is not None for alert in alerts)
+        if offset == 0:
+            first = (device_ids[part], ts[part], temperature[part], humidity[part], pressure[part]), alerts
+    elapsed = time.perf_counter() - started
+
+    print(f"evaluate_batch: {n} readings in {elapsed:.2f} s, {n / elapsed:,.0f} readings/s, {fired} alerts")
+    check_scalar(engine, *first)
+    print(f"scalar path agrees on all {len(first[1])} rows of the first batch")
+
+
+if __name__ == "__main__":
+    main()
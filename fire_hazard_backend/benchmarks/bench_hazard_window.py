@@ -0,0 +1,73 @@
+"""Per-reading cost of the hazard window: WindowRegistry against the old list scan.
+
+    python benchmarks/bench_hazard_window.py [--devices 10000] [--seconds 120] [--window 60]
+
+Every device reports once a second for ``--seconds`` simulated seconds, with an
+occasional spike. The list scan is the original temp_history code: append, then
+rebuild the device's list keeping readings inside the window. Both sides compare
+against the window minimum, so their alert counts must match.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.hazard_window import WindowRegistry  # noqa: E402
+
+
+def list_scan(stream, window, rise_threshold=5.0):
+    temp_history = {}
+    alerts = 0
+    for device_id, current_time, temperature in stream:
+        if device_id not in temp_history:
+            temp_history[device_id] = []
+        temp_history[device_id].append((current_time, temperature))
+        temp_history[device_id] = [
+            reading for reading in temp_history[device_id]
+            if current_time - reading[0] <= window
+        ]
+        if len(temp_history[device_id]) >= 2 and temperature - min(reading[1] for reading in temp_history[device_id]) >= rise_threshold:
+            alerts += 1
+    return alerts
+
+
+def rolling_window(stream, window, rise_threshold=5.0):
+    registry = WindowRegistry()
+    alerts = 0
+    for device_id, current_time, temperature in stream:
+        stats = registry.push(device_id, current_time, temperature, window)
+        if stats.count >= 2 and temperature - stats.temp_min >= rise_threshold:
+            alerts += 1
+    return alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--seconds", type=int, default=120)
+    parser.add_argument("--window", type=float, default=60.0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    device_ids = [f"sensor_device_{i}" for i in range(args.devices)]
+    stream = [
+        (device_id, 1_700_000_000.0 + second, 22 + rng.gauss(0, 0.5) + (8 if rng.random() < 0.001 else 0))
+        for second in range(args.seconds) for device_id in device_ids
+    ]
+
+    counts = {}
+    for name, run in (("list scan", list_scan), ("RollingWindow", rolling_window)):
+        started = time.perf_counter()
+        counts[name] = run(stream, args.window)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>13}: {len(stream)} readings in {elapsed:.2f} s, "
+              f"{len(stream) / elapsed:,.0f} readings/s, {elapsed / len(stream) * 1e6:.1f} us each, {counts[name]} alerts")
+
+    assert counts["list scan"] == counts["RollingWindow"], f"Alert counts differ: {counts}"
+
+
+if __name__ == "__main__":
+    main()
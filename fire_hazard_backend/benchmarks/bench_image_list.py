@@ -0,0 +1,77 @@
+"""GET /api/cam with image_binary deferred, against a listing query that loads the blobs.
+
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_image_list.py [--rows 300] [--kb 200] [--limit 100]
+
+Needs a throwaway database: the schema is created, filled with ``--rows`` images
+stored inline as ``--kb`` KB blobs, and dropped again at the end.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--kb", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if not os.getenv("BENCH_DATABASE_URL"):
+        raise SystemExit("Set BENCH_DATABASE_URL to a throwaway database")
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+
+    from app import create_app, db
+    from app.models import ImageData
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        try:
+            blob = os.urandom(args.kb * 1024)
+            db.session.add_all(
+                ImageData(device_id="camera_device_1", filename=f"img_{i}.jpg", filepath="", image_binary=blob)
+                for i in range(args.rows)
+            )
+            db.session.commit()
+            db.session.expunge_all()
+
+            def eager_query():
+                # What the listing did before image_binary was deferred
+                images = ImageData.query.options(db.undefer(ImageData.image_binary)) \
+                    .order_by(ImageData.timestamp.desc(), ImageData.id.desc()).limit(args.limit).all()
+                db.session.expunge_all()
+                return sum(len(image.image_binary) for image in images)
+
+            client = app.test_client()
+
+            def endpoint():
+                response = client.get(f"/api/cam?limit={args.limit}")
+                assert response.status_code == 200, response.data
+                return len(response.data)
+
+            eager_ms, eager_bytes = timed(eager_query, args.repeat)
+            endpoint_ms, body_bytes = timed(endpoint, args.repeat)
+            print(f"query loading blobs: {eager_ms:.1f} ms, {eager_bytes / 1024 / 1024:.1f} MB of image bytes fetched")
+            print(f"GET /api/cam:        {endpoint_ms:.1f} ms, {body_bytes / 1024:.1f} KB response")
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
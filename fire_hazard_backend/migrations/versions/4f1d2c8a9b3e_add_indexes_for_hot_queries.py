@@ -0,0 +1,38 @@
+"""Add indexes for hot query shapes
+
+Revision ID: 4f1d2c8a9b3e
+Revises: 67b21afa4299
+Create Date: 2026-10-18 10:12:31.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1d2c8a9b3e'
+down_revision = '67b21afa4299'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sensor_data', schema=None) as batch_op:
+        batch_op.create_index('ix_sensor_data_device_id_date_created', ['device_id', sa.text('date_created DESC')], unique=False)
+        batch_op.create_index(batch_op.f('ix_sensor_data_date_created'), ['date_created'], unique=False)
+
+    with op.batch_alter_table('image_data', schema=None) as batch_op:
+        batch_op.create_index('ix_image_data_device_id_is_fire_hazard_timestamp', ['device_id', 'is_fire_hazard', sa.text('timestamp DESC')], unique=False)
+        batch_op.create_index(batch_op.f('ix_image_data_sensor_data_id'), ['sensor_data_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_image_data_timestamp'), ['timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('image_data', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_data_timestamp'))
+        batch_op.drop_index(batch_op.f('ix_image_data_sensor_data_id'))
+        batch_op.drop_index('ix_image_data_device_id_is_fire_hazard_timestamp')
+
+    with op.batch_alter_table('sensor_data', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sensor_data_date_created'))
+        batch_op.drop_index('ix_sensor_data_device_id_date_created')
@@ -0,0 +1,45 @@
+"""Add sensor rollups
+
+Revision ID: 5b8e0f3c7a21
+Revises: 9c3e7a51d0f2
+Create Date: 2026-10-18 14:05:48.903126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0f3c7a21'
+down_revision = '9c3e7a51d0f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing readings are not rolled up here; run `flask rollups rebuild` once after upgrading
+    op.create_table('sensor_rollup',
+    sa.Column('bucket_seconds', sa.Integer(), nullable=False),
+    sa.Column('device_id', sa.String(length=50), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('temperature_min', sa.Float(), nullable=False),
+    sa.Column('temperature_max', sa.Float(), nullable=False),
+    sa.Column('temperature_sum', sa.Float(), nullable=False),
+    sa.Column('humidity_min', sa.Float(), nullable=False),
+    sa.Column('humidity_max', sa.Float(), nullable=False),
+    sa.Column('humidity_sum', sa.Float(), nullable=False),
+    sa.Column('pressure_min', sa.Float(), nullable=False),
+    sa.Column('pressure_max', sa.Float(), nullable=False),
+    sa.Column('pressure_sum', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket_seconds', 'device_id', 'bucket_start')
+    )
+    with op.batch_alter_table('sensor_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_sensor_rollup_bucket_seconds_bucket_start', ['bucket_seconds', 'bucket_start'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sensor_rollup', schema=None) as batch_op:
+        batch_op.drop_index('ix_sensor_rollup_bucket_seconds_bucket_start')
+
+    op.drop_table('sensor_rollup')
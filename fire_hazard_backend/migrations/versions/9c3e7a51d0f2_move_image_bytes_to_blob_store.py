@@ -0,0 +1,38 @@
+"""Move image bytes to blob store
+
+Revision ID: 9c3e7a51d0f2
+Revises: 4f1d2c8a9b3e
+Create Date: 2026-10-18 11:40:05.217346
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3e7a51d0f2'
+down_revision = '4f1d2c8a9b3e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('image_data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('size', sa.Integer(), nullable=True))
+        batch_op.alter_column('image_binary',
+               existing_type=sa.LargeBinary(),
+               nullable=True)
+        batch_op.create_index(batch_op.f('ix_image_data_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    # Rows already moved out with `flask images migrate-blobs` have no inline bytes left,
+    # so image_binary can only become NOT NULL again once they are copied back.
+    with op.batch_alter_table('image_data', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_data_content_hash'))
+        batch_op.alter_column('image_binary',
+               existing_type=sa.LargeBinary(),
+               nullable=False)
+        batch_op.drop_column('size')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,30 @@
+"""Add image bursts
+
+Revision ID: e2a9c4d7b613
+Revises: 5b8e0f3c7a21
+Create Date: 2026-10-18 19:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9c4d7b613'
+down_revision = '5b8e0f3c7a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('image_data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('burst_id', sa.String(length=32), nullable=True))
+        batch_op.add_column(sa.Column('burst_index', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_image_data_burst_id'), ['burst_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('image_data', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_data_burst_id'))
+        batch_op.drop_column('burst_index')
+        batch_op.drop_column('burst_id')
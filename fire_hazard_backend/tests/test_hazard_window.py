@@ -0,0 +1,65 @@
+"""Device windows with readings that arrive out of order."""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.hazard_state import SQLiteStateBackend
+from app.hazard_window import RollingWindow
+
+WINDOW = 60
+
+
+def test_reading_older_than_window_is_ignored():
+    rolling = RollingWindow()
+    rolling.push(1000, 50.0, WINDOW)
+    rolling.push(1001, 60.0, WINDOW)
+
+    assert rolling.push(500, 30.0, WINDOW) is None
+
+    stats = rolling.push(1002, 55.0, WINDOW)
+    assert stats.count == 3
+    assert (stats.temp_min, stats.temp_max) == (50.0, 60.0)
+
+
+def test_late_reading_inside_window_leaves_with_the_newest():
+    rolling = RollingWindow()
+    rolling.push(1000, 50.0, WINDOW)
+    rolling.push(1010, 60.0, WINDOW)
+
+    stats = rolling.push(995, 40.0, WINDOW)
+    assert (stats.count, stats.temp_min) == (3, 40.0)
+
+    # 995 is past the cutoff but arrived after 1010, so it stays until 1010 leaves
+    stats = rolling.push(1056, 55.0, WINDOW)
+    assert (stats.count, stats.temp_min) == (4, 40.0)
+
+    stats = rolling.push(1071, 58.0, WINDOW)
+    assert (stats.count, stats.temp_min, stats.temp_max) == (2, 55.0, 58.0)
+
+
+def test_min_max_match_window_contents_with_jitter():
+    rng = random.Random(7)
+    rolling = RollingWindow()
+    for i in range(2000):
+        timestamp = i + rng.uniform(-90, 10)
+        stats = rolling.push(timestamp, rng.uniform(10, 60), WINDOW)
+        if stats is None:
+            assert timestamp < rolling.newest - WINDOW
+            continue
+        temperatures = [reading[1] for reading in rolling.readings]
+        assert stats.count == len(temperatures)
+        assert (stats.temp_min, stats.temp_max) == (min(temperatures), max(temperatures))
+
+
+def test_sqlite_backend_ignores_reading_older_than_window(tmp_path):
+    state = SQLiteStateBackend(str(tmp_path / "state.db"))
+    state.push_reading("d1", 1000, 50.0, WINDOW)
+    state.push_reading("d1", 1001, 60.0, WINDOW)
+
+    assert state.push_reading("d1", 500, 30.0, WINDOW) is None
+
+    stats = state.push_reading("d1", 1002, 55.0, WINDOW)
+    assert stats.count == 3
+    assert (stats.temp_min, stats.temp_max) == (50.0, 60.0)
@@ -0,0 +1,47 @@
+"""Every hot read query must be answerable from an index.
+
+Needs a throwaway PostgreSQL database in TEST_DATABASE_URL; the schema is created
+and dropped around the run. Skipped when it is not set.
+"""
+import os
+import sys
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL or not TEST_DATABASE_URL.startswith("postgresql"),
+    reason="TEST_DATABASE_URL does not point at a PostgreSQL database"
+)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="module")
+def app():
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    from app import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_hot_queries_avoid_seq_scans(app):
+    from app import db
+    from app.commands import hot_queries, query_seq_scans
+
+    failures = {}
+    with db.engine.connect() as conn:
+        # The planner then only picks a seq scan when no usable index exists, even on empty tables
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        for name, query in hot_queries():
+            scans = query_seq_scans(conn, query)
+            if scans:
+                failures[name] = scans
+
+    assert not failures, f"Sequential scans in hot queries: {failures}"
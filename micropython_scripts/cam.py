@@ -6,7 +6,7 @@ import network
 import urequests
 import json
 import ubinascii
-import socket
+import uasyncio as asyncio
 
 # Device ID 
 DEVICE_ID = "camera_device_1"
@@ -21,15 +21,60 @@ PASSWORD = "qwer1234"
 # API endpoint for sending captured images (corrected to consistent URL)
 API_URL = "http://192.168.151.112:5000/api/cam"
 
+# API endpoint for burst uploads, one multipart request per burst
+BURST_API_URL = "http://192.168.151.112:5000/api/cam/burst"
+
 # URL for registering camera IP to the server
 REGISTER_URL = "http://192.168.151.112:5000/api/register_camera"
 
+# Upload mode: "raw" posts the JPEG bytes as the request body with metadata in
+# headers, "json" posts a base64-encoded image inside a JSON payload. Both are
+# streamed from the frame buffer in chunks
+UPLOAD_MODE = "raw"
+UPLOAD_CHUNK_SIZE = 3072  # bytes written to the socket per await, a multiple of 3 for base64
+UPLOAD_TIMEOUT = 30  # seconds
+
+# Frames that fail to upload are kept on flash and retried in the background.
+# A failed burst is kept as one directory and resent as a burst. Only the newest
+# MAX_RETRY_FILES entries are kept
+RETRY_DIR = "/images/retry"
+MAX_RETRY_FILES = 10
+RETRY_INTERVAL = 30  # seconds
+
+# Camera frame size (a camera.FRAME_* value) and JPEG quality (10-63, lower is
+# better). None keeps the driver defaults
+CAMERA_FRAMESIZE = None
+CAMERA_QUALITY = None
+
+# Fire hazard triggers capture a burst of BURST_FRAMES frames BURST_INTERVAL
+# seconds apart, uploaded in one request. Frames after the first can use a
+# smaller frame size and quality; CAMERA_FRAMESIZE/CAMERA_QUALITY must then be
+# set too, so the full settings can be restored. The whole burst is held in
+# RAM (PSRAM on the XIAO ESP32-S3), so keep it short
+BURST_FRAMES = 3
+BURST_INTERVAL = 0.5  # seconds
+BURST_LATER_FRAMESIZE = None
+BURST_LATER_QUALITY = None
+
 # Web server configuration for receiving requests
 SERVER_PORT = 80
+REQUEST_TIMEOUT = 5  # seconds to wait for a client's request headers
+
+# Triggers are acknowledged at once and captured in the background. A trigger
+# is merged into a capture that is still waiting, or dropped when an accepted
+# trigger of the same kind arrived less than COALESCE_WINDOW seconds earlier
+COALESCE_WINDOW = 5
 
 # Flag to indicate if the capture was triggered by fire hazard
 fire_hazard_triggered = False
 
+# Captures waiting for the worker, oldest first, as is_fire_hazard flags
+pending_captures = []
+capture_ready = None  # asyncio.Event, created once the event loop runs
+last_trigger_ms = {False: None, True: None}  # by is_fire_hazard
+retry_seq = 0
+stats = {"triggers": 0, "coalesced": 0, "captured": 0, "uploaded": 0, "failed": 0, "rejected": 0, "discarded": 0}
+
 def connect_wifi():
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
@@ -64,10 +109,21 @@ def register_camera_ip(ip):
         print(f"Failed to register camera IP: {str(e)}")
         return False
 
+def apply_camera_settings(framesize, quality):
+    """Set the frame size and JPEG quality where given; not every camera firmware supports both"""
+    try:
+        if framesize is not None:
+            camera.framesize(framesize)
+        if quality is not None:
+            camera.quality(quality)
+    except Exception as e:
+        print(f"Could not apply camera settings: {str(e)}")
+
 def setup_camera():
     print("Setting up camera...")
     try:
         camera.init()
+        apply_camera_settings(CAMERA_FRAMESIZE, CAMERA_QUALITY)
         print("Camera initialized successfully")
         return True
     except Exception as e:
@@ -75,154 +131,378 @@ def setup_camera():
         return False
 
 def capture_image(is_fire_hazard=False):
-    """Capture an image and indicate if it was triggered by fire hazard"""
+    """Capture a frame into RAM. It only goes to flash if its upload fails"""
     print("Capturing image...")
     led.value(1)  # Turn on LED to indicate capturing
     
     try:
-        # Capture image
-        buf = camera.capture()
-        
-        # Create directory if it doesn't exist
-        try:
-            os.mkdir('/images')
-        except:
-            pass  # Directory already exists
-        
-        # Generate filename with timestamp and fire hazard indicator if applicable
-        timestamp = "{:04d}{:02d}{:02d}_{:02d}{:02d}{:02d}".format(*time.localtime()[:6])
-        
-        prefix = "FIRE_HAZARD_" if is_fire_hazard else ""
-        filename = f"/images/{prefix}{DEVICE_ID}_img_{timestamp}.jpg"
-        
-        # Save image to file
-        with open(filename, 'wb') as f:
-            f.write(buf)
-            
-        print(f"Image saved to {filename}")
-        return filename, buf
+        return camera.capture()
     except Exception as e:
         print(f"Error capturing image: {str(e)}")
-        return None, None
+        return None
     finally:
         led.value(0)  # Turn off LED
 
-def send_image(image_path, image_buf, is_fire_hazard=False):
-    """Send the captured image to the server with fire hazard flag if applicable"""
-    if not image_path or not image_buf:
-        print("No image to send")
+def split_url(url):
+    """Return (host, port, path) for an http:// URL"""
+    host_port, _, path = url[len("http://"):].partition("/")
+    host, _, port = host_port.partition(":")
+    return host, int(port) if port else 80, "/" + path
+
+def image_chunks(image):
+    """Yield the JPEG in UPLOAD_CHUNK_SIZE pieces from a buffer or an open file"""
+    if hasattr(image, "readinto"):
+        chunk = bytearray(UPLOAD_CHUNK_SIZE)
+        view = memoryview(chunk)
+        while True:
+            n = image.readinto(chunk)
+            if not n:
+                return
+            yield view[:n]
+    else:
+        view = memoryview(image)
+        for offset in range(0, len(image), UPLOAD_CHUNK_SIZE):
+            yield view[offset:offset + UPLOAD_CHUNK_SIZE]
+
+async def stream_post(url, content_type, body_size, pieces, extra_headers=""):
+    """POST a body written piece by piece over an asyncio stream and return the response status"""
+    host, port, path = split_url(url)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        headers = (
+            f"POST {path} HTTP/1.0\r\n"
+            f"Host: {host}:{port}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {body_size}\r\n"
+            + extra_headers +
+            "\r\n"
+        )
+        writer.write(headers.encode())
+        for piece in pieces:
+            writer.write(piece)
+            await writer.drain()
+
+        status_line = await reader.readline()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+def chain(*iterables):
+    for iterable in iterables:
+        for item in iterable:
+            yield item
+
+def base64_chunks(image):
+    # Chunks are a multiple of 3 bytes, so their encodings join without padding
+    for chunk in image_chunks(image):
+        yield ubinascii.b2a_base64(chunk)[:-1]
+
+async def send_image_async(image, size, is_fire_hazard=False):
+    """Stream a JPEG to the server and return the response status.
+
+    Raw mode writes the bytes as the body. JSON mode base64-encodes one chunk at a
+    time inside the payload, so no whole-frame base64 or JSON copy is ever built.
+    """
+    print(f"Sending image to {API_URL} ({size} bytes, {UPLOAD_MODE})...")
+    extra_headers = f"X-Device-Id: {DEVICE_ID}\r\nX-Fire-Hazard: {'true' if is_fire_hazard else 'false'}\r\n"
+    if UPLOAD_MODE == "raw":
+        return await stream_post(API_URL, "application/octet-stream", size, image_chunks(image), extra_headers)
+
+    payload = json.dumps({"device_id": DEVICE_ID, "is_fire_hazard": is_fire_hazard})
+    prefix = (payload[:-1] + ', "image": "').encode()
+    suffix = b'"}'
+    body_size = len(prefix) + (size + 2) // 3 * 4 + len(suffix)
+    pieces = chain((prefix,), base64_chunks(image), (suffix,))
+    return await stream_post(API_URL, "application/json", body_size, pieces, extra_headers)
+
+async def send_burst_async(frames, is_fire_hazard=True, sizes=None):
+    """Stream burst frames, buffers or open files of ``sizes`` bytes, to the server as one
+    multipart/form-data request and return the response status"""
+    if sizes is None:
+        sizes = [len(frame) for frame in frames]
+    boundary = "----burst" + ubinascii.hexlify(os.urandom(8)).decode()
+    fields = b""
+    for name, value in (("device_id", DEVICE_ID), ("is_fire_hazard", "true" if is_fire_hazard else "false")):
+        fields += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    frame_headers = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="frame{i}.jpg"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'.encode()
+        for i in range(len(frames))
+    ]
+    closing = f"--{boundary}--\r\n".encode()
+    body_size = len(fields) + len(closing) + sum(len(h) + size + 2 for h, size in zip(frame_headers, sizes))
+
+    def pieces():
+        yield fields
+        for header, frame in zip(frame_headers, frames):
+            yield header
+            for chunk in image_chunks(frame):
+                yield chunk
+            yield b"\r\n"
+        yield closing
+
+    print(f"Sending {len(frames)}-frame burst to {BURST_API_URL} ({body_size} bytes)...")
+    return await stream_post(BURST_API_URL, f"multipart/form-data; boundary={boundary}", body_size, pieces())
+
+async def deliver(send, description, frames=1):
+    """Await an upload coroutine. Returns False if it should be retried later"""
+    try:
+        status = await asyncio.wait_for(send, UPLOAD_TIMEOUT)
+    except Exception as e:
+        print(f"Error sending {description}: {str(e)}")
         return False
-    
+
+    if status == 201:
+        print(f"{description.capitalize()} sent successfully!")
+        stats["uploaded"] += frames
+        return True
+    print(f"Failed to send {description}. Status: {status}")
+    # 4xx means the server will never accept the upload, so it is not retried
+    if status < 500:
+        stats["rejected"] += 1
+        return True
+    return False
+
+async def post_image(image, size, is_fire_hazard=False):
+    """Upload one frame. Returns False if it should be retried later"""
+    return await deliver(send_image_async(image, size, is_fire_hazard), "image")
+
+def retry_files():
+    """Queued frames, oldest first"""
     try:
-        # Convert image to base64
-        b64_image = ubinascii.b2a_base64(image_buf).decode('utf-8').strip()
-        
-        # Prepare payload with fire hazard indicator
-        payload = {
-            "device_id": DEVICE_ID,
-            "image": b64_image,
-            "is_fire_hazard": is_fire_hazard
-        }
-        
-        # Send to server
-        print(f"Sending image to {API_URL}...")
-        response = urequests.post(API_URL, 
-                                 json=payload,
-                                 headers={'Content-Type': 'application/json'})
-        
-        if response.status_code == 201:
-            print("Image sent successfully!")
-            result = response.json()
-            print(f"Server assigned ID: {result.get('image_id')}")
-            response.close()
-            return True
-        else:
-            print(f"Failed to send image. Status: {response.status_code}")
-            print(f"Response: {response.text}")
-            response.close()
-            return False
-            
+        return sorted(os.listdir(RETRY_DIR))
+    except OSError:
+        return []
+
+def remove_retry(name):
+    """Delete a queued frame or burst directory and return how many frames it held"""
+    path = f"{RETRY_DIR}/{name}"
+    if not name.endswith("_B"):
+        os.remove(path)
+        return 1
+    frames = os.listdir(path)
+    for frame in frames:
+        os.remove(f"{path}/{frame}")
+    os.rmdir(path)
+    return len(frames)
+
+def new_retry_entry(kind):
+    """Make room in the retry queue, discarding the oldest entries when full, and return a path for a new one"""
+    global retry_seq
+    names = retry_files()
+    try:
+        os.mkdir(RETRY_DIR)
+    except OSError:
+        pass  # Directory already exists
+    while len(names) >= MAX_RETRY_FILES:
+        stats["discarded"] += remove_retry(names.pop(0))
+
+    retry_seq = (retry_seq + 1) % 1000
+    return f"{RETRY_DIR}/{int(time.time()):010d}_{retry_seq:03d}_{kind}"
+
+def save_for_retry(image_buf, is_fire_hazard):
+    """Write a frame that failed to upload to the retry queue"""
+    filename = new_retry_entry("F" if is_fire_hazard else "N") + ".jpg"
+    try:
+        with open(filename, "wb") as f:
+            f.write(image_buf)
+        print(f"Upload failed, image queued at {filename}")
+    except Exception as e:
+        stats["discarded"] += 1
+        print(f"Error queuing image: {str(e)}")
+
+def save_burst_for_retry(frames):
+    """Write a burst that failed to upload to the retry queue as one directory, so it is resent as a linked burst"""
+    path = new_retry_entry("B")
+    try:
+        os.mkdir(path)
+        for i, frame in enumerate(frames):
+            with open(f"{path}/frame{i:02d}.jpg", "wb") as f:
+                f.write(frame)
+        print(f"Upload failed, {len(frames)}-frame burst queued at {path}")
     except Exception as e:
-        print(f"Error sending image: {str(e)}")
+        stats["discarded"] += len(frames)
+        print(f"Error queuing burst: {str(e)}")
+        try:
+            remove_retry(path[len(RETRY_DIR) + 1:])
+        except OSError:
+            pass
+
+async def post_queued_burst(path):
+    """Upload a queued burst from flash in one burst request. Returns False if it should be retried later"""
+    names = sorted(os.listdir(path))
+    if not names:
+        return True
+    files = []
+    try:
+        for name in names:
+            files.append(open(f"{path}/{name}", "rb"))
+        sizes = [os.stat(f"{path}/{name}")[6] for name in names]
+        return await deliver(send_burst_async(files, True, sizes), "burst", len(files))
+    finally:
+        for f in files:
+            f.close()
+
+async def retry_worker():
+    """Every RETRY_INTERVAL seconds, upload queued frames and bursts oldest first until one fails"""
+    while True:
+        await asyncio.sleep(RETRY_INTERVAL)
+        # A flash error must not end the task, or queued frames would never drain
+        try:
+            for name in retry_files():
+                path = f"{RETRY_DIR}/{name}"
+                if name.endswith("_B"):
+                    delivered = await post_queued_burst(path)
+                else:
+                    with open(path, "rb") as f:
+                        delivered = await post_image(f, os.stat(path)[6], name.endswith("_F.jpg"))
+                if not delivered:
+                    break
+                remove_retry(name)
+        except Exception as e:
+            print(f"Retry worker error: {str(e)}")
+
+async def capture_burst():
+    """Capture BURST_FRAMES frames BURST_INTERVAL seconds apart, the later ones at the burst settings"""
+    later_settings = BURST_LATER_FRAMESIZE is not None or BURST_LATER_QUALITY is not None
+    frames = []
+    try:
+        for i in range(BURST_FRAMES):
+            if i:
+                await asyncio.sleep(BURST_INTERVAL)
+            if i == 1 and later_settings:
+                apply_camera_settings(BURST_LATER_FRAMESIZE, BURST_LATER_QUALITY)
+            frame = capture_image(True)
+            if frame is not None:
+                frames.append(frame)
+    finally:
+        if later_settings:
+            apply_camera_settings(CAMERA_FRAMESIZE, CAMERA_QUALITY)
+    return frames
+
+async def capture_and_send(is_fire_hazard):
+    if is_fire_hazard and BURST_FRAMES > 1:
+        frames = await capture_burst()
+        if not frames:
+            stats["failed"] += 1
+            return
+        stats["captured"] += len(frames)
+
+        if not await deliver(send_burst_async(frames), "burst", len(frames)):
+            save_burst_for_retry(frames)
+        return
+
+    image_buf = capture_image(is_fire_hazard)
+    if image_buf is None:
+        stats["failed"] += 1
+        return
+    stats["captured"] += 1
+
+    if not await post_image(image_buf, len(image_buf), is_fire_hazard):
+        save_for_retry(image_buf, is_fire_hazard)
+
+async def capture_worker():
+    """Capture and upload queued triggers one at a time"""
+    while True:
+        await capture_ready.wait()
+        capture_ready.clear()
+        while pending_captures:
+            # One bad capture must not end the task, or later triggers would only ever queue
+            try:
+                await capture_and_send(pending_captures.pop(0))
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"Capture worker error: {str(e)}")
+
+def queue_capture(is_fire_hazard):
+    """Queue a capture unless it coalesces with a waiting or recent one. Returns True if it was queued"""
+    stats["triggers"] += 1
+    now = time.ticks_ms()
+
+    if pending_captures:
+        # The waiting capture takes a fresh frame anyway; a fire hazard trigger upgrades it
+        if is_fire_hazard:
+            pending_captures[-1] = True
+        stats["coalesced"] += 1
         return False
 
-def process_request(request):
-    """Process incoming HTTP request"""
-    global fire_hazard_triggered
-    
-    if "GET /capture" in request:
-        print("Capture request received")
-        
-        # Check if this was triggered by fire hazard detection
-        is_fire_hazard = "firehazard=true" in request
+    last = last_trigger_ms[is_fire_hazard]
+    if last is not None and time.ticks_diff(now, last) < COALESCE_WINDOW * 1000:
+        stats["coalesced"] += 1
+        return False
+
+    pending_captures.append(is_fire_hazard)
+    last_trigger_ms[is_fire_hazard] = now
+    capture_ready.set()
+    return True
+
+def http_response(status, body):
+    return f"HTTP/1.1 {status}\r\nContent-Type: text/html\r\nConnection: close\r\n\r\n<html><body>{body}</body></html>"
+
+def process_request(request_line):
+    """Answer a request line at once; captures are only queued here"""
+    parts = request_line.split()
+    path = parts[1] if len(parts) > 1 else "/"
+    route, _, query = path.partition("?")
+
+    if route in ("/capture", "/firehazard"):
+        is_fire_hazard = route == "/firehazard" or "firehazard=true" in query
         if is_fire_hazard:
             print("FIRE HAZARD ALERT! Capture triggered by sensor")
-            
-        # Capture image
-        image_path, image_buf = capture_image(is_fire_hazard)
-        
-        if image_path:
-            print(f"Successfully captured image: {image_path}")
-            
-            # Send image to server with fire hazard flag if applicable
-            success = send_image(image_path, image_buf, is_fire_hazard)
-            
-            if success:
-                return "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<html><body><h1>Image captured and sent successfully!</h1></body></html>"
-            else:
-                return "HTTP/1.1 500 Internal Server Error\r\nContent-Type: text/html\r\n\r\n<html><body><h1>Failed to send image</h1></body></html>"
         else:
-            return "HTTP/1.1 500 Internal Server Error\r\nContent-Type: text/html\r\n\r\n<html><body><h1>Failed to capture image</h1></body></html>"
-    elif "GET /firehazard" in request:
-        print("FIRE HAZARD ALERT! Capture triggered by sensor")
-        
-        # Set flag to indicate fire hazard triggered this capture
-        image_path, image_buf = capture_image(True)
-        
-        if image_path:
-            print(f"Successfully captured image: {image_path}")
-            
-            # Send image to server with fire hazard flag
-            success = send_image(image_path, image_buf, True)
-            
-            if success:
-                return "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<html><body><h1>Fire hazard image captured and sent successfully!</h1></body></html>"
-            else:
-                return "HTTP/1.1 500 Internal Server Error\r\nContent-Type: text/html\r\n\r\n<html><body><h1>Failed to send fire hazard image</h1></body></html>"
-        else:
-            return "HTTP/1.1 500 Internal Server Error\r\nContent-Type: text/html\r\n\r\n<html><body><h1>Failed to capture fire hazard image</h1></body></html>"
-    elif "GET /status" in request:
-        return "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<html><body><h1>Camera is online</h1><p>Device ID: " + DEVICE_ID + "</p></body></html>"
+            print("Capture request received")
+
+        if queue_capture(is_fire_hazard):
+            return http_response("200 OK", "<h1>Capture queued</h1>")
+        return http_response("200 OK", "<h1>Capture already pending</h1>")
+    elif route == "/status":
+        return http_response(
+            "200 OK",
+            "<h1>Camera is online</h1><p>Device ID: " + DEVICE_ID + "</p>"
+            + f"<p>Pending captures: {len(pending_captures)}</p><p>Queued for retry: {len(retry_files())}</p>"
+            + f"<p>Stats: {json.dumps(stats)}</p>"
+        )
     else:
         # Default homepage
-        return "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<html><body><h1>ESP32-S3 Camera</h1><p>Device ID: " + DEVICE_ID + "</p><p><a href='/capture'>Take Picture</a></p><p><a href='/status'>Check Status</a></p></body></html>"
+        return http_response("200 OK", "<h1>ESP32-S3 Camera</h1><p>Device ID: " + DEVICE_ID + "</p><p><a href='/capture'>Take Picture</a></p><p><a href='/status'>Check Status</a></p>")
+
+async def read_request_line(reader):
+    """Read the request line and skip the headers"""
+    request_line = (await reader.readline()).decode()
+    while True:
+        line = await reader.readline()
+        if not line or line == b"\r\n":
+            return request_line
 
-def start_server(ip):
-    """Start a web server to listen for capture requests"""
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind(('', SERVER_PORT))
-    s.listen(5)
+async def handle_client(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(read_request_line(reader), REQUEST_TIMEOUT)
+        print(f"Request: {request_line.strip()}")
+        writer.write(process_request(request_line).encode())
+        await writer.drain()
+    except Exception as e:
+        print(f"Server error: {str(e)}")
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+async def start_server(ip):
+    """Serve capture and status requests while the capture worker uploads in the background"""
+    global capture_ready
+    capture_ready = asyncio.Event()
+    asyncio.create_task(capture_worker())
+    asyncio.create_task(retry_worker())
+
+    await asyncio.start_server(handle_client, "0.0.0.0", SERVER_PORT, backlog=5)
     print(f"Server listening on http://{ip}:{SERVER_PORT}")
     print(f"To take a picture, visit http://{ip}:{SERVER_PORT}/capture")
     print(f"For fire hazard capture, visit http://{ip}:{SERVER_PORT}/firehazard")
     print(f"To check status, visit http://{ip}:{SERVER_PORT}/status")
     print(f"For homepage, visit http://{ip}:{SERVER_PORT}/")
-    
+
     while True:
-        try:
-            conn, addr = s.accept()
-            print(f"Connection from {addr}")
-            
-            request = conn.recv(1024).decode()
-            print(f"Request: {request}")
-            
-            response = process_request(request)
-            conn.send(response.encode())
-            
-            conn.close()
-        except Exception as e:
-            print(f"Server error: {str(e)}")
-            continue
+        await asyncio.sleep(3600)
 
 def main():
     print(f"XIAO ESP32-S3 Camera - Device ID: {DEVICE_ID}")
@@ -246,7 +526,7 @@ def main():
     
     # Start server to listen for requests
     try:
-        start_server(ip)
+        asyncio.run(start_server(ip))
     except KeyboardInterrupt:
         print("Program stopped by user")
     finally:
@@ -5,8 +5,11 @@ from hardware import I2C
 from hardware import Pin
 from unit import ENVUnit
 import time
+import socket
+import struct
 import urequests
 import network
+import ntptime
 
 # Initialize Sensor:
 i2c0 = None
@@ -25,7 +28,36 @@ SSID = "Karan"
 PASSWORD = "qwer1234"
 
 # API URL (corrected to be the same as camera)
-API_URL = "http://192.168.151.112:5000/api/sensor"
+BATCH_API_URL = "http://192.168.151.112:5000/api/sensor/batch"
+
+# Readings are buffered on the device and uploaded in batches
+SAMPLE_INTERVAL = 5  # seconds between readings
+UPLOAD_INTERVAL = 60  # seconds between uploads, sooner when the buffer fills or a hazard is seen
+UPLOAD_BATCH_SIZE = 60  # readings per request
+BUFFER_SIZE = 240  # readings kept in RAM
+BACKLOG_PATH = "/flash/sensor_backlog.bin"  # readings spilled to flash while offline
+BACKLOG_MAX_BYTES = 256 * 1024
+UPLOAD_TIMEOUT = 10  # seconds
+
+# One reading: epoch seconds (0 before the clock has synced), temperature, humidity, pressure
+RECORD_FORMAT = "<Ifff"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+# "http" posts JSON batches; "tcp" and "udp" send packed records to `flask telemetry serve`
+UPLOAD_PROTOCOL = "http"
+TELEMETRY_HOST = "192.168.151.112"
+TELEMETRY_PORT = 5001
+DEVICE_INDEX = 1  # the server stores telemetry as sensor_device_<DEVICE_INDEX>
+TELEMETRY_RECORD_SIZE = 2 + RECORD_SIZE  # device index, then the buffered record
+UDP_RECORDS_PER_DATAGRAM = 64
+
+# time.time() counts from 2000-01-01 on some ports, the server expects Unix time
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+# NTP is retried with exponential backoff until it succeeds. Until then readings
+# carry no timestamp and the server stamps them when they arrive
+CLOCK_SYNC_RETRY = 10  # seconds before the first retry
+CLOCK_SYNC_MAX_RETRY = 600  # seconds, cap for the backoff
 
 # Camera device URL - updated for correct IP address
 # For direct camera triggering, we need the camera device's IP (not the API server)
@@ -42,6 +74,18 @@ temp_history = []
 last_camera_trigger_time = 0
 CAMERA_COOLDOWN = 60  # seconds between camera triggers
 
+# Ring buffer of packed readings, preallocated so buffering never allocates
+ring = bytearray(BUFFER_SIZE * RECORD_SIZE)
+ring_start = 0
+ring_count = 0
+dropped_readings = 0
+last_upload_time = 0
+last_upload_failed = False
+telemetry_sock = None
+clock_synced = False
+clock_sync_retry = CLOCK_SYNC_RETRY
+next_clock_sync = 0  # time.ticks_ms() of the next NTP attempt
+
 def connect_wifi():
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
@@ -52,12 +96,40 @@ def connect_wifi():
             time.sleep(1)
     print("Connected to WiFi! IP:", wlan.ifconfig()[0])
 
+def wifi_connected():
+    """Check the link without blocking, starting a reconnect when it is down"""
+    wlan = network.WLAN(network.STA_IF)
+    if wlan.isconnected():
+        return True
+    try:
+        wlan.connect(SSID, PASSWORD)
+    except OSError:
+        pass  # Already connecting
+    return False
+
+def sync_clock():
+    """Set the RTC from NTP so readings carry real sample times, backing off after failures"""
+    global clock_synced, clock_sync_retry, next_clock_sync
+    try:
+        ntptime.settime()
+        clock_synced = True
+        print("Clock synced:", time.gmtime())
+    except Exception as e:
+        print(f"Failed to sync clock, retrying in {clock_sync_retry}s:", str(e))
+        next_clock_sync = time.ticks_add(time.ticks_ms(), clock_sync_retry * 1000)
+        clock_sync_retry = min(clock_sync_retry * 2, CLOCK_SYNC_MAX_RETRY)
+    return clock_synced
+
+def clock_sync_due():
+    return not clock_synced and time.ticks_diff(time.ticks_ms(), next_clock_sync) >= 0
+
 def setup():
     global i2c0, env3_0
     M5.begin()
     Widgets.fillScreen(0x222222)
 
     connect_wifi()
+    sync_clock()
 
     i2c0 = I2C(0, scl=Pin(33), sda=Pin(32), freq=100000)
     env3_0 = ENVUnit(i2c=i2c0, type=3)
@@ -78,20 +150,168 @@ def get_camera_ip():
     except Exception as e:
         print("Failed to get camera IP:", str(e))
 
-def send_data(temperature, humidity, pressure):
-    data = {
-        "device_id": DEVICE_ID,  # Include device ID
-        "temperature": temperature,
-        "humidity": humidity,
-        "pressure": pressure
-    }
+def buffer_reading(temperature, humidity, pressure):
+    """Add a reading with its sample time to the ring buffer, spilling the oldest to flash when full"""
+    global ring_count
+    if ring_count == BUFFER_SIZE:
+        spill_oldest()
+    index = (ring_start + ring_count) % BUFFER_SIZE
+    # Before NTP has synced the RTC still counts from 2000, so the time is left out
+    timestamp = int(time.time()) + EPOCH_OFFSET if clock_synced else 0
+    struct.pack_into(RECORD_FORMAT, ring, index * RECORD_SIZE, timestamp, temperature, humidity, pressure)
+    ring_count += 1
 
+def spill_oldest():
+    """Move the oldest buffered reading to the flash backlog, or drop it if the backlog is full"""
+    global ring_start, ring_count, dropped_readings
+    offset = ring_start * RECORD_SIZE
     try:
-        response = urequests.post(API_URL, json=data, headers={"Content-Type": "application/json"})
-        print("Server Response:", response.text)
+        if backlog_size() + RECORD_SIZE <= BACKLOG_MAX_BYTES:
+            with open(BACKLOG_PATH, "ab") as f:
+                f.write(ring[offset:offset + RECORD_SIZE])
+        else:
+            dropped_readings += 1
+    except OSError as e:
+        dropped_readings += 1
+        print("Failed to spill reading to flash:", str(e))
+    ring_start = (ring_start + 1) % BUFFER_SIZE
+    ring_count -= 1
+
+def backlog_size():
+    try:
+        return os.stat(BACKLOG_PATH)[6]
+    except OSError:
+        return 0
+
+def telemetry_records(records):
+    """Prefix each buffered record with the device index, giving the server's <HIfff layout"""
+    count = len(records) // RECORD_SIZE
+    out = bytearray(count * TELEMETRY_RECORD_SIZE)
+    for i in range(count):
+        j = i * TELEMETRY_RECORD_SIZE
+        struct.pack_into("<H", out, j, DEVICE_INDEX)
+        out[j + 2:j + TELEMETRY_RECORD_SIZE] = records[i * RECORD_SIZE:(i + 1) * RECORD_SIZE]
+    return out
+
+def send_telemetry(records):
+    """Send packed readings over the long-lived telemetry connection. Returns False if they should be retried later"""
+    global telemetry_sock
+    data = telemetry_records(records)
+    try:
+        if UPLOAD_PROTOCOL == "udp":
+            if telemetry_sock is None:
+                telemetry_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            address = socket.getaddrinfo(TELEMETRY_HOST, TELEMETRY_PORT)[0][-1]
+            step = UDP_RECORDS_PER_DATAGRAM * TELEMETRY_RECORD_SIZE
+            for i in range(0, len(data), step):
+                telemetry_sock.sendto(data[i:i + step], address)
+        else:
+            if telemetry_sock is None:
+                telemetry_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                telemetry_sock.settimeout(UPLOAD_TIMEOUT)
+                telemetry_sock.connect(socket.getaddrinfo(TELEMETRY_HOST, TELEMETRY_PORT)[0][-1])
+            telemetry_sock.sendall(data)
+    except Exception as e:
+        print("Failed to send telemetry:", str(e))
+        if telemetry_sock is not None:
+            telemetry_sock.close()
+            telemetry_sock = None
+        return False
+    return True
+
+def post_readings(records):
+    """Upload packed readings in one batch request. Returns False if they should be retried later"""
+    if UPLOAD_PROTOCOL != "http":
+        return send_telemetry(records)
+
+    readings = []
+    for i in range(0, len(records), RECORD_SIZE):
+        timestamp, temperature, humidity, pressure = struct.unpack_from(RECORD_FORMAT, records, i)
+        reading = {
+            "temperature": temperature,
+            "humidity": humidity,
+            "pressure": pressure
+        }
+        if timestamp:
+            reading["timestamp"] = timestamp
+        readings.append(reading)
+
+    try:
+        response = urequests.post(
+            BATCH_API_URL,
+            json={"device_id": DEVICE_ID, "readings": readings},
+            headers={"Content-Type": "application/json"},
+            timeout=UPLOAD_TIMEOUT
+        )
+        status = response.status_code
         response.close()
     except Exception as e:
         print("Failed to send data:", str(e))
+        return False
+
+    print(f"Uploaded {len(readings)} readings, status {status}")
+    # 4xx means the server will never accept these readings, so they are not retried
+    return status < 500
+
+def upload_backlog():
+    """Replay readings spilled to flash, oldest first. Returns False if the upload stopped early"""
+    size = backlog_size()
+    offset = 0
+    chunk_bytes = UPLOAD_BATCH_SIZE * RECORD_SIZE
+    with open(BACKLOG_PATH, "rb") as f:
+        while offset < size:
+            records = f.read(chunk_bytes)
+            if not post_readings(records):
+                break
+            offset += len(records)
+
+        if offset < size:
+            # Keep only what was not uploaded, copied in chunks to spare RAM
+            with open(BACKLOG_PATH + ".tmp", "wb") as out:
+                f.seek(offset)
+                while True:
+                    records = f.read(chunk_bytes)
+                    if not records:
+                        break
+                    out.write(records)
+
+    if offset < size:
+        os.rename(BACKLOG_PATH + ".tmp", BACKLOG_PATH)
+        return False
+    os.remove(BACKLOG_PATH)
+    return True
+
+def upload_buffer():
+    """Upload the flash backlog and then the ring buffer, keeping whatever fails for the next attempt"""
+    global ring_start, ring_count, last_upload_time, last_upload_failed
+    last_upload_time = time.time()
+    last_upload_failed = True
+    if not wifi_connected():
+        print("WiFi down, keeping", ring_count, "readings buffered")
+        return
+
+    if backlog_size() and not upload_backlog():
+        return
+
+    while ring_count:
+        count = min(ring_count, UPLOAD_BATCH_SIZE, BUFFER_SIZE - ring_start)
+        offset = ring_start * RECORD_SIZE
+        if not post_readings(ring[offset:offset + count * RECORD_SIZE]):
+            return
+        ring_start = (ring_start + count) % BUFFER_SIZE
+        ring_count -= count
+    last_upload_failed = False
+
+    if dropped_readings:
+        print("Readings dropped while offline:", dropped_readings)
+
+def upload_due(hazard_detected):
+    # After a failed upload a full buffer spills to flash until the next interval instead of retrying every sample
+    return (
+        hazard_detected
+        or (ring_count >= BUFFER_SIZE and not last_upload_failed)
+        or time.time() - last_upload_time >= UPLOAD_INTERVAL
+    )
 
 def trigger_camera_via_server():
     """Trigger camera through the API server"""
@@ -197,11 +417,14 @@ def loop():
 
             M5.update()
 
-            # Send data to Flask backend
-            send_data(temp, humidity, pressure)
+            # Buffer the reading and upload a batch when one is due
+            if clock_sync_due() and wifi_connected():
+                sync_clock()
+            buffer_reading(temp, humidity, pressure)
+            if upload_due(hazard_detected):
+                upload_buffer()
 
-            # Wait for 5 seconds before next reading
-            time.sleep(5)
+            time.sleep(SAMPLE_INTERVAL)
 
         except Exception as e:
             print("Error:", str(e))